@@ -1,157 +1,196 @@
 """
-In this code we include a lightweight adaption algorithm for dominating relationships computing. The code is adapted from  Networkx
-Please see the original one at https://networkx.org/documentation/stable/_modules/networkx/algorithms/dominance.html#dominance_frontiers
-TODO: implement a datastructure such as G from networkx for control flow graph. so that networkx is not required in this library.
+In this code we include a lightweight algorithm for dominating relationships computing which works directly on the
+control flow graphs of this library (cfg.model.Block/Link), so that networkx is not required in this library.
+Immediate dominators are computed with the semi-NCA algorithm, the dominator tree and the dominance frontiers are
+derived from them in the same pass.
 """
 
-from functools import reduce
-
-import networkx as nx
-
 __docformat__ = "numpy"
 
 
-def immediate_dominators(G, start):
-    """Returns the immediate dominators of all nodes of a directed graph.
+class Dominance:
+    """Dominance information of all nodes reachable from a start node.
 
-    Parameters
+    Attributes
     ----------
-    G : a DiGraph or MultiDiGraph
-        The graph where dominance is to be computed.
-
     start : node
         The start node of dominance computation.
 
-    Returns
-    -------
     idom : dict keyed by nodes
-        A dict containing the immediate dominators of each node reachable from
-        `start`.
-
-    Raises
-    ------
-    NetworkXNotImplemented
-        If `G` is undirected.
-
-    NetworkXError
-        If `start` is not in `G`.
+        The immediate dominator of each reachable node, the start node is mapped to itself. The keys are ordered
+        in reverse postorder of the depth first search.
 
-    Notes
-    -----
-    Except for `start`, the immediate dominators are the parents of their
-    corresponding nodes in the dominator tree.
+    tree : dict keyed by nodes
+        The children of each node in the dominator tree in reverse order of the depth first search.
 
-    Examples
-    --------
-    >>> G = nx.DiGraph([(1, 2), (1, 3), (2, 5), (3, 4), (4, 5)])
-    >>> sorted(nx.immediate_dominators(G, 1).items())
-    [(1, 1), (2, 1), (3, 1), (4, 3), (5, 1)]
-
-    References
-    ----------
-    .. [1] K. D. Cooper, T. J. Harvey, and K. Kennedy.
-           A simple, fast dominance algorithm.
-           Software Practice & Experience, 4:110, 2001.
+    frontiers : dict keyed by nodes
+        The dominance frontier of each node as a set. As the start node is entered from outside of the graph, it
+        is part of the dominance frontiers of the nodes of a loop back to it.
     """
-    if start not in G:
-        raise nx.NetworkXError("start is not in G")
-
-    idom = {start: start}
-
-    order = list(nx.dfs_postorder_nodes(G, start))
-    dfn = {u: i for i, u in enumerate(order)}
-    order.pop()
-    order.reverse()
-
-    def intersect(u, v):
-        while u != v:
-            while dfn[u] < dfn[v]:
-                u = idom[u]
-            while dfn[u] > dfn[v]:
-                v = idom[v]
-        return u
-
-    changed = True
-    while changed:
-        changed = False
-        for u in order:
-            new_idom = reduce(intersect, (v for v in G.pred[u] if v in idom))
-            if u not in idom or idom[u] != new_idom:
-                idom[u] = new_idom
-                changed = True
 
-    return idom
+    def __init__(self, start, idom, tree, frontiers):
+        self.start = start
+        self.idom = idom
+        self.tree = tree
+        self.frontiers = frontiers
 
 
-def dominance_frontiers(G, start):
-    """Returns the dominance frontiers of all nodes of a directed graph.
+def compute_dominance(successors, start):
+    """Returns the dominance information of all nodes of a directed graph reachable from start.
 
     Parameters
     ----------
-    G : a DiGraph or MultiDiGraph
-        The graph where dominance is to be computed.
+    successors : dict keyed by nodes
+        The successors of each node. The order of the successors determines the order of the depth first search.
 
     start : node
         The start node of dominance computation.
 
     Returns
     -------
-    df : dict keyed by nodes
-        A dict containing the dominance frontiers of each node reachable from
-        `start` as lists.
-
-    Raises
-    ------
-    NetworkXNotImplemented
-        If `G` is undirected.
-
-    NetworkXError
-        If `start` is not in `G`.
+    dominance : Dominance
+        The immediate dominators, the dominator tree and the dominance frontiers.
 
     Examples
     --------
-    >>> G = nx.DiGraph([(1, 2), (1, 3), (2, 5), (3, 4), (4, 5)])
-    >>> sorted((u, sorted(df)) for u, df in nx.dominance_frontiers(G, 1).items())
+    >>> d = compute_dominance({1: [2, 3], 2: [5], 3: [4], 4: [5]}, 1)
+    >>> sorted(d.idom.items())
+    [(1, 1), (2, 1), (3, 1), (4, 3), (5, 1)]
+    >>> sorted((u, sorted(df)) for u, df in d.frontiers.items())
     [(1, []), (2, [5]), (3, [5]), (4, [5]), (5, [])]
 
     References
     ----------
-    .. [1] K. D. Cooper, T. J. Harvey, and K. Kennedy.
+    .. [1] L. Georgiadis, R. E. Tarjan, and R. F. Werneck.
+           Finding dominators in practice.
+           Journal of Graph Algorithms and Applications, 10(1):69-94, 2006.
+    .. [2] K. D. Cooper, T. J. Harvey, and K. Kennedy.
            A simple, fast dominance algorithm.
            Software Practice & Experience, 4:110, 2001.
     """
+    # Iterative depth first search numbering the nodes in preorder and collecting the postorder
+    number = {start: 0}
+    nodes = [start]
+    parent = [0]
+    postorder = []
+    stack = [(0, iter(successors.get(start, ())))]
+    while stack:
+        u, children = stack[-1]
+        for v in children:
+            if v not in number:
+                number[v] = len(nodes)
+                nodes.append(v)
+                parent.append(u)
+                stack.append((number[v], iter(successors.get(v, ()))))
+                break
+        else:
+            stack.pop()
+            postorder.append(u)
+
+    n = len(nodes)
+    # Every node is visited once, so a predecessor can only be repeated by a successor listed twice (e.g. both
+    # branches of an if to the same block), which dict.fromkeys removes keeping the order
+    preds = [[] for _ in range(n)]
+    for u in range(n):
+        for v in dict.fromkeys(successors.get(nodes[u], ())):
+            preds[number[v]].append(u)
+
+    # Semidominators with path compression over the forest of already processed nodes
+    semi = list(range(n))
+    label = list(range(n))
+    ancestor = [-1] * n
+
+    def evaluate(v):
+        if ancestor[v] < 0:
+            return v
+        path = []
+        while ancestor[ancestor[v]] >= 0:
+            path.append(v)
+            v = ancestor[v]
+        while path:
+            v = path.pop()
+            a = ancestor[v]
+            if semi[label[a]] < semi[label[v]]:
+                label[v] = label[a]
+            ancestor[v] = ancestor[a]
+        return label[v]
+
+    for w in range(n - 1, 0, -1):
+        for v in preds[w]:
+            u = evaluate(v)
+            if semi[u] < semi[w]:
+                semi[w] = semi[u]
+        ancestor[w] = parent[w]
+
+    # The immediate dominator is the nearest common ancestor of the parent and the semidominator
+    idom = parent[:]
+    for w in range(1, n):
+        d = idom[w]
+        while d > semi[w]:
+            d = idom[d]
+        idom[w] = d
+
+    order = postorder[::-1]
+    idom_nodes = {nodes[u]: nodes[idom[u]] for u in order}
+
+    tree = {nodes[u]: [] for u in order}
+    for u in reversed(order[1:]):
+        tree[nodes[idom[u]]].append(nodes[u])
+
+    # Every node dominating a predecessor of u but not u itself has u in its frontier
+    frontiers = {nodes[u]: set() for u in order}
+    for u in order:
+        stop = idom[u] if u != 0 else -1
+        for v in preds[u]:
+            while v != stop:
+                frontiers[nodes[v]].add(nodes[u])
+                if v == 0:
+                    break
+                v = idom[v]
 
-    idom = immediate_dominators(G, start)
+    return Dominance(start, idom_nodes, tree, frontiers)
 
-    df = {u: set() for u in idom}
-    for u in idom:
-        if len(G.pred[u]) >= 2:
-            for v in G.pred[u]:
-                if v in idom:
-                    while v != idom[u]:
-                        df[v].add(u)
-                        v = idom[v]
-    return df
 
+def block_successors(blocks):
+    """Returns the successors of the given cfg blocks by their ids in the order the links are found.
 
-def dominator_tree(G, start):
+    Parameters
+    ----------
+    blocks : list of cfg.model.Block
+        The blocks of a control flow graph.
 
-    idom = immediate_dominators(G, start)
+    Returns
+    -------
+    successors : dict keyed by block ids
+        The ids of the successor blocks of each block, each id is only contained once.
+    """
+    successors = {block.id: {} for block in blocks}
+    for block in blocks:
+        for link in block.predecessors + block.exits:
+            successors.setdefault(link.source.id, {})[link.target.id] = None
+            successors.setdefault(link.target.id, {})
+    return {u: list(vs) for u, vs in successors.items()}
+
+
+def block_dominance(blocks):
+    """Returns the dominance information of the blocks of a control flow graph by their ids.
 
-    d_tree = [u for u in idom]
-    #for u in idom:
-    #    if len(G.pred[u]) >= 2:
-    #        for v in G.pred[u]:
-    #            if v in idom:
-    #                while v != idom[u]:
-    #                    df[v].add(u)
-    #                    v = idom[v]
-    #return df
+    Parameters
+    ----------
+    blocks : list of cfg.model.Block
+        The blocks of a control flow graph, the first one is its entry block.
+
+    Returns
+    -------
+    dominance : Dominance
+        The immediate dominators, the dominator tree and the dominance frontiers of the block ids.
+    """
+    return compute_dominance(block_successors(blocks), blocks[0].id)
 
 
 def main():
-    G = nx.DiGraph([(1, 2), (1, 3), (2, 5), (3, 4), (4, 5)])
-    res = sorted((u, sorted(df)) for u, df in dominance_frontiers(G, 1).items())
+    d = compute_dominance({1: [2, 3], 2: [5], 3: [4], 4: [5]}, 1)
+    res = sorted((u, sorted(df)) for u, df in d.frontiers.items())
 
     assert res == [(1, []), (2, [5]), (3, [5]), (4, [5]), (5, [])]
 
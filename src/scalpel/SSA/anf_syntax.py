@@ -3,15 +3,22 @@ from __future__ import annotations
 import ast
 
 from scalpel.SSA.ssa_syntax import *
+from scalpel.SSA.context import TransformContext, get_buffer_variable, CODE_FONT
 
 import re
+import copy
+import itertools
+from operator import itemgetter
 
-from scalpel.functions import trim_double_spaces
+from scalpel.functions import trim_double_spaces, trim_double_spaces_lines, split_chunks_into_lines
 from scalpel.config import PROV_INFO_EXT_CHAR, PROV_INFO_SPLIT_CHAR, PROV_INFO_MARKER, ANF_BUFFER_VAR_NAME
 
-font = {'lambda_sign': 'λ'}
-debug_mode = False
-no_pos_tracking = False
+# Sign of the output syntax in the printed parts of a node, it is replaced with the sign of the font while printing
+class FontSign(str):
+    pass
+
+
+LAMBDA_SIGN = FontSign('lambda_sign')
 
 # Prefix of block labels from SSA
 block_identifier = 'L'
@@ -78,31 +85,15 @@ function_mapping = {
     '_Starred2': '**%s'
 }
 
-# Global reference of the SSA AST to be transformed
-ssa_ast_global: SSA_AST = None
-
-# Buffer variables mapped to ANF nodes to replace more complex code due to only values being allowed to be used in function calls
-buffer_assignments = {}
-buffer_variable_counter = 0
-
 # Keywords to be ignored when parsing ANF code due to special handling
 keywords = ['let', 'letrec', 'lambda', 'λ', 'unit', 'if', 'then', 'else', 'in']
 
 block_label_regex = r'^L([0-9]|_)*$'
-block_phi_assignment_vars = {}
-buffer_assignments_anf_ssa = {}
-
-
-def reset():
-    global ssa_ast_global, block_identifier, buffer_variable_counter, keywords, block_label_regex, buffer_assignments_anf_ssa, buffer_assignments, block_phi_assignment_vars
-    ssa_ast_global = None
-    buffer_assignments = {}
-    buffer_variable_counter = 0
-    block_phi_assignment_vars = {}
-    buffer_assignments_anf_ssa = {}
 
 
 class ANFNode:
+    __slots__ = ('prov_info', 'pos_info')
+
     def __init__(self, ssa_node: SSANode = None):
         self.init(ssa_node)
 
@@ -113,38 +104,34 @@ class ANFNode:
             if ssa_node.pos_info is not None:
                 self.pos_info = ssa_node.pos_info
             else:
-                positions = find_child_positions(ssa_node)
-                if len(positions) > 0:
-                    pos = Position(None)
-                    for p in positions:
-                        pos.lineno = min(pos.lineno, p.lineno)
-                        pos.end_lineno = max(pos.end_lineno, p.end_lineno)
-                        pos.col_offset = min(pos.col_offset, p.col_offset)
-                        pos.end_col_offset = max(pos.end_col_offset, p.end_col_offset)
-                    self.pos_info = pos
-
-    def print(self, lvl=0):
-        return 'not implemented'
-
-    def enable_print_ascii(self):
-        global font
-        font = {'lambda_sign': 'lambda'}
-
-    def enable_print_code(self):
-        global font
-        font = {'lambda_sign': 'λ'}
-
-    def get_prov_info(self, prov_info):
-        return ''
+                span = find_child_span(ssa_node)
+                if span is not None:
+                    self.pos_info = Position.shared(span)
+
+    # Printed ANF code of the node, the font holds the signs of the output syntax (see TransformContext.font)
+    def print(self, lvl=0, prov_info: str = '', font: dict = CODE_FONT):
+        return ''.join(iter_anf_chunks(self, lvl, font))
+
+    # Parts of the printed code, either text or a tuple of a child node and its nesting level
+    def print_parts(self, lvl=0):
+        return ['not implemented']
+
+    # Provenance info of the node, each line belongs to the same line of the printed code
+    def get_prov_info(self, ctx: TransformContext):
+        return ''.join(iter_prov_chunks(self, ctx))
+
+    # Parts of the provenance info, either text or a child node
+    def prov_parts(self, ctx: TransformContext):
+        return []
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         return None
 
-    def print_prov_ext(self):
+    def print_prov_ext(self, ctx: TransformContext):
         prov = ''
-        if no_pos_tracking:
+        if ctx.no_pos:
             pass
-        elif not no_pos_tracking and self.pos_info is not None:
+        elif self.pos_info is not None:
             prov += PROV_INFO_EXT_CHAR + str(self.pos_info)
         else:
             prov += PROV_INFO_EXT_CHAR
@@ -154,34 +141,34 @@ class ANFNode:
 
 
 class ANF_EV(ANFNode):
+    __slots__ = ()
+
     def __init__(self, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
 
-    def print(self, lvl=0):
-        return ''
-
-    def get_prov_info(self, prov_info):
-        return ''
+    def print_parts(self, lvl=0):
+        return []
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         return None
 
 
 class ANF_E(ANF_EV):
+    __slots__ = ()
+
     def __init__(self, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
 
-    def print(self, lvl=0):
-        return ''
-
-    def get_prov_info(self, prov_info):
-        return ''
+    def print_parts(self, lvl=0):
+        return []
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         return None
 
 
 class ANF_E_APP(ANF_E):
+    __slots__ = ('params', 'name', 'params_named')
+
     def __init__(self, params: [ANF_V], name: ANF_V, ssa_node: SSANode = None, params_named: [str] = None):
         super().__init__(ssa_node=ssa_node)
         self.params: [ANF_V] = params
@@ -191,70 +178,67 @@ class ANF_E_APP(ANF_E):
             if hasattr(ssa_node, 'params_named'):
                 self.params_named: [str] = ssa_node.params_named
 
-    def print(self, lvl=0, prov_info: str = ''):
-        return get_indentation(lvl) + f"{self.name.print(lvl)} {' '.join([var.print(lvl) for var in self.params])}"
+    def print_parts(self, lvl=0):
+        parts = [get_indentation(lvl), (self.name, lvl), ' ']
+        for i, var in enumerate(self.params):
+            if i > 0:
+                parts.append(' ')
+            parts.append((var, lvl))
+        return parts
 
-    def get_prov_info(self, prov_info):
+    def prov_parts(self, ctx: TransformContext):
         name_info = ''
         if self.params_named is not None:
             name_info = PROV_INFO_EXT_CHAR + 'names=' + ','.join(self.params_named)
-        prov = 'f' + self.name.get_prov_info(None) + name_info + self.print_prov_ext() + (
+        prov = 'f' + self.name.get_prov_info(ctx) + name_info + self.print_prov_ext(ctx) + (
             PROV_INFO_SPLIT_CHAR if len(self.params) > 0 else '') + PROV_INFO_SPLIT_CHAR.join(
-            [var.get_prov_info(None) for var in self.params])
-        return prov.replace('ff', 'f')
+            [var.get_prov_info(ctx) for var in self.params])
+        return [prov.replace('ff', 'f')]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
-        out = None
         if isinstance(self.name, ANF_V_CONST):
             if self.name.is_block_id:
                 if self.name.value in assignments and self.name.value not in parsed_blocks:
-                    parsed_blocks.append(self.name.value)
+                    parsed_blocks.add(self.name.value)
                     out = assignments[self.name.value].parse_anf_to_python(assignments, parsed_blocks, loop_block_names,
                                                                            lvl)
                     return postprocessing_ANF_V_to_python(self, out)
-        elif isinstance(self.name, ANF_V_VAR):
+        # Every parameter is parsed once, the mappings below only format the parsed parameters
+        params = [p.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, 0) for p in self.params]
+        out = None
+        if isinstance(self.name, ANF_V_VAR):
             if self.name.name in function_mapping:
-                out = (function_mapping[self.name.name] % tuple(
-                    [p.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, 0) for p in self.params]))
+                out = function_mapping[self.name.name] % tuple(params)
             for (pattern, value) in function_mapping_ext.items():
                 if pattern.match(self.name.name):
-                    if callable(value):
-                        out = value([p.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, 0) for p in
-                                     self.params])
-                    else:
-                        out = (value % ', '.join(
-                            [p.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, 0) for p in
-                             self.params]))
+                    out = value(params) if callable(value) else value % ', '.join(params)
         if out is None:
             # Default output if nothing applies
-            out = self.name.parse_anf_to_python(assignments, parsed_blocks, loop_block_names) + '(' + ','.join([(
-                                                                                                                    self.params_named[
-                                                                                                                        idx - (
-                                                                                                                                    len(self.params) - len(
-                                                                                                                                self.params_named))] + '=' if self.params_named is not None and len(
-                                                                                                                        self.params) - idx <= len(
-                                                                                                                        self.params_named) else '') + p.parse_anf_to_python(
-                assignments, parsed_blocks, loop_block_names, 0) for idx, p in enumerate(self.params)]) + ')'
+            if self.params_named is not None:
+                # The named parameters are the last ones
+                offset = len(params) - len(self.params_named)
+                params = [(self.params_named[idx - offset] + '=' if idx >= offset else '') + p for idx, p in
+                          enumerate(params)]
+            out = self.name.parse_anf_to_python(assignments, parsed_blocks, loop_block_names) + '(' + ','.join(
+                params) + ')'
         lines = postprocessing_ANF_V_to_python(self, out).split('\n')
         lines = [get_indentation(lvl) + s for s in lines]
         return '\n'.join(lines)
 
 
 class ANF_E_COMM(ANF_E):
+    __slots__ = ('text', 'term')
+
     def __init__(self, text: str, term: ANF_E, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
         self.text: str = text
         self.term: ANF_E = term
 
-    def print(self, lvl=0, prov_info: str = ''):
-        # print('comm')
-        # print(self.text)
-        # print(get_indentation(lvl) + f"{self.text}\n{self.term.print(lvl)}")
-
-        return get_indentation(lvl) + f"{self.text}\n{self.term.print(lvl)}"
+    def print_parts(self, lvl=0):
+        return [get_indentation(lvl), self.text, '\n', (self.term, lvl)]
 
-    def get_prov_info(self, prov_info):
-        return self.print_prov_ext() + '\n' + self.term.get_prov_info(None)
+    def prov_parts(self, ctx: TransformContext):
+        return [self.print_prov_ext(ctx), '\n', self.term]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         out = self.term.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl)
@@ -263,67 +247,77 @@ class ANF_E_COMM(ANF_E):
         #    out = [out[0] + self.text] + out[1:]
         #    out = '\n'.join(out)
         # else:
-        out = get_indentation(lvl) + self.text + '\n' + out
-        out = out.replace(NEW_COMMENT_MARKER, ORIGINAL_COMMENT_MARKER, 1)
-        return post_processing_anf_to_python(out)
+        out = get_indentation(lvl) + self.text.replace(NEW_COMMENT_MARKER, ORIGINAL_COMMENT_MARKER, 1) + '\n' + out
+        # The markers are handled once for the whole module by post_processing_anf_to_python
+        return out if out.endswith('\n') else out + '\n'
 
 
 class ANF_E_LET(ANF_E):
+    __slots__ = ('var', 'term1', 'term2')
+
     def __init__(self, var: ANF_V, term1: ANF_E, term2: ANF_E, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
         self.var: ANF_V = var
         self.term1: ANF_E = term1
         self.term2: ANF_E = term2
 
-    def print(self, lvl=0, prov_info: str = ''):
+    def print_parts(self, lvl=0):
         next_lvl = lvl
         # next_lvl = lvl + 1
         # if isinstance(self.term2, ANF_E_LET) or isinstance(self.term2, ANF_E_IF) or isinstance(self.term2, ANF_E_COMM):
         #    next_lvl = lvl
-        return get_indentation(
-            lvl) + f"let {self.var.print(next_lvl)} = {self.term1.print(0)} in \n{self.term2.print(next_lvl)}"
+        return [get_indentation(lvl), 'let ', (self.var, next_lvl), ' = ', (self.term1, 0), ' in \n',
+                (self.term2, next_lvl)]
 
-    def get_prov_info(self, prov_info):
-        return self.print_prov_ext() + PROV_INFO_SPLIT_CHAR + self.var.get_prov_info(
-            None) + PROV_INFO_SPLIT_CHAR + self.print_prov_ext() + PROV_INFO_SPLIT_CHAR + self.term1.get_prov_info(
-            None) + PROV_INFO_SPLIT_CHAR + self.print_prov_ext() + '\n' + self.term2.get_prov_info(None)
+    def prov_parts(self, ctx: TransformContext):
+        ext = self.print_prov_ext(ctx)
+        return [ext, PROV_INFO_SPLIT_CHAR, self.var, PROV_INFO_SPLIT_CHAR, ext, PROV_INFO_SPLIT_CHAR, self.term1,
+                PROV_INFO_SPLIT_CHAR, ext, '\n', self.term2]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
-        name = self.var.name
-        if name == '_':
-            lines = self.term1.parse_anf_to_python(assignments, parsed_blocks, loop_block_names).split('\n')
-            lines = [get_indentation(lvl) + s for s in lines]
-            return '\n'.join(lines) + '\n' + self.term2.parse_anf_to_python(assignments, parsed_blocks,
-                                                                            loop_block_names, lvl)
-        elif self.var.is_buffer_var:
-            assignments[name] = self.term1
-            return self.term2.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl)
-        newline = '' if isinstance(self.term2, ANF_V_UNIT) else '\n'
-        out = get_indentation(lvl) + self.var.parse_anf_to_python(assignments, parsed_blocks,
-                                                                  loop_block_names) + ' = ' + self.term1.parse_anf_to_python(
-            assignments, parsed_blocks, loop_block_names) + newline + self.term2.parse_anf_to_python(assignments,
-                                                                                                     parsed_blocks,
-                                                                                                     loop_block_names,
-                                                                                                     lvl)
-        out = "\n".join([s for s in out.split("\n") if s])
-        out = post_processing_anf_to_python(out)
-        return out
+        # The lets of a block are parsed in one loop, the blank lines are removed from the assignments starting at
+        # the first one, the output of the last term is kept as it is
+        parts = []
+        first_assignment = None
+        term = self
+        while isinstance(term, ANF_E_LET):
+            name = term.var.name
+            if name == '_':
+                lines = term.term1.parse_anf_to_python(assignments, parsed_blocks, loop_block_names).split('\n')
+                parts.append('\n'.join(get_indentation(lvl) + s for s in lines) + '\n')
+            elif term.var.is_buffer_var:
+                assignments[name] = term.term1
+            else:
+                if first_assignment is None:
+                    first_assignment = len(parts)
+                newline = '' if isinstance(term.term2, ANF_V_UNIT) else '\n'
+                parts.append(get_indentation(lvl) + term.var.parse_anf_to_python(assignments, parsed_blocks,
+                                                                                 loop_block_names) + ' = ' +
+                             term.term1.parse_anf_to_python(assignments, parsed_blocks, loop_block_names) + newline)
+            term = term.term2
+        rest = term.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl)
+        if first_assignment is None:
+            return ''.join(parts) + rest
+        out = ''.join(parts[first_assignment:])
+        return ''.join(parts[:first_assignment]) + ''.join(s + '\n' for s in out.split('\n') if s) + rest
 
 
 class ANF_E_LETREC(ANF_E):
+    __slots__ = ('terms', 'term2')
+
     def __init__(self, terms: [ANF_EV], term2: ANF_E, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
         self.terms: [ANF_EV] = terms
         self.term2: ANF_EV = term2
 
-    def print(self, lvl=0, prov_info: str = ''):
-        add_newline = '' if len(self.terms) == 0 else '\n'
-        return get_indentation(lvl) + 'letrec \n' + ('').join(letrec.print(lvl + 1) for letrec in self.terms) + (
-                    get_indentation(lvl) + 'in\n' + (self.term2.print(lvl + 1))) if self.term2 is not None else ''
+    def print_parts(self, lvl=0):
+        if self.term2 is None:
+            return []
+        return [get_indentation(lvl), 'letrec \n'] + [(letrec, lvl + 1) for letrec in self.terms] + [
+            get_indentation(lvl), 'in\n', (self.term2, lvl + 1)]
 
-    def get_prov_info(self, prov_info):
-        add_newline = '' if len(self.terms) == 0 else '\n'
-        return '\n' + ''.join([term.get_prov_info(None) for term in self.terms]) + '\n' + self.term2.get_prov_info(None)
+    def prov_parts(self, ctx: TransformContext):
+        return ['\n'] + self.terms + ['\n', self.term2]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         out = '\n'.join(t for t in
@@ -335,25 +329,24 @@ class ANF_E_LETREC(ANF_E):
                                                                                   loop_block_names, lvl)
             else:
                 out += self.term2.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl)
-        return post_processing_anf_to_python(out)
+        return out
 
 
 class ANF_E_LETREC_ASS(ANF_E):
+    __slots__ = ('var', 'term1')
+
     def __init__(self, var: ANF_V, term1: ANF_EV, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
         self.var: ANF_V = var
         self.term1: ANF_EV = term1
 
-    def print(self, lvl=0, prov_info: str = ''):
+    def print_parts(self, lvl=0):
         line_sep = '\n'
-        return get_indentation(lvl) + self.var.print(lvl + 1) + ' = ' + line_sep + self.term1.print(lvl + 1) + line_sep
+        return [get_indentation(lvl), (self.var, lvl + 1), ' = ', line_sep, (self.term1, lvl + 1), line_sep]
 
-    def get_prov_info(self, prov_info):
-        add_new_line = isinstance(self.term1, ANF_E_LETREC_ASS) or isinstance(self.term1, ANF_E_LET) or isinstance(
-            self.term1, ANF_E_COMM)
+    def prov_parts(self, ctx: TransformContext):
         line_sep2 = '\n'
-        return self.var.get_prov_info(
-            None) + PROV_INFO_SPLIT_CHAR + self.print_prov_ext() + '\n' + self.term1.get_prov_info(None) + line_sep2
+        return [self.var, PROV_INFO_SPLIT_CHAR, self.print_prov_ext(ctx), '\n', self.term1, line_sep2]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         if self.var.is_block_id:
@@ -366,13 +359,13 @@ class ANF_E_LETREC_ASS(ANF_E):
         out = get_indentation(lvl) + 'def ' + self.var.parse_anf_to_python(assignments, parsed_blocks, loop_block_names,
                                                                            lvl) + '(' + ','.join(
             vars) + '):\n' + next_term.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1)
-        return post_processing_anf_to_python(out)
+        return out if out.endswith('\n') else out + '\n'
 
 
 def get_function_parameter_recursive(next):
     if isinstance(next, ANF_E_FUNC):
         if next.input_var is not None:
-            return get_function_parameter_recursive(next.term) + [next.input_var.parse_anf_to_python({}, [], [])]
+            return get_function_parameter_recursive(next.term) + [next.input_var.parse_anf_to_python({}, set(), [])]
     return []
 
 
@@ -384,36 +377,34 @@ def get_next_non_function_term(next):
 
 
 class ANF_E_IF(ANF_E):
+    __slots__ = ('test', 'term_if', 'term_else')
+
     def __init__(self, test: ANF_V_VAR, term_if: ANF_E, term_else: ANF_E, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
         self.test: ANF_V_VAR = test
         self.term_if: ANF_E = term_if
         self.term_else: ANF_E = term_else
 
-    def print(self, lvl=0, prov_info: str = ''):
-        return get_indentation(
-            lvl) + f"if {self.test.print(0)} then \n{self.term_if.print(lvl + 1)} \n{get_indentation(lvl)}else\n{self.term_else.print(lvl + 1)}"
+    def print_parts(self, lvl=0):
+        return [get_indentation(lvl), 'if ', (self.test, 0), ' then \n', (self.term_if, lvl + 1), ' \n',
+                get_indentation(lvl), 'else\n', (self.term_else, lvl + 1)]
 
-    def get_prov_info(self, prov_info):
-        return self.print_prov_ext() + PROV_INFO_SPLIT_CHAR + self.test.get_prov_info(
-            None) + PROV_INFO_SPLIT_CHAR + self.print_prov_ext() + '\n' + self.term_if.get_prov_info(
-            None) + '\n' + self.print_prov_ext() + '\n' + self.term_else.get_prov_info(None)
+    def prov_parts(self, ctx: TransformContext):
+        ext = self.print_prov_ext(ctx)
+        return [ext, PROV_INFO_SPLIT_CHAR, self.test, PROV_INFO_SPLIT_CHAR, ext, '\n', self.term_if, '\n', ext, '\n',
+                self.term_else]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
-        parsed_blocks_buffer = parsed_blocks.copy()
-
-        # First time parsing will generate the parse also the blocks within
-        if_out = (self.term_if.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1))
-        else_out = (self.term_else.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1))
-
-        # Second time parsing will only print the block label as function call
-        if_block_label = (self.term_if.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, 0))
-        else_block_label = (self.term_else.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, 0))
-
         # Get the block label numbers
-        parsed_blocks = parsed_blocks_buffer
-        goto1 = if_block_label.split('\n')[-1].strip().split('(')[0][1:]
-        goto2 = else_block_label.split('\n')[-1].strip().split('(')[0][1:]
+        goto1 = get_jump_label(self.term_if)
+        goto2 = get_jump_label(self.term_else)
+        next_block = block_identifier + str(int(goto1) + 1)
+
+        # Prevent that the block after if-else gets printed into then if part - then print it separately after both parts
+        # Add the block label from the one after the if-else block to the parse blocks - therefore it will not be parsed into the output
+        is_next_block_parsed = next_block in parsed_blocks
+        parsed_blocks.add(next_block)
+        if_out = self.term_if.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1)
 
         # Loop that contains break or continue in main body
         pattern = r'(.|\n)*(continue|break)\n( )*L[0-9]+\(.*\)(\n)*'
@@ -422,16 +413,15 @@ class ANF_E_IF(ANF_E):
         # Otherwise it would be i and i+2 because the block i+1 would be after the if-else block
         if (goto2 == '' or int(goto1) + 1 == int(goto2)) and (
                 'L' + str(int(goto1) - 1) + '(' in if_out) and not is_if_with_only_continue_in_body:
+            # The block after the loop is printed after its body
+            if not is_next_block_parsed:
+                parsed_blocks.discard(next_block)
+            else_out = self.term_else.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1)
             if_out = '\n'.join(if_out.split('\n')[0:-1])
             return (get_indentation(lvl) + 'while ' + self.test.parse_anf_to_python(assignments, parsed_blocks,
                                                                                     loop_block_names, lvl) + ':\n'
                     + if_out + '\n' + remove_indentation(else_out, 1) + '\n')
-
-        # Prevent that the block after if-else gets printed into then if part - then print it separately after both parts
-        # Add the block label from the one after the if-else block to the parse blocks - therefore it will not be parsed into the output
-        parsed_blocks.append('L' + str(int(goto1) + 1))
-        if_out = (self.term_if.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1))
-        else_out = (self.term_else.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1))
+        else_out = self.term_else.parse_anf_to_python(assignments, parsed_blocks, loop_block_names, lvl + 1)
 
         # Remove the block label function calls which are at the end of the parsed codes if the program does not stop there
         # If so there would be no label and there should not be the last line removed
@@ -449,9 +439,8 @@ class ANF_E_IF(ANF_E):
             if_out = '\n'.join(if_lines[0:-1])
         if block_call_pattern.match(else_lines[-1].strip()):
             else_out = '\n'.join(else_lines[0:-1])
-        post_if_else = assignments['L' + str(int(goto1) + 1)].parse_anf_to_python(assignments, parsed_blocks,
-                                                                                  loop_block_names, lvl) if 'L' + str(
-            int(goto1) + 1) in assignments else ''
+        post_if_else = assignments[next_block].parse_anf_to_python(assignments, parsed_blocks, loop_block_names,
+                                                                  lvl) if next_block in assignments else ''
 
         # If there is no content left in the else branch do not print any else content
         else_out = '\n' if else_out == '' else ('\n' + get_indentation(lvl) + 'else:\n' + else_out + '\n')
@@ -460,38 +449,46 @@ class ANF_E_IF(ANF_E):
         return out
 
 
+# Number of the block a branch of an if-else jumps to, empty if it does not jump
+def get_jump_label(term: ANF_EV):
+    if isinstance(term, ANF_E_APP) and isinstance(term.name, ANF_V_CONST) and term.name.is_block_id:
+        return term.name.value[len(block_identifier):]
+    return ''
+
+
 class ANF_V(ANF_EV):
+    __slots__ = ('is_buffer_var', 'is_block_id')
+
     def __init__(self, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
         self.is_buffer_var: bool = False
         self.is_block_id: bool = False
 
-    def print(self, lvl=0, prov_info: str = ''):
-        return f""
-
-    def get_prov_info(self, prov_info):
-        return ''
+    def print_parts(self, lvl=0):
+        return []
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         return get_indentation(lvl) + 'ANF_V'
 
 
 class ANF_V_CONST(ANF_V):
+    __slots__ = ('value',)
+
     def __init__(self, value: str, ssa_node: SSANode = None, is_block_id: bool = False):
         super().__init__(ssa_node=ssa_node)
         self.value: str = value
         self.is_block_id = is_block_id
 
-    def print(self, lvl=0, prov_info: str = ''):
+    def print_parts(self, lvl=0):
         if self.prov_info == 'RET':
-            return get_indentation(lvl) + f"{self.value}"
+            return [get_indentation(lvl) + f"{self.value}"]
         else:
-            return f"{self.value}"
+            return [f"{self.value}"]
 
-    def get_prov_info(self, prov_info):
+    def prov_parts(self, ctx: TransformContext):
         if self.is_block_id:
-            return 'lc' + self.print_prov_ext()
-        return 'c' + self.print_prov_ext()
+            return ['lc' + self.print_prov_ext(ctx)]
+        return ['c' + self.print_prov_ext(ctx)]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         # value = normalize_name(self.value)
@@ -509,19 +506,21 @@ def postprocessing_ANF_V_to_python(n: ANFNode, out: str):
 
 
 class ANF_V_VAR(ANF_V):
+    __slots__ = ('name',)
+
     def __init__(self, name: str, is_buffer_var: bool = False, is_block_id: bool = False, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
-        self.name: str = name
+        self.name: str = intern_name(name)
         self.is_buffer_var: bool = is_buffer_var
         self.is_block_id: bool = is_block_id
 
-    def print(self, lvl=0, prov_info: str = ''):
-        return f"{self.name}"
+    def print_parts(self, lvl=0):
+        return [f"{self.name}"]
 
-    def get_prov_info(self, prov_info):
+    def prov_parts(self, ctx: TransformContext):
         if self.is_block_id:
-            return 'lv' + self.print_prov_ext()
-        return ('b' if self.is_buffer_var else '') + 'v' + self.print_prov_ext()
+            return ['lv' + self.print_prov_ext(ctx)]
+        return [('b' if self.is_buffer_var else '') + 'v' + self.print_prov_ext(ctx)]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         if self.name in assignments:
@@ -541,44 +540,47 @@ def normalize_name(name: str):
 
 
 class ANF_V_UNIT(ANF_V):
+    __slots__ = ()
+
     def __init__(self, ssa_node: SSANode = None):
         super().__init__(ssa_node)
 
-    def print(self, lvl=0, prov_info: str = ''):
-        return get_indentation(lvl) + "unit"
+    def print_parts(self, lvl=0):
+        return [get_indentation(lvl) + "unit"]
 
-    def get_prov_info(self, prov_info):
-        return 'u'
+    def prov_parts(self, ctx: TransformContext):
+        return ['u']
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         return ''
 
 
 class ANF_E_FUNC(ANF_E):
+    __slots__ = ('input_var', 'term')
+
     def __init__(self, input_var: ANF_V, term: ANF_E, ssa_node: SSANode = None):
         super().__init__(ssa_node=ssa_node)
         self.input_var: ANF_V = input_var
         self.term: ANF_E = term
 
-    def print(self, lvl=0, prov_info: str = ''):
+    def print_parts(self, lvl=0):
         next_node = get_first_node_diff_than_comment(self.term)
         add_new_line = (not issubclass(type(next_node), ANF_V) or isinstance(next_node, ANF_V_UNIT)) or isinstance(
             self.term, ANF_E_COMM)
         line_sep = '\n' if add_new_line else ''
         if self.input_var is None:
-            return get_indentation(lvl) + f"{font['lambda_sign']} . {line_sep}{self.term.print(lvl)}"
-        return get_indentation(
-            lvl) + f"{font['lambda_sign']} {self.input_var.print(0)} . {line_sep}{self.term.print(lvl)}"
+            return [get_indentation(lvl), LAMBDA_SIGN, f" . {line_sep}", (self.term, lvl)]
+        return [get_indentation(lvl), LAMBDA_SIGN, " ", (self.input_var, 0), f" . {line_sep}", (self.term, lvl)]
 
-    def get_prov_info(self, prov_info):
+    def prov_parts(self, ctx: TransformContext):
         next_node = get_first_node_diff_than_comment(self.term)
         add_new_line = (not issubclass(type(next_node), ANF_V) or isinstance(next_node, ANF_V_UNIT)) or isinstance(
             self.term, ANF_E_COMM)
         line_sep = '\n' if add_new_line else PROV_INFO_SPLIT_CHAR
         if self.input_var is None:
-            return self.print_prov_ext() + PROV_INFO_SPLIT_CHAR + line_sep + self.term.get_prov_info(None)
-        return self.print_prov_ext() + PROV_INFO_SPLIT_CHAR + self.input_var.get_prov_info(
-            None) + PROV_INFO_SPLIT_CHAR + line_sep + self.term.get_prov_info(None)
+            return [self.print_prov_ext(ctx) + PROV_INFO_SPLIT_CHAR + line_sep, self.term]
+        return [self.print_prov_ext(ctx) + PROV_INFO_SPLIT_CHAR, self.input_var, PROV_INFO_SPLIT_CHAR + line_sep,
+                self.term]
 
     def parse_anf_to_python(self, assignments, parsed_blocks, loop_block_names, lvl=0):
         # Not used_var_names
@@ -587,7 +589,7 @@ class ANF_E_FUNC(ANF_E):
 
 
 def print_anf_code_to_python(anf_tree: ANFNode):
-    return post_processing_anf_to_python(anf_tree.parse_anf_to_python({}, [], []))
+    return post_processing_anf_to_python(anf_tree.parse_anf_to_python({}, set(), []))
 
 
 def get_first_node_diff_than_comment(node):
@@ -601,32 +603,31 @@ def get_indentation(nesting_lvl):
 
 
 def remove_indentation(code, i):
-    new_code = ''
-    for c in code.split('\n'):
-        new_code += c[4:] + '\n'
-    return new_code
+    return ''.join(c[4:] + '\n' for c in code.split('\n'))
 
 
-def parse_ssa_to_anf(ssa: SSA_AST, debug: bool, no_pos: bool):
-    global debug_mode, no_pos_tracking
-    reset()
-    no_pos_tracking = no_pos
-    debug_mode = debug
-    return SA(ssa)
+# Transform an SSA AST into an ANF AST
+# The same context has to be passed to print_anf_with_prov_info for the provenance information to match the settings
+def parse_ssa_to_anf(ssa: SSA_AST, debug: bool, no_pos: bool, ctx: TransformContext = None):
+    if ctx is None:
+        ctx = TransformContext()
+    ctx.reset_anf()
+    ctx.no_pos = no_pos
+    ctx.debug = debug
+    return SA(ctx, ssa)
 
 
 # Transform SSA AST into ANF AST
-def SA(ssa_ast: SSA_AST):
-    global ssa_ast_global
-    ssa_ast_global = ssa_ast
+def SA(ctx: TransformContext, ssa_ast: SSA_AST):
+    ctx.ssa_ast = ssa_ast
 
     # Transform all procedures of the SSA AST and put the call of the first block as inner most term
     first_block = get_first_block_in_proc(ssa_ast.blocks)
-    return SA_PS(ssa_ast.procs, SA_BS(ssa_ast.blocks[0], True, first_scope=True))
+    return SA_PS(ctx, ssa_ast.procs, SA_BS(ctx, ssa_ast.blocks[0], True, first_scope=True))
 
 
 # Transforms a list of procedures putting the inner_term inside the innermost let/rec
-def SA_PS(ps: [SSA_P], inner_term, as_array: bool = False):
+def SA_PS(ctx, ps: [SSA_P], inner_term, as_array: bool = False):
     # When there is no procedure we return the inner term
     if len(ps) == 0:
         return inner_term
@@ -636,43 +637,51 @@ def SA_PS(ps: [SSA_P], inner_term, as_array: bool = False):
     parsed_procs = []
     while len(ps) > 0:
         p: SSA_P = ps[0]
-
-        first_term = SA_BS(p.blocks[0], True, first_scope=True)
-        # args = p.args[::-1] If arguments should be given in backwards order
-        # If so the back transformation function get_function_parameter_recursive must also be build in revers
-        args = p.args
-        while len(args) > 0:
-            first_term = ANF_E_FUNC(SA_V(args[0]), first_term, ssa_node=p)
-            args = args[1:]
-
-        v = SA_V(p.name)
-        v.init(ssa_node=p)
+        if ctx.function_cache is None:
+            parsed_procs.append(SA_P(ctx, p))
+        else:
+            # Procedures reused from the previous transformation keep their ANF as well (scalpel.incremental)
+            parsed_procs.append(ctx.function_cache.parse_proc(ctx, p, SA_P))
         ps = ps[1:]
-        parsed_procs.append(ANF_E_LETREC_ASS(v, first_term, ssa_node=p))
 
     let_rec = ANF_E_LETREC(parsed_procs, inner_term, ssa_node=p)
 
     return let_rec
 
 
+# Transform a procedure into a letrec assignment of its function
+def SA_P(ctx, p: SSA_P):
+    first_term = SA_BS(ctx, p.blocks[0], True, first_scope=True)
+    # args = p.args[::-1] If arguments should be given in backwards order
+    # If so the back transformation function get_function_parameter_recursive must also be build in revers
+    args = p.args
+    while len(args) > 0:
+        first_term = ANF_E_FUNC(SA_V(ctx, args[0]), first_term, ssa_node=p)
+        args = args[1:]
+
+    v = SA_V(ctx, p.name)
+    v.init(ssa_node=p)
+    return ANF_E_LETREC_ASS(v, first_term, ssa_node=p)
+
+
 # Transform a list of SSA blocks
-def SA_BS(b: SSA_B, is_block_id=True, first_scope=False):
-    block_vars = [SA_V(phi_var) for phi_var in get_phi_vars_in_block(b)]
+def SA_BS(ctx, b: SSA_B, is_block_id=True, first_scope=False):
+    block_vars = [SA_V(ctx, phi_var) for phi_var in get_phi_vars_in_block(b)]
 
     # Create self containing functions to build lambda functions in each other. leading to have functions with multiple variables
     if len(block_vars) > 0:
-        b_terms = ANF_E_FUNC(block_vars[0], SA_ES(b, b.terms), ssa_node=b)
+        b_terms = ANF_E_FUNC(block_vars[0], SA_ES(ctx, b, b.terms), ssa_node=b)
         block_vars = block_vars[1:]
 
         while len(block_vars) > 0:
             b_terms = ANF_E_FUNC(block_vars[0], b_terms, ssa_node=b)
             block_vars = block_vars[1:]
     else:
-        b_terms = SA_ES(b, b.terms)
+        b_terms = SA_ES(ctx, b, b.terms)
 
     let_rec = []
     if b.blocks is not None and len(b.blocks) > 0:
-        let_rec = SA_BS2(b.blocks)
+        let_rec = SA_BS2(ctx, b.blocks)
 
     if b.blocks is None or len(b.blocks) == 0:
         return b_terms
@@ -683,25 +692,25 @@ def SA_BS(b: SSA_B, is_block_id=True, first_scope=False):
                             ANF_E_LETREC(let_rec, b_terms))
 
 
-def SA_BS2(bs: [SSA_B], is_block_id=True):
+def SA_BS2(ctx, bs: [SSA_B], is_block_id=True):
     blocks_out = []
 
     for b in bs:
         if b.blocks is not None and len(b.blocks) > 0:
-            blocks_out.append(SA_BS(b))
+            blocks_out.append(SA_BS(ctx, b))
         else:
-            block_vars = [SA_V(phi_var) for phi_var in get_phi_vars_in_block(b)]
+            block_vars = [SA_V(ctx, phi_var) for phi_var in get_phi_vars_in_block(b)]
 
             # Create self containing functions to build lambda functions in each other. leading to have functions with multiple variables
             if len(block_vars) > 0:
-                b_terms = ANF_E_FUNC(block_vars[0], SA_ES(b, b.terms), ssa_node=b)
+                b_terms = ANF_E_FUNC(block_vars[0], SA_ES(ctx, b, b.terms), ssa_node=b)
                 block_vars = block_vars[1:]
 
                 while len(block_vars) > 0:
                     b_terms = ANF_E_FUNC(block_vars[0], b_terms, ssa_node=b)
                     block_vars = block_vars[1:]
             else:
-                b_terms = SA_ES(b, b.terms)
+                b_terms = SA_ES(ctx, b, b.terms)
 
             blocks_out.append(
                 ANF_E_LETREC_ASS(ANF_V_CONST(block_identifier + b.label.label, ssa_node=b, is_block_id=True), b_terms,
@@ -709,90 +718,111 @@ def SA_BS2(bs: [SSA_B], is_block_id=True):
     return blocks_out
 
 
-def SA_ES(b: SSA_B, terms: [SSA_E]):
-    if len(terms) == 0:
-        return ANF_V_UNIT()
+def SA_ES(ctx, b: SSA_B, terms: [SSA_E]):
+    # The terms are nested into each other (let x = .. in <rest>), the terms continuing with the rest of the list are
+    # put on a stack until the last term and then wrapped around it backwards, buffer variables are named in order
+    stack = []
+    inner = None
+    for term in terms:
+        if term is None:
+            break
+        if isinstance(term, SSA_E_ASS_PHI):
+            continue
+        if isinstance(term, SSA_E_ASS):
+            unwrap_inner_applications_naming(ctx, term.value)
+            stack.append((term, SA_V(ctx, term.var), SA_V(ctx, term.value)))
+        elif isinstance(term, SSA_E_FUNC_CALL):
+            unwrap_inner_applications_naming(ctx, term)
+            stack.append((term, ANF_V_CONST('_'), SA_V(ctx, term)))
+        elif issubclass(type(term), SSA_E_COMM):
+            stack.append((term, None, None))
+        elif issubclass(type(term), SSA_V):
+            # Needed for variables just being there like in an transformed ifexp node
+            stack.append((term, ANF_V_CONST('_'), SA_V(ctx, term)))
+        else:
+            inner = SA_E_LAST(ctx, b, term)
+            break
+
+    if inner is None:
+        inner = ANF_V_UNIT()
+    while len(stack) > 0:
+        term, var, value = stack.pop()
+        if isinstance(term, SSA_E_ASS):
+            inner = unwrap_inner_applications_let_structure(ctx, term.value, ANF_E_LET(var, value, inner, ssa_node=term))
+        elif isinstance(term, SSA_E_FUNC_CALL):
+            inner = unwrap_inner_applications_let_structure(ctx, term, ANF_E_LET(var, value, inner, ssa_node=term))
+        elif issubclass(type(term), SSA_E_COMM):
+            inner = ANF_E_COMM(term.text, inner, ssa_node=term)
+        else:
+            inner = ANF_E_LET(var, value, inner)
+    return inner
 
-    term = terms[0]
-    if term is None:
-        return ANF_V_UNIT()
 
-    if isinstance(term, SSA_E_ASS):
-        unwrap_inner_applications_naming(term.value)
-        return unwrap_inner_applications_let_structure(term.value,
-                                                       ANF_E_LET(SA_V(term.var), SA_V(term.value), SA_ES(b, terms[1:]),
-                                                                 ssa_node=term))
+# Transform a term which ends the list of terms of a block (jumps, returns and branches)
+def SA_E_LAST(ctx, b: SSA_B, term: SSA_E):
     if isinstance(term, SSA_E_GOTO):
         return ANF_E_APP(
-            [SA_V(arg) for arg in get_phi_vars_for_jump(b, get_block_by_id(ssa_ast_global, term.label.label), ssa_ast_global)],
+            [SA_V(ctx, arg) for arg in get_phi_vars_for_jump(b, get_block_by_id(ctx.ssa_ast, term.label.label), ctx.ssa_ast)],
             ANF_V_CONST(block_identifier + term.label.label, ssa_node=term, is_block_id=True), ssa_node=term)
-    if isinstance(term, SSA_E_ASS_PHI):
-        return SA_ES(b, terms[1:])
     if isinstance(term, SSA_E_RET):
         if term.value is None:
             return ANF_V_UNIT()
-        unwrap_inner_applications_naming(term.value)
-        x = SA_V(term.value)
+        unwrap_inner_applications_naming(ctx, term.value)
+        x = SA_V(ctx, term.value)
         x.prov_info = 'RET'
-        return unwrap_inner_applications_let_structure(term.value, x)
+        return unwrap_inner_applications_let_structure(ctx, term.value, x)
     if isinstance(term, SSA_E_IF_ELSE):
-        unwrap_inner_applications_naming(term.test, True)
-        return unwrap_inner_applications_let_structure(term.test,
-                                                       ANF_E_IF(SA_V(term.test, True), SA_ES(b, [term.term_if]),
-                                                                SA_ES(b, [term.term_else]), ssa_node=term), True)
-    if isinstance(term, SSA_E_FUNC_CALL):
-        unwrap_inner_applications_naming(term)
-        return unwrap_inner_applications_let_structure(term,
-                                                       ANF_E_LET(ANF_V_CONST('_'), SA_V(term), SA_ES(b, terms[1:]),
-                                                                 ssa_node=term))
-    if issubclass(type(term), SSA_E_COMM):
-        return ANF_E_COMM(term.text, SA_ES(b, terms[1:]), ssa_node=term)
-    if issubclass(type(term), SSA_V):
-        # Needed for variables just being there like in an transformed ifexp node
-        return ANF_E_LET(ANF_V_CONST('_'), SA_V(term), SA_ES(b, terms[1:]))
+        unwrap_inner_applications_naming(ctx, term.test, True)
+        return unwrap_inner_applications_let_structure(ctx, term.test,
+                                                       ANF_E_IF(SA_V(ctx, term.test, True), SA_ES(ctx, b, [term.term_if]),
+                                                                SA_ES(ctx, b, [term.term_else]), ssa_node=term), True)
     return ANF_E_APP([], ANF_V_CONST('Not-Impl'))
 
 
-def unwrap_inner_applications_let_structure(var: SSA_V | SSA_E_FUNC_CALL, inner, unwrap_var: bool = False):
+# Nested function calls in the arguments and the name of the function call (depth first, outer calls first)
+def iter_inner_applications(var: SSA_V):
+    stack = [iter(get_inner_applications(var))]
+    while len(stack) > 0:
+        inner = next(stack[-1], None)
+        if inner is None:
+            stack.pop()
+        else:
+            yield inner
+            stack.append(iter(get_inner_applications(inner)))
+
+
+def get_inner_applications(var: SSA_V):
+    if not isinstance(var, SSA_E_FUNC_CALL):
+        return []
+    inner = [arg for arg in var.args if isinstance(arg, SSA_E_FUNC_CALL)]
+    if isinstance(var.name, SSA_E_FUNC_CALL):
+        inner.append(var.name)
+    return inner
+
+
+# Wraps the inner term into let assignments of the buffer variables of the nested function calls
+# Every call is wrapped around the ones before, so the innermost calls are evaluated first
+def unwrap_inner_applications_let_structure(ctx, var: SSA_V | SSA_E_FUNC_CALL, inner, unwrap_var: bool = False):
     if isinstance(var, SSA_E_FUNC_CALL):
+        calls = iter_inner_applications(var)
         if unwrap_var:
-            name = buffer_assignments[var]
-            inner = unwrap_inner_applications_let_structure(var,
-                                                            ANF_E_LET(ANF_V_VAR(name, True, ssa_node=var), SA_V(var),
-                                                                      inner, ssa_node=var))
-        else:
-            for arg in var.args:
-                if isinstance(arg, SSA_E_FUNC_CALL):
-                    name = buffer_assignments[arg]
-                    inner = unwrap_inner_applications_let_structure(arg, ANF_E_LET(ANF_V_VAR(name, True, ssa_node=arg),
-                                                                                   SA_V(arg), inner, ssa_node=arg))
-
-            if isinstance(var.name, SSA_E_FUNC_CALL):
-                name = buffer_assignments[var.name]
-                inner = unwrap_inner_applications_let_structure(var.name,
-                                                                ANF_E_LET(ANF_V_VAR(name, True, ssa_node=var.name),
-                                                                          SA_V(var.name), inner, ssa_node=var.name))
+            calls = itertools.chain([var], calls)
+        for call in calls:
+            inner = ANF_E_LET(ANF_V_VAR(ctx.buffer_assignments[call], True, ssa_node=call), SA_V(ctx, call), inner, ssa_node=call)
     return inner
 
 
-def unwrap_inner_applications_naming(var: SSA_V, unwrap_var: bool = False):
+# Names a buffer variable for every nested function call (and the call itself if unwrap_var is True)
+def unwrap_inner_applications_naming(ctx, var: SSA_V, unwrap_var: bool = False):
     if isinstance(var, SSA_E_FUNC_CALL):
         if unwrap_var:
-            name = get_buffer_variable()
-            buffer_assignments[var] = name
-        for arg in var.args:
-            if isinstance(arg, SSA_E_FUNC_CALL):
-                name = get_buffer_variable()
-                buffer_assignments[arg] = name
-                unwrap_inner_applications_naming(arg)
-        if isinstance(var.name, SSA_E_FUNC_CALL):
-            name = get_buffer_variable()
-            buffer_assignments[var.name] = name
-            unwrap_inner_applications_naming(var.name)
+            ctx.buffer_assignments[var] = get_buffer_variable(ctx)
+        for call in iter_inner_applications(var):
+            ctx.buffer_assignments[call] = get_buffer_variable(ctx)
 
 
 # Transform values from SSA to ANF
-def SA_V(var: SSA_V, can_be_buffered: bool = False):
+def SA_V(ctx, var: SSA_V, can_be_buffered: bool = False):
     if isinstance(var, SSA_V_VAR):
         return ANF_V_VAR(var.name, ssa_node=var)
     if isinstance(var, SSA_V_CONST):
@@ -800,52 +830,118 @@ def SA_V(var: SSA_V, can_be_buffered: bool = False):
     if isinstance(var, SSA_L):
         return ANF_V_CONST(var.label, ssa_node=var)
     if isinstance(var, SSA_E_FUNC_CALL):
-        if can_be_buffered and var in buffer_assignments:
-            return ANF_V_VAR(buffer_assignments[var], ssa_node=var)
+        if can_be_buffered and var in ctx.buffer_assignments:
+            return ANF_V_VAR(ctx.buffer_assignments[var], ssa_node=var)
         else:
             return ANF_E_APP(
-                [(ANF_V_VAR(buffer_assignments[par], ssa_node=par) if par in buffer_assignments else SA_V(par)) for par
+                [(ANF_V_VAR(ctx.buffer_assignments[par], ssa_node=par) if par in ctx.buffer_assignments else SA_V(ctx, par)) for par
                  in var.args],
-                ANF_V_VAR(buffer_assignments[var.name], ssa_node=var.name) if var.name in buffer_assignments else SA_V(
+                ANF_V_VAR(ctx.buffer_assignments[var.name], ssa_node=var.name) if var.name in ctx.buffer_assignments else SA_V(ctx, 
                     var.name), ssa_node=var)
-            # unwrap_inner_applications_naming(var)
-            # return unwrap_inner_applications_let_structure(var, ANF_E_APP([(ANF_V_VAR(buffer_assignments[par], ssa_node=par) if par in buffer_assignments else SA_V(par)) for par in var.args], SA_V(var.name), ssa_node=var))
+            # unwrap_inner_applications_naming(ctx, var)
+            # return unwrap_inner_applications_let_structure(ctx, var, ANF_E_APP([(ANF_V_VAR(ctx.buffer_assignments[par], ssa_node=par) if par in ctx.buffer_assignments else SA_V(ctx, par)) for par in var.args], SA_V(ctx, var.name), ssa_node=var))
 
     return ANF_V_CONST('Not impl')
 
 
-# Get a new unique buffer variable
-def get_buffer_variable():
-    global buffer_variable_counter
-    buffer_variable_counter += 1
-    return ANF_BUFFER_VAR_NAME + str(buffer_variable_counter - 1)
+# Print the ANF tree including the provenance information right aligned to the code per line
+def print_anf_with_prov_info(anf_parent: ANFNode, ctx: TransformContext = None):
+    # The whole output is returned anyway, therefore the code lines are kept instead of being printed twice
+    if ctx is None:
+        ctx = TransformContext()
+    code_lines = list(iter_anf_lines(anf_parent, ctx.font))
+    return '\n'.join(iter_anf_with_prov_info(anf_parent, ctx, get_anf_code_width(code_lines), code_lines))
 
 
-# Print the ANF tree including the provenance information right aligned to the code per line
-def print_anf_with_prov_info(anf_parent: ANFNode):
-    out = trim_double_spaces(anf_parent.print(), NEW_COMMENT_MARKER)
-    prov = anf_parent.get_prov_info(None)
-    max_chars = max([len(line) + line.count('\t') * 3 for line in out.split('\n')]) + 2
-    return '\n'.join(
-        [line + (max_chars - len(line) - line.count('\t') * 3) * ' ' + PROV_INFO_MARKER + info for line, info in
-         zip(out.split('\n'), prov.split('\n'))])
+# Width of the code column in front of the provenance info
+def get_anf_code_width(code_lines):
+    return max(len(line) + line.count('\t') * 3 for line in code_lines) + 2
+
+
+# Generates the lines of the ANF code with the provenance info aligned behind each line
+# Without a given width the tree is printed twice (once for the width of the code) instead of holding the whole output in memory
+def iter_anf_with_prov_info(anf_parent: ANFNode, ctx: TransformContext = None, width: int = None, code_lines=None):
+    if ctx is None:
+        ctx = TransformContext()
+    if width is None:
+        width = get_anf_code_width(iter_anf_lines(anf_parent, ctx.font))
+    if code_lines is None:
+        code_lines = iter_anf_lines(anf_parent, ctx.font)
+    for line, info in zip(code_lines, split_chunks_into_lines(iter_prov_chunks(anf_parent, ctx))):
+        yield line + (width - len(line) - line.count('\t') * 3) * ' ' + PROV_INFO_MARKER + info
+
+
+# Writes the ANF code with provenance info into a file-like object line by line
+def write_anf_with_prov_info(anf_parent: ANFNode, file, ctx: TransformContext = None):
+    for i, line in enumerate(iter_anf_with_prov_info(anf_parent, ctx)):
+        if i > 0:
+            file.write('\n')
+        file.write(line)
+
+
+# Lines of the printed ANF code with double spaces trimmed
+def iter_anf_lines(anf_parent: ANFNode, font: dict = CODE_FONT):
+    return trim_double_spaces_lines(split_chunks_into_lines(iter_anf_chunks(anf_parent, 0, font)), NEW_COMMENT_MARKER)
+
+
+# Number of nodes of the ANF tree
+def count_anf_nodes(anf_parent: ANFNode):
+    count = 0
+    stack = [anf_parent]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(part[0] for part in node.print_parts() if not isinstance(part, str))
+    return count
+
+
+# Generates the printed code of a node in parts, the tree is traversed with an explicit stack
+def iter_anf_chunks(node: ANFNode, lvl=0, font: dict = CODE_FONT):
+    stack = [(node, lvl)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, FontSign):
+            yield font[item]
+        elif isinstance(item, str):
+            yield item
+        else:
+            stack.extend(reversed(item[0].print_parts(item[1])))
+
+
+# Generates the provenance info of a node in parts, the tree is traversed with an explicit stack
+def iter_prov_chunks(node: ANFNode, ctx: TransformContext):
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            yield item
+        else:
+            stack.extend(reversed(item.prov_parts(ctx)))
 
 
 # Read anf code and parse it into internal ANF AST representation
 def parse_anf_from_text(code: str):
+    code_words, info_words = tokenize_anf_text(code)
+    return parse_anf_e_from_code(code_words, info_words)
+
+
+# Split ANF code with provenance information into the words of the code and the corresponding provenance info words
+def tokenize_anf_text(code: str):
     code = code.strip()
     lines = code.split('\n')
-    a = [tuple(line.rsplit(PROV_INFO_MARKER, 1)) for line in lines]
     code_lines, info_lines = zip(*[tuple(line.rsplit(PROV_INFO_MARKER, 1)) for line in lines])
+    info_words = [info_word for line in info_lines for info_word in line.strip().split(PROV_INFO_SPLIT_CHAR)]
+    return tokenize_anf_code(code_lines), info_words
+
+
+# Split the lines of ANF code without provenance information into its words
+def tokenize_anf_code(code_lines: [str]):
     code_lines = [
         line if re.match(r'^(\s)*' + NEW_COMMENT_MARKER, line) else trim_double_spaces(line, NEW_COMMENT_MARKER) for
         line in code_lines]
     code_words = []
 
     for line in code_lines:
-        # a = repr(line.strip())[1:-1]
-        # x = re.split(r"(?<!\\)(?:\\\\)*'", repr(line.strip())[1:-1])
-        # for i, part in enumerate([line.strip()] if re.match(r'^(\s)*' + NEW_COMMENT_MARKER, line) else re.split(r"(?<!\\\\)(?:\\\\\\\\)*'", repr(line.strip())[1:-1])):
         for i, part in enumerate(
                 [line.strip()] if re.match(r'^(\s)*' + NEW_COMMENT_MARKER, line) else re.split(r"(?<!\\)'",
                                                                                                line.strip())):
@@ -857,101 +953,151 @@ def parse_anf_from_text(code: str):
                     elif j == 0:
                         code_words.append('\'' + part + '\'')
                         break
+    return code_words
 
-    # code_words = list(filter(lambda e: e is not None, code_words))
-    aa = parse_anf_e_from_code(code_words, [info_word for line in info_lines for info_word in
-                                            line.strip().split(PROV_INFO_SPLIT_CHAR)])
-    return aa
-
-
-# Convert an ANF code expression to ANF AST
-def parse_anf_e_from_code(code_words, info_words):
-    next_word = code_words[0]
-    info0_parts = info_words[0].split(PROV_INFO_EXT_CHAR)
-    if len(info_words) > 1:
-        info1_parts = info_words[1].split(PROV_INFO_EXT_CHAR)
-
-    # Found a comment within provenance information
-    if len(code_words[0]) > 0 and code_words[0].startswith(NEW_COMMENT_MARKER):
-        return ANF_E_COMM(code_words[0], parse_anf_e_from_code(code_words[1:], info_words[1:]))
-    if next_word == 'let':
-        variable = ANF_V_VAR(code_words[1], info1_parts[0] == 'bv')
-        right = parse_anf_e_from_code(code_words[3:], info_words[3:])
-        _in = get_other_section_part(code_words[1:], info_words[1:], ['let', 'letrec'], ['in'])
-        return ANF_E_LET(variable, right, _in)
-    if next_word == 'letrec':
-        i = 0
-        blocks = []
-        in_idx = get_other_section_part_idx(code_words[1:], info_words[1:], ['let', 'letrec'], ['in'])
-        inside = 0
-        while len(code_words) > i + 2 and i < in_idx:
-            if code_words[i] == 'let' or (code_words[i] == 'letrec' and i > 0):
-                inside += 1
-            elif code_words[i] == 'in':
-                inside -= 1
-            elif inside == 0 and code_words[i] != 'let' and code_words[i + 2] == '=':
-                # Find start of next assignment or end at the 'in' area
-                i2 = i + 1
-                inside2 = 0
-                while len(code_words) > i2 + 2 and i2 < in_idx + 1:
-                    if code_words[i2] == 'let' or code_words[i2] == 'letrec':
-                        inside2 += 1
-                    elif code_words[i2] == 'in':
-                        inside2 -= 1
-                    elif inside2 == 0 and 'let' not in code_words[i2] and code_words[i2 + 2] == '=':
+
+# For each opening keyword the index of the closing keyword belonging to it
+# Ex. for a "letrec" we want to find its "in"
+# (letrec) xxx let xxx let xxx in xxx in xxx (in) xxx
+def get_section_match_table(code_words: [str], open_keys: [str], close_keys: [str]):
+    matches = {}
+    open_idxs = []
+    for i, w in enumerate(code_words):
+        if w in open_keys:
+            open_idxs.append(i)
+        elif w in close_keys and len(open_idxs) > 0:
+            matches[open_idxs.pop()] = i
+    return matches
+
+
+# Convert ANF code words to ANF AST
+# The words are parsed with an explicit stack of index ranges [start, end) instead of recursion on copies of the lists
+def parse_anf_e_from_code(code_words: [str], info_words: [str]):
+    in_matches = get_section_match_table(code_words, ['let', 'letrec'], ['in'])
+    then_matches = get_section_match_table(code_words, ['if'], ['then'])
+    else_matches = get_section_match_table(code_words, ['if'], ['else'])
+
+    # Index of the closing keyword for the keyword at start within the range, or the next index if there is none
+    def other_section_part_idx(matches, start, end):
+        idx = matches.get(start)
+        return idx if idx is not None and idx < end else start + 1
+
+    # Tasks are either a range to be parsed or a constructor to be applied on the last parsed nodes
+    tasks = [(0, len(code_words))]
+    nodes = []
+    while len(tasks) > 0:
+        task = tasks.pop()
+        if callable(task[0]):
+            build, n = task
+            args = nodes[len(nodes) - n:]
+            del nodes[len(nodes) - n:]
+            nodes.append(build(*args))
+            continue
+
+        start, end = task
+        if start >= end:
+            raise IndexError('No ANF code left to be parsed')
+        next_word = code_words[start]
+        info0_parts = info_words[start].split(PROV_INFO_EXT_CHAR)
+        info1_parts = info_words[start + 1].split(PROV_INFO_EXT_CHAR) if end - start > 1 and start + 1 < len(info_words) else None
+
+        # The parts of the node are pushed in reverse order so they are parsed in order
+        # Found a comment within provenance information
+        if len(next_word) > 0 and next_word.startswith(NEW_COMMENT_MARKER):
+            tasks.append((lambda rest, text=next_word: ANF_E_COMM(text, rest), 1))
+            tasks.append((start + 1, end))
+        elif next_word == 'let':
+            variable = ANF_V_VAR(code_words[start + 1], info1_parts[0] == 'bv')
+            in_idx = other_section_part_idx(in_matches, start, end)
+            tasks.append((lambda right, _in, var=variable: ANF_E_LET(var, right, _in), 2))
+            tasks.append((in_idx + 1, end))
+            tasks.append((start + 3, end))
+        elif next_word == 'letrec':
+            # Position of the 'in' relative to the word after the 'letrec'
+            in_idx = other_section_part_idx(in_matches, start, end) - start - 1
+            words = end - start
+            block_ranges = []
+            i = 0
+            inside = 0
+            while words > i + 2 and i < in_idx:
+                w = code_words[start + i]
+                if w == 'let' or (w == 'letrec' and i > 0):
+                    inside += 1
+                elif w == 'in':
+                    inside -= 1
+                elif inside == 0 and w != 'let' and code_words[start + i + 2] == '=':
+                    # Find start of next assignment or end at the 'in' area
+                    i2 = i + 1
+                    inside2 = 0
+                    while words > i2 + 2 and i2 < in_idx + 1:
+                        w2 = code_words[start + i2]
+                        if w2 == 'let' or w2 == 'letrec':
+                            inside2 += 1
+                        elif w2 == 'in':
+                            inside2 -= 1
+                        elif inside2 == 0 and 'let' not in w2 and code_words[start + i2 + 2] == '=':
+                            i2 += 1
+                            break
                         i2 += 1
-                        break
-                    i2 += 1
-                block = parse_anf_e_from_code(code_words[i + 1:i2], info_words[i + 1:i2])
-                blocks.append(block)
-            i += 1
-        _in = get_other_section_part(code_words[1:], info_words[1:], ['let', 'letrec'], ['in'])
-        return ANF_E_LETREC(blocks, _in)
-    if len(code_words) > 1 and code_words[1] == '=':
-        # assign within letrec
-        variable = ANF_V_VAR(code_words[0], info0_parts[0] == 'bv',
-                             is_block_id=info0_parts[0] == 'lc' or info0_parts[0] == 'lv')
-        right = parse_anf_e_from_code(code_words[2:], info_words[2:])
-        return ANF_E_LETREC_ASS(variable, right)
-    if next_word == 'unit':
-        return ANF_V_UNIT()
-    if next_word == 'lambda' or next_word == 'λ':
-        variable = ANF_V_VAR(code_words[1], info1_parts[0] == 'bv')
-        rest = code_words[3:]
-        rest_info = info_words[3:]
-        if code_words[1] == '.':
-            variable = None
-            rest = code_words[2:]
-            rest_info = info_words[2:]
-        return ANF_E_FUNC(variable, parse_anf_e_from_code(rest, rest_info))
-    if next_word == 'if':
-        then_part = get_other_section_part(code_words[1:], info_words[1:], ['if'], ['then'])
-        else_part = get_other_section_part(code_words[1:], info_words[1:], ['if'], ['else'])
-        return ANF_E_IF(parse_anf_e_from_code(code_words[1:], info_words[1:]), then_part, else_part)
+                    block_ranges.append((start + i + 1, start + i2))
+                i += 1
+            tasks.append((lambda *parts: ANF_E_LETREC(list(parts[:-1]), parts[-1]), len(block_ranges) + 1))
+            tasks.append((start + in_idx + 2, end))
+            tasks.extend(reversed(block_ranges))
+        elif end - start > 1 and code_words[start + 1] == '=':
+            # assign within letrec
+            variable = ANF_V_VAR(next_word, info0_parts[0] == 'bv',
+                                 is_block_id=info0_parts[0] == 'lc' or info0_parts[0] == 'lv')
+            tasks.append((lambda right, var=variable: ANF_E_LETREC_ASS(var, right), 1))
+            tasks.append((start + 2, end))
+        elif next_word == 'unit':
+            nodes.append(ANF_V_UNIT())
+        elif next_word == 'lambda' or next_word == 'λ':
+            variable = ANF_V_VAR(code_words[start + 1], info1_parts[0] == 'bv')
+            rest = start + 3
+            if code_words[start + 1] == '.':
+                variable = None
+                rest = start + 2
+            tasks.append((lambda term, var=variable: ANF_E_FUNC(var, term), 1))
+            tasks.append((rest, end))
+        elif next_word == 'if':
+            tasks.append((lambda test, then_part, else_part: ANF_E_IF(test, then_part, else_part), 3))
+            tasks.append((other_section_part_idx(else_matches, start, end) + 1, end))
+            tasks.append((other_section_part_idx(then_matches, start, end) + 1, end))
+            tasks.append((start + 1, end))
+        else:
+            nodes.append(parse_anf_app_from_code(code_words, info_words, start, end))
 
+    return nodes[0]
+
+
+# Convert an ANF function application or a single value starting at start to ANF AST
+def parse_anf_app_from_code(code_words: [str], info_words: [str], start: int, end: int):
     count = 0
-    while count + 1 < len(code_words) and next_word not in keywords:
+    next_word = code_words[start]
+    while start + count + 1 < end and next_word not in keywords:
         count += 1
-        next_word = code_words[count]
-    if count + 1 == len(code_words) and next_word not in keywords:
+        next_word = code_words[start + count]
+    if start + count + 1 == end and next_word not in keywords:
         count += 1
 
     if count > 1:
+        info_word = info_words[start]
         # Read param naming prov info
         names = None
-        if 'names=' in info_words[0]:
-            parts = info_words[0].split(PROV_INFO_EXT_CHAR)
+        if 'names=' in info_word:
+            parts = info_word.split(PROV_INFO_EXT_CHAR)
             parts2 = []
             for part in parts:
                 if 'names=' in part:
                     names = part.split('names=')[1].split(',')
                 else:
                     parts2.append(part)
-            info_words[0] = PROV_INFO_EXT_CHAR.join(parts2)
+            info_word = PROV_INFO_EXT_CHAR.join(parts2)
 
-        n = ANF_E_APP([parse_anf_v_from_code(code_words[i], info_words[i]) for i in range(1, count)],
-                      parse_anf_v_from_code(code_words[0], info_words[0][1:]), params_named=names)
-        info_word_parts = info_words[0][1:].split(PROV_INFO_EXT_CHAR)
+        n = ANF_E_APP([parse_anf_v_from_code(code_words[i], info_words[i]) for i in range(start + 1, start + count)],
+                      parse_anf_v_from_code(code_words[start], info_word[1:]), params_named=names)
+        info_word_parts = info_word[1:].split(PROV_INFO_EXT_CHAR)
         if n is not None and len(info_word_parts) > 1:
             n.prov_info = info_word_parts[len(info_word_parts) - 1]
             # The found info is not prov info but position info
@@ -959,7 +1105,7 @@ def parse_anf_e_from_code(code_words, info_words):
                 n.prov_info = ''
         return n
     else:
-        return parse_anf_v_from_code(code_words[0], info_words[0])
+        return parse_anf_v_from_code(code_words[start], info_words[start])
 
 
 # Convert an ANF code value to ANF AST
@@ -988,349 +1134,386 @@ def parse_anf_v_from_code(code_word: str, info_word_with_prov: str):
     return n
 
 
-# Get the position of the next part belonging to the given one
-# Ex. We start at a "letrec" and want to find its "in"
-# (letrec) xxx let xxx let xxx in xxx in xxx (in) xxx
-def get_other_section_part(code_words: [str], info_words: [str], open_keys: [str], close_keys: [str]):
-    idx = get_other_section_part_idx(code_words, info_words, open_keys, close_keys)
-    return parse_anf_e_from_code(code_words[idx + 1:], info_words[idx + 1:])
-
-
-def get_other_section_part_idx(code_words: [str], info_words: [str], open_keys: [str], close_keys: [str]):
-    indentation = 1
-    idx = 0
-    for i, w in enumerate(code_words):
-        if w in open_keys:
-            indentation += 1
-        elif w in close_keys:
-            indentation -= 1
-        if indentation == 0:
-            idx = i
-            break
-
-    return idx
-
-
-def get_name_from_buffer(name):
-    if name in buffer_assignments_anf_ssa:
-        return buffer_assignments_anf_ssa[name].print(0)
-    return name
-
-
+# Restores the Python constructs marked by comments (# SSA-...) in the code generated from ANF
 def post_processing_anf_to_python(code):
-    output = ''
-    lines = code.split('\n')
-    skip = 0
-
-    # iterate over ast and check comments for markers like aug assign then the next sasignment should be changed to an aug assign
-    for i in range(len(lines)):
-        if skip > 0:
-            skip -= 1
-            continue
-
-        line = lines[i]
-        line_strip = line.strip()
-        if ORIGINAL_COMMENT_MARKER + ' SSA-AugAssign' in line:
-            a, b, c, d = re.sub(r'(\w+)\s*=\s*(|.)\1\s*(.{1,2})\s*(.*)', r'\1;\2;\3;\4', lines[i + 1]).split(';')
-            output += f'{a} {c.strip()}= {b}{d}\n'
-            skip = 1
-        elif line_strip.startswith(ORIGINAL_COMMENT_MARKER + ' SSA-ForTuple'):
-            lines[i] = ''
-            var = lines[i + 1].strip().split(' ')[1]
-            j = 2
-            vars = []
-            while i + j < len(lines):
-                if lines[i + j] == '':
-                    j += 1
-                    continue
-                next_var = lines[i + j].split('=')[0].strip()
-                if ',' in next_var:
-                    next_var = '(' + next_var + ')'
-                vars.append(next_var)
-                lines[i + j] = ''
-                j += 1
-                if i + j == len(lines) or var not in lines[i + j]:
-                    break
-            lines[i + 1] = lines[i + 1].replace(var, '(' + ','.join(vars) + ')')
-        elif line_strip.startswith(ORIGINAL_COMMENT_MARKER + ' SSA-WithinFun-'):
-            fun_name = lines[i].replace(ORIGINAL_COMMENT_MARKER + ' SSA-WithinFun-', '').strip()
-            fun_end_idx = 0
-            j = 2
-            # Find start of target function
-            while not re.match(r'^ *def ' + fun_name + '.*', lines[i + j]):
-                j += 1
-                if i + j >= len(lines):
-                    break
-                line_indentation = len(re.findall(r"^ *", lines[i + j])[0])
-                # Save end of current function to be moved
-                if line_indentation == 0 and fun_end_idx == 0:
-                    fun_end_idx = i + j
-
-            if i + j < len(lines):
-                indentation = len(re.findall(r"^ *", lines[i + j])[0])
-
-                j2 = 1
-                if re.match(r'^\s*' + ORIGINAL_COMMENT_MARKER + ' SSA-WithinFun', lines[i + j + j2]):
-                    j2 += 1
-
-                if i + j + j2 < len(lines):
-                    target_indentation = indentation + 4
-                    if fun_end_idx == 0:
-                        lines = lines[i + j:i + j + j2] + [(' ' * target_indentation) + line for line in
-                                                           [lines[i - 1]] + lines[i + 1:i + j - 1]] + lines[i + j + j2:]
-                    else:
-                        lines = lines[fun_end_idx:i + j + j2] + [(' ' * target_indentation) + line for line in
-                                                                 [lines[i - 1]] + lines[i + 1:fun_end_idx]] + lines[
-                                                                                                              i + j + j2:]
-                    out = '\n'.join(output.split('\n')[:-2]) + post_processing_anf_to_python('\n'.join(lines))
-                    return out
-                else:
-                    output += line + '\n'
-            else:
-                output += line + '\n'
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-ClassStart' in line:
-            j = 1
-            while re.match('( )*' + ORIGINAL_COMMENT_MARKER + ' SSA-ClassEnd', lines[i + j]) is None:
-                lines[i + j] = lines[i + j][2:]
-                j += 1
-            lines[i + j] = ''
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-Import' in line:
-            lines[i + 1] = lines[i + 1].split('# ', 1)[1]
-            lines[i] = ''
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-SubscriptMultiDim-' in line:
-            info = lines[i].split('SSA-SubscriptMultiDim-')[1]
-            # var, count = info.split('-')
-            # line = lines[i + 1]
-            # pattern = re.escape(var) + r'\[[^\]]*\]' * int(count)
-            # content = re.search(pattern, line).group(0)
-            # line = line.replace(content, content.replace('][', ','))
-            line = replaceSpaces(lines[i + 1], ORIGINAL_COMMENT_MARKER)
-            line = line.replace(info, info.replace('][', ','))
-            lines[i + 1] = line
-            lines[i] = ''
-        elif '_str_format' in line_strip:
-            v3 = None
-            if '_str_format2' in line_strip:
-                start, content = line_strip.split('_str_format2', 1)
-                _, content, end = extract_main_parenthesis(content)
-                v1, v2 = re.sub(r'\(*(.*),(.*)\)*', r'\1;\2', content).split(';')
-            else:
-                start, content = line_strip.split('_str_format3', 1)
-                _, content, end = extract_main_parenthesis(content)
-                v1, v2, v3 = re.sub(r'\(*(.*),(.*[^\(\)]),(.*[^\(\)])\)*', r'\1;\2;\3', content).split(';')
-
-            gen_node = ast.parse('print(f\'{10:.3}\')')
-            n: ast.FormattedValue = gen_node.body[0].value.args[0].values[0]
-            n.value = ast.parse(v1)
-            n.conversion = int(v2)
-            n.format_spec = None
-
-            format = ''
-            if v3 is not None:
-                format = ':' + v3.strip().replace('\'', '')
-
-            out = start + ast.unparse(n)[1:-2] + format + '}\'' + end + '\n'
-            out = out.replace('\'', 'f\'', 1)
-            out = out.replace('ff\'', 'f\'', 1)
-            out = ast.unparse(ast.parse(out).body[0])
-            out = out.replace('\' + \'{', '{', 1)
-            out = out.replace('}\' + \'', '}', 1)
-            out = out.replace('\' + \'', '', 1)
-
-            lines[i] = out
-            return output + post_processing_anf_to_python('\n'.join(lines[i:]))
-
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-FuncSub' in line:
-            parts = lines[i + 1].split(' = ')
-            var = parts[0].strip()
-            val = parts[1].strip()
-            lines[i] = ''
-            lines[i + 1] = ''
-            lines[i + 2] = lines[i + 2].replace(var, val)
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-NamedExpr' in line:
-            var, val = re.sub(r'^ *(.*) = (.*)', r'\1;\2', lines[i + 1]).split(';')
-            start, var_part, end = re.sub(r'(.*)(([^a-zA-z]|^)' + var + '([^a-zA-z]|$))(.*)', r'\1;\2;\5',
-                                          lines[i + 2]).split(';')
-            lines[i + 2] = start + var_part.replace(var, '(' + var + ' := ' + val + ')') + end
-            skip = 1
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-Tuple' in line:
-            indentation = len(re.findall(r"^ *", lines[i + 1])[0])
-            var, value = re.sub(r'^ *(.*)\s=\s(.*)', r'\1;\2', lines[i + 1]).split(';')
-            j = 2
-            vars = []
-            while (var + '[') in lines[i + j]:
-                vars.append(lines[i + j].split(' = ')[0].strip())
-                j += 1
-            # parenthesis = line_strip.split(ORIGINAL_COMMENT_MARKER + ' SSA-Tuple')[1]
-            # part1 = '(' + ', '.join(vars) + ')' if parenthesis[0] == '1' else ', '.join(vars)
-            # part2 = '(' + value + ')' if parenthesis[1] == '1' else value
-            part1 = ', '.join(vars)
-            part2 = value
-            output += indentation * ' ' + part1 + ' = ' + part2 + '\n'
-            skip = len(vars) + 1
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-ListComp' in line or ORIGINAL_COMMENT_MARKER + ' SSA-SetComp' in line or ORIGINAL_COMMENT_MARKER + ' SSA-DictComp' in line:
-            variable = lines[i + 1].split('=')[0].strip()
-            j = 2
-            out = ''
-
-            while re.match(r'^ *for.*', lines[i + j]):
-                out = out + lines[i + j].split(':')[0].strip() + ' '
-                j += 1
-
-            if ORIGINAL_COMMENT_MARKER + ' SSA-DictComp' in line:
-                value = re.sub(r'^ *.*\[(.*)\] = (.*)', r'\1;\2', lines[i + j]).strip().split(';')
-                value = value[0] + ': ' + value[1]
+    tree = PostprocessTransformer().transform(ast.parse(code))
+    return ast.unparse(tree) + '\n'
+
+
+# Inverse of the PreprocessTransformer, the desugared statements following a marker are restored to the original
+# construct within a single traversal of the AST
+# The statements are visited from the last to the first one, the code following a marker is already restored when the
+# marker is handled (a list comprehension is restored after the for loop within it)
+class PostprocessTransformer(ast.NodeTransformer):
+    _CONTAINER_ATTRS = ['body', 'handlers', 'orelse', 'finalbody']
+    _MARKER = ORIGINAL_COMMENT_MARKER + ' SSA-'
+
+    def __init__(self):
+        # Statement lists enclosing the statement visited and the index of the statement within each of them
+        self.scopes = []
+        # Functions to be moved into their parent function (SSA-WithinFun) with their position, the statement list
+        # containing them and the marker
+        self.nested_functions = []
+        # Positions and function definitions by name, a function later in the code gets a lower position because the
+        # functions are visited in reverse order
+        self.functions = {}
+        self.function_count = 0
+
+    def transform(self, tree):
+        tree.body = self.visit_stmts(tree.body)
+        self.move_nested_functions()
+        return tree
+
+    def visit_stmts(self, stmts):
+        scope = [stmts, len(stmts)]
+        self.scopes.append(scope)
+        idx = len(stmts) - 1
+        while idx >= 0:
+            scope[1] = idx
+            stmt = stmts[idx]
+            if is_comment(stmt):
+                if stmt.value.startswith(self._MARKER):
+                    self.restore_marker(stmts, idx, stmt.value[len(self._MARKER):])
             else:
-                value = re.sub(r'^ *' + variable + '\\.' + VAR_NAME_REGEX + '\((.*)\).*', r'\1', lines[i + j]).strip()
-
-            out = value + ' ' + out
-            if ORIGINAL_COMMENT_MARKER + ' SSA-ListComp' in line:
-                out = '[' + out + ']'
-            else:
-                out = '{' + out + '}'
-
-            output += lines[i + j + 1].replace(variable, out) + '\n'
-            skip = j + 1
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-Lambda' in line and 'def ' in lines[i - 1]:
-            if len(lines) > i + 3 or len(lines) > i + 2 and lines[i + 2] != '':
-                name, args = re.sub(r'def (.*)\((.*)\).*', r'\1;\2', lines[i - 1]).split(';')
-                name = name.strip()
-                code = lines[i + 1]
-                output = ''.join(output.split('\n')[:-2])
-                lines[i - 1] = ''
-                lines[i] = ''
-                lines[i + 1] = ''
-                j = 2
-                while i + j < len(lines):
-                    lines[i + j] = re.sub(name, 'lambda ' + args + ': ' + code.replace('return', '', 1), lines[i + j])
-                    j += 1
-                skip = 1
-            output += lines[i] + '\n'
-        elif line_strip.startswith(ORIGINAL_COMMENT_MARKER + ' SSA-SubscriptSet'):
-            indentation, var, subscript, value = re.sub(r'^( *)(.*) = .*\((.*),(.*),(.*)\).*', r'\1;\2;\4;\5',
-                                                        lines[i + 1]).split(';')
-            output += indentation + var + '[' + subscript + '] = ' + value + '\n'
-            skip = 1
-        elif line_strip.startswith(ORIGINAL_COMMENT_MARKER + ' SSA-AnnAssign'):
-            indentation = len(re.findall(r"^ *", lines[i + 1])[0])
-            _, t, simple = line_strip.split('|')
-            p1, p2 = lines[i + 1].strip().split(' = ')
-            new_line = (indentation * ' ') + p1 + ': ' + t + ' = ' + p2 + '\n'
-            if simple == '0':
-                new_line = (indentation * ' ') + '(' + p1 + '): ' + t + ' = ' + p2 + '\n'
-            output += new_line
-            skip = 1
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-FOR' in line and len(lines) > i + 5:
-            indentation = len(re.findall(r"^ *", lines[i + 1])[0])
-            _, arr = re.sub(r'^ *(.*)\s=\s(.*)', r'\1;\2', lines[i + 1]).split(';')
-            variable, _ = re.sub(r'^ *(.*)\s=\s(.*)', r'\1;\2', lines[i + 2]).split(';')
-            indentation2 = len(re.findall(r"^ *", lines[i + 5])[0])
-            j = 5
-            while lines[i + j].startswith(indentation2 * ' '):
-                j += 1
-                if i + j == len(lines):
-                    break
-            # For loop without brak in main body
-            if 'next(_SSA_' in lines[j - 1]:
-                loop_body = lines[i + 5:j - 1]
-            else:  # For loop with break in main body (no next assignment at end of loop body)
-                loop_body = lines[i + 5:j]
-
-            code_after = []
-            if i + j < len(lines):
-                code_after = lines[i + j:]
-
-            lines = [indentation * ' ' + 'for ' + variable + ' in ' + arr + ':\n'] + loop_body + code_after
-            return output + post_processing_anf_to_python('\n'.join(lines))
-        elif ORIGINAL_COMMENT_MARKER + ' SSA-IfExp' in line:
-            indentation = len(re.findall(r"^ *", lines[i + 2])[0])
-            if_term = re.sub(r'^(.*)if (.*):(.)*', r'\2', lines[i + 1])
-            ssa_var, if_val = re.sub(r'^ *(.*)\s=\s(.*)', r'\1;\2', lines[i + 2]).split(';')
-            j = 3
-            while not (lines[i + j].startswith(indentation * ' ' + ssa_var)):
-                j += 1
-            else_block = [line[4:] for line in lines[i + 6:i + j]]
-            else_val = re.sub(r'^ *(.*)\s=\s(.*)', r'\2', lines[i + j])
-            j += 1
-            while not (lines[i + j].startswith((indentation - 4) * ' ') and ssa_var in lines[i + j]):
-                j += 1
-                if i + j == len(lines):
-                    break
-            if_exp = if_val + ' if ' + if_term + ' else ' + else_val
-            line = lines[i + j].replace(ssa_var, if_exp)
-
-            code_after = []
-            if i + j + 1 < len(lines):
-                code_after = lines[i + j + 1:]
-
-            lines = [line] + else_block + code_after
-            return output + post_processing_anf_to_python('\n'.join(lines))
-        elif line_strip.startswith(ORIGINAL_COMMENT_MARKER + ' SSA-Attribute'):
-            indentation, buffer, type, attr, var = re.sub(r'^( *)(.*) = _obj(2|)_(' + VAR_NAME_REGEX + ')\((.*)\)$',
-                                                          r'\1;\2;\3;\4;\5', lines[i + 1]).split(';')
-            params = ''
-            # TODO Search for commans not within parenthesis, meaning there are multiple variables
-            parts = split_at_comma(var)
-            if len(parts) > 1:
-                var, params = parts[0], ','.join(parts[1:])
-
-            j = 2
-            while i + j < len(lines) and re.match('.*' + buffer + '(?![A-Za-z0-9_])', lines[i + j]) is None:
-                j += 1
-            if i + j == len(lines):
-                output += lines[i] + '\n'
-            else:
-                lines[i] = ''
-                lines[i + 1] = ''
-                if type == '2':
-                    lines[i + j] = lines[i + j].replace(buffer, var + '.' + attr + '(' + params + ')')
-                else:
-                    lines[i + j] = lines[i + j].replace(buffer, var + '.' + attr)
-
-                return output + post_processing_anf_to_python('\n'.join(lines[i + 2:]))
+                self.visit_stmt(stmt)
+                if isinstance(stmt, ast.FunctionDef):
+                    self.restore_function(stmts, idx)
+            idx -= 1
+        self.scopes.pop()
+        return stmts
+
+    # Nested statements are visited before the expressions of the statement, later fields first
+    def visit_stmt(self, node):
+        for field, value in reversed(list(ast.iter_fields(node))):
+            if field in self._CONTAINER_ATTRS and isinstance(value, list):
+                for item in reversed(value):
+                    if isinstance(item, ast.ExceptHandler):
+                        self.visit_stmt(item)
+                if field != 'handlers':
+                    setattr(node, field, self.visit_stmts(value))
+            elif isinstance(value, list):
+                setattr(node, field, [self.visit(v) if isinstance(v, ast.AST) else v for v in value])
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.visit(value))
+
+    # Parts of formatted strings are concatenated calls of _str_format2 (value, conversion) and _str_format3 (value,
+    # conversion, format spec)
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in ['_str_format2', '_str_format3']:
+            format_spec = None
+            if len(node.args) > 2:
+                format_spec = to_joined_str(node.args[2])
+            return ast.JoinedStr(values=[ast.FormattedValue(value=node.args[0], conversion=ast.literal_eval(node.args[1]),
+                                                            format_spec=format_spec)])
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Add) and is_str_part(node.left) and is_str_part(node.right) and (
+                isinstance(node.left, ast.JoinedStr) or isinstance(node.right, ast.JoinedStr)):
+            return ast.JoinedStr(values=join_str_values(to_joined_str(node.left).values,
+                                                        to_joined_str(node.right).values))
+        return node
+
+    def restore_marker(self, stmts, idx, marker):
+        name = re.split(r'[-|]', marker, maxsplit=1)[0]
+        handler = getattr(self, 'restore_' + name, None)
+        if name == 'SubscriptMultiDim' or handler is not None and idx + 1 < len(stmts):
+            handler(stmts, idx, marker)
+
+    # Statements following the one at the index in the order of the code lines, including the ones of enclosing blocks
+    def iter_following(self, stmts, idx):
+        for i in range(idx + 1, len(stmts)):
+            yield from iter_lines(stmts[i])
+        for outer, outer_idx in reversed(self.scopes[:-1]):
+            for i in range(outer_idx + 1, len(outer)):
+                yield from iter_lines(outer[i])
+
+    # Replaces the variable in the first following line using it, returns whether a line was found
+    def replace_first_use(self, stmts, idx, name, new_node):
+        for line in self.iter_following(stmts, idx):
+            if replace_name_in_line(line, name, new_node):
+                return True
+        return False
+
+    def restore_AugAssign(self, stmts, idx, marker):
+        assign = stmts[idx + 1]
+        if is_assign(assign) and isinstance(assign.value, ast.BinOp):
+            stmts[idx:idx + 2] = [ast.copy_location(ast.AugAssign(target=assign.targets[0], op=assign.value.op,
+                                                                  value=assign.value.right), assign)]
+
+    def restore_AnnAssign(self, stmts, idx, marker):
+        annotation, simple = marker.split('|', 1)[1].rsplit('|', 1)
+        stmt = stmts[idx + 1]
+        if is_assign(stmt):
+            target, value = stmt.targets[0], stmt.value
+        elif isinstance(stmt, ast.Expr):
+            target, value = stmt.value, None
+            target.ctx = ast.Store()
         else:
-            output += line + ('' if (i == len(lines) - 1 and line == '') else '\n')
-    return output
-
-
-def split_at_comma(string):
-    result = []
-    current_part = ''
-    braces_count = 0
-    ap_count = 0
-
-    for char in string:
-        if char == ',' and braces_count == 0 and ap_count == 0:
-            result.append(current_part.strip())
-            current_part = ''
+            return
+        stmts[idx:idx + 2] = [ast.copy_location(ast.AnnAssign(target=target,
+                                                              annotation=ast.parse(annotation, mode='eval').body,
+                                                              value=value, simple=int(simple)), stmt)]
+
+    def restore_SubscriptSet(self, stmts, idx, marker):
+        assign = stmts[idx + 1]
+        if is_assign(assign) and isinstance(assign.value, ast.Call) and len(assign.value.args) == 3:
+            target = assign.targets[0]
+            target.ctx = ast.Load()
+            _, key, value = assign.value.args
+            stmts[idx:idx + 2] = [ast.copy_location(
+                ast.Assign(targets=[ast.Subscript(value=target, slice=key, ctx=ast.Store())], value=value), assign)]
+
+    def restore_SubscriptMultiDim(self, stmts, idx, marker):
+        # The marker is dropped even if the subscript did not survive, e.g. in an annotation
+        subscript = marker.split('-', 1)[1]
+        for node in (n for stmt in stmts[idx + 1:idx + 2] for n in ast.walk(stmt)):
+            if isinstance(node, ast.Subscript) and replaceSpaces(ast.unparse(node), ORIGINAL_COMMENT_MARKER) == subscript:
+                dims = []
+                value = node
+                while isinstance(value, ast.Subscript):
+                    dims.insert(0, value.slice)
+                    value = value.value
+                node.value = value
+                node.slice = ast.Tuple(elts=dims, ctx=ast.Load())
+                break
+        del stmts[idx]
+
+    def restore_Import(self, stmts, idx, marker):
+        if is_comment(stmts[idx + 1]):
+            stmts[idx:idx + 2] = ast.parse(
+                stmts[idx + 1].value.split(ORIGINAL_COMMENT_MARKER + ' ', 1)[1].strip()).body
+
+    # The class is kept as comment between the markers SSA-ClassStart and SSA-ClassEnd
+    def restore_ClassStart(self, stmts, idx, marker):
+        end = idx + 1
+        while end < len(stmts) and not (is_comment(stmts[end]) and stmts[end].value == self._MARKER + 'ClassEnd'):
+            end += 1
+        if end < len(stmts):
+            code = '\n'.join(c.value[len(ORIGINAL_COMMENT_MARKER) + 1:] for c in stmts[idx + 1:end])
+            stmts[idx:end + 1] = ast.parse(code).body
+
+    def restore_FuncSub(self, stmts, idx, marker):
+        assign = stmts[idx + 1]
+        if is_assign(assign, True) and idx + 2 < len(stmts):
+            replace_name_in_line(stmts[idx + 2], assign.targets[0].id, assign.value)
+            del stmts[idx:idx + 2]
+
+    def restore_NamedExpr(self, stmts, idx, marker):
+        assign = stmts[idx + 1]
+        if is_assign(assign, True) and idx + 2 < len(stmts):
+            name = assign.targets[0].id
+            replace_name_in_line(stmts[idx + 2], name, ast.NamedExpr(target=assign.targets[0], value=assign.value),
+                                 1)
+            del stmts[idx:idx + 2]
+
+    # The elements of the tuple are assigned from the buffer variable after the assignment of the buffer variable
+    def restore_Tuple(self, stmts, idx, marker):
+        assign = stmts[idx + 1]
+        if not is_assign(assign, True):
+            return
+        end = idx + 2
+        while end < len(stmts) and is_assign(stmts[end]) and is_subscript_of(stmts[end].value,
+                                                                             assign.targets[0].id):
+            end += 1
+        targets = [s.targets[0] for s in stmts[idx + 2:end]]
+        stmts[idx:end] = [ast.copy_location(ast.Assign(targets=[ast.Tuple(elts=targets, ctx=ast.Store())],
+                                                       value=assign.value), assign)]
+
+    # The elements of the tuple are assigned from the iterator variable at the start of the loop body
+    def restore_ForTuple(self, stmts, idx, marker):
+        loop = stmts[idx + 1]
+        if not (isinstance(loop, ast.For) and isinstance(loop.target, ast.Name)):
+            return
+        end = 0
+        while end < len(loop.body) and is_assign(loop.body[end]) and is_subscript_of(loop.body[end].value,
+                                                                                    loop.target.id):
+            end += 1
+        loop.target = ast.Tuple(elts=[s.targets[0] for s in loop.body[:end]], ctx=ast.Store())
+        del loop.body[:end]
+        del stmts[idx]
+
+    # A for loop is desugared into the iterator, the first next call, the check of the loop variable and the loop body
+    # ending with the next call
+    def restore_FOR(self, stmts, idx, marker):
+        if idx + 4 >= len(stmts):
+            return
+        iterator, first, _, check = stmts[idx + 1:idx + 5]
+        if not (is_assign(iterator) and is_assign(first) and isinstance(check, ast.If)):
+            return
+        body = check.body
+        last = body[-1]
+        # For loops with break in the main body have no next call at the end
+        if is_assign(last) and isinstance(last.value, ast.Call) and isinstance(last.value.func, ast.Name) and \
+                last.value.func.id == 'next':
+            del body[-1]
+        stmts[idx:idx + 5] = [ast.copy_location(ast.For(target=first.targets[0], iter=iterator.value, body=body,
+                                                        orelse=check.orelse), iterator)]
+
+    def restore_ListComp(self, stmts, idx, marker):
+        self.restore_comprehension(stmts, idx, marker)
+
+    def restore_SetComp(self, stmts, idx, marker):
+        self.restore_comprehension(stmts, idx, marker)
+
+    def restore_DictComp(self, stmts, idx, marker):
+        self.restore_comprehension(stmts, idx, marker)
+
+    # A comprehension is desugared into the empty collection, the nested loops adding the elements to it and the
+    # statement using it
+    def restore_comprehension(self, stmts, idx, marker):
+        if idx + 3 >= len(stmts) or not is_assign(stmts[idx + 1], True):
+            return
+        name = stmts[idx + 1].targets[0].id
+        generators = []
+        node = stmts[idx + 2]
+        while isinstance(node, ast.For):
+            generators.append(ast.comprehension(target=node.target, iter=node.iter, ifs=[], is_async=0))
+            node = node.body[0]
+        if len(generators) == 0:
+            return
+        if marker == 'DictComp':
+            if not (is_assign(node) and isinstance(node.targets[0], ast.Subscript)):
+                return
+            comprehension = ast.DictComp(key=node.targets[0].slice, value=node.value, generators=generators)
         else:
-            current_part += char
-            if char == '(' or char == '[':
-                braces_count += 1
-            elif char == ')' or char == ']':
-                braces_count -= 1
-            if char == '\'' and ap_count % 2 == 0:
-                ap_count += 1
-            elif char == '\'' and ap_count % 2 == 1:
-                ap_count -= 1
-
-    if current_part:
-        result.append(current_part.strip())
-
-    return result
-
-
-def extract_main_parenthesis(input):
-    indentation = 0
-    start = 0
-    for i in range(len(input)):
-        if input[i] == '(':
-            indentation += 1
-            if indentation == 1:
-                start = i + 1
-        if input[i] == ')':
-            indentation -= 1
-            if indentation == 0:
-                if len(input) > i + 1:
-                    return input[:start], input[start:i], input[i + 1:]
-                return input[:start], input[start:i], ''
+            if not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) and len(node.value.args) > 0):
+                return
+            elt = node.value.args[0]
+            if marker == 'ListComp':
+                comprehension = ast.ListComp(elt=elt, generators=generators)
+            else:
+                comprehension = ast.SetComp(elt=elt, generators=generators)
+        replace_name_in_line(stmts[idx + 3], name, comprehension)
+        del stmts[idx:idx + 3]
+
+    # The branches of the if statement assign the values to the buffer variable used in a following line
+    def restore_IfExp(self, stmts, idx, marker):
+        node = stmts[idx + 1]
+        if not (isinstance(node, ast.If) and len(node.body) == 1 and len(node.orelse) == 1 and
+                is_assign(node.body[0], True) and is_assign(node.orelse[0], True)):
+            return
+        name = node.body[0].targets[0].id
+        if_exp = ast.IfExp(test=node.test, body=node.body[0].value, orelse=node.orelse[0].value)
+        if self.replace_first_use(stmts, idx + 1, name, if_exp):
+            del stmts[idx:idx + 2]
+
+    # Attributes are assigned to a buffer variable by calling _obj_<attribute>(object) and method calls by calling
+    # _obj2_<method>(object, parameters)
+    def restore_Attribute(self, stmts, idx, marker):
+        assign = stmts[idx + 1]
+        if not (is_assign(assign, True) and isinstance(assign.value, ast.Call) and
+                isinstance(assign.value.func, ast.Name) and len(assign.value.args) > 0):
+            return
+        call = assign.value
+        match = re.match(r'^_obj(2|)_(.*)$', call.func.id)
+        if match is None:
+            return
+        node = ast.Attribute(value=call.args[0], attr=match.group(2), ctx=ast.Load())
+        if match.group(1) == '2':
+            node = ast.Call(func=node, args=call.args[1:], keywords=call.keywords)
+        if self.replace_first_use(stmts, idx + 1, assign.targets[0].id, node):
+            del stmts[idx:idx + 2]
+
+    # Lambdas are desugared into functions returning the expression
+    def restore_function(self, stmts, idx):
+        fun = stmts[idx]
+        markers = []
+        for stmt in fun.body:
+            if not (is_comment(stmt) and stmt.value.startswith(self._MARKER)):
+                break
+            markers.append(stmt.value[len(self._MARKER):])
+        body = fun.body[len(markers):]
+        if 'Lambda' in markers and len(body) == 1 and isinstance(body[0], ast.Return):
+            if self.replace_first_use(stmts, idx, fun.name, ast.Lambda(args=fun.args, body=body[0].value)):
+                del stmts[idx]
+                return
+        position = self.function_count
+        self.function_count += 1
+        self.functions.setdefault(fun.name, []).append((position, fun))
+        for marker in markers:
+            if marker.startswith('WithinFun-'):
+                self.nested_functions.append((position, fun, stmts, marker))
+
+    # The functions defined within a function are placed in front of it, they are moved to the start of the first
+    # function with the name of the parent after them
+    def move_nested_functions(self):
+        for position, fun, stmts, marker in reversed(self.nested_functions):
+            parents = [f for f in self.functions.get(marker[len('WithinFun-'):], []) if f[0] < position]
+            if len(parents) == 0:
+                continue
+            parent = max(parents, key=itemgetter(0))[1]
+            stmts.remove(fun)
+            fun.body = [s for s in fun.body if not (is_comment(s) and s.value == self._MARKER + marker)]
+            parent.body.insert(0, fun)
+
+
+def is_assign(node, to_name=False):
+    return isinstance(node, ast.Assign) and len(node.targets) == 1 and (
+            not to_name or isinstance(node.targets[0], ast.Name))
+
+
+def is_subscript_of(node, name):
+    return isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == name
+
+
+# Statement and the statements nested in it in the order of the code lines
+def iter_lines(node):
+    yield node
+    for field in PostprocessTransformer._CONTAINER_ATTRS:
+        for child in getattr(node, field, None) or []:
+            yield from iter_lines(child)
+
+
+# Replaces the variable within the line of a statement, for compound statements only the first line (if test, loop
+# target and iterator, ...) is searched, returns whether the variable was found
+def replace_name_in_line(line, name, node, limit=None):
+    replacer = NameReplacer(name, node, limit)
+    for field, value in ast.iter_fields(line):
+        if field in PostprocessTransformer._CONTAINER_ATTRS:
+            continue
+        if isinstance(value, list):
+            setattr(line, field, [replacer.visit(v) if isinstance(v, ast.AST) else v for v in value])
+        elif isinstance(value, ast.AST):
+            setattr(line, field, replacer.visit(value))
+    return replacer.count > 0
+
+
+# Replaces the variables with the given name by the node, up to the limit of replacements if one is given
+class NameReplacer(ast.NodeTransformer):
+    def __init__(self, name, node, limit=None):
+        self.name = name
+        self.node = node
+        self.limit = limit
+        self.count = 0
+
+    def visit_Name(self, node):
+        if node.id != self.name or self.count == self.limit:
+            return node
+        new_node = self.node if self.count == 0 else copy.deepcopy(self.node)
+        self.count += 1
+        if 'ctx' in new_node._fields:
+            new_node.ctx = node.ctx
+        return new_node
+
+
+def is_str_part(node):
+    return isinstance(node, ast.JoinedStr) or (isinstance(node, ast.Constant) and isinstance(node.value, str))
+
+
+def to_joined_str(node):
+    if isinstance(node, ast.JoinedStr):
+        return node
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return ast.JoinedStr(values=[node])
+    return ast.JoinedStr(values=[ast.FormattedValue(value=node, conversion=-1, format_spec=None)])
+
+
+# Concatenated parts of formatted strings, adjacent constants are merged
+def join_str_values(values1, values2):
+    if len(values1) > 0 and len(values2) > 0 and isinstance(values1[-1], ast.Constant) and isinstance(
+            values2[0], ast.Constant):
+        return values1[:-1] + [ast.Constant(value=values1[-1].value + values2[0].value)] + values2[1:]
+    return values1 + values2
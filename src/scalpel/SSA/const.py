@@ -6,7 +6,8 @@ import scalpel.ast_comments as ast
 import astor
 from functools import reduce
 from collections import OrderedDict
-import networkx as nx
+from .alg import block_dominance
+from ..cfg.compact import CompactCFG
 from ..core.vars_visitor import get_vars
 from ..functions import get_global_unique_name
 
@@ -39,6 +40,8 @@ class SSA:
         self.ssa_blocks = []
         self.error_paths = {}
         self.dom = {}
+        # dominance information of the cfgs by the ids of their blocks, shared between compute_DF and compute_DTree
+        self.dominance = {}
 
         self.block_ident_gen = {}
         self.block_ident_use = {}
@@ -174,20 +177,25 @@ class SSA:
 
         return block_renamed_loaded, ident_const_dict
 
-    def compute_SSA2(self, cfg, used_var_names = {}, parent_vars = {}, function_vars = []):
+    def compute_SSA2(self, cfg, used_var_names = {}, parent_vars = {}, function_vars = [], pruned = False):
         """
         Compute single static assignment form representations for a given CFG.
         During the computing, constant value and alias pairs are generated. The following steps are used to compute SSA representations:
         step 1a: compute the dominance frontier
-        step 1b: use dominance frontier to place phi node
+        step 1b: use the iterated dominance frontier to place phi node
         if node X contains assignment to a, put phi node for an in dominance frontier of X
-        adding phi function may require introducing additional phi function
+        the phi node is an assignment itself, so the dominance frontier of its block gets a phi node as well
+        in the pruned form only variables live at the beginning of a block get a phi node
         start from the entry node
         step2: rename variables so only one definition per name
 
+        The blocks are numbered by their index in the compact copy of the CFG, the results are keyed by the block ids.
         Args:
-            cfg: a control flow graph.
+            cfg: a control flow graph or its compact copy.
+            pruned: place phi nodes only for live variables.
         """
+        graph = cfg if isinstance(cfg, CompactCFG) else cfg.compact()
+        n_blocks = len(graph)
 
         # to count how many times a var is defined
         ident_name_counter = {}
@@ -203,55 +211,53 @@ class SSA:
 
         # constant assignment dict
         ident_const_dict = {}
-        # step 1a: compute the dominance frontier
-        all_blocks = cfg.get_all_blocks()
-        id2blocks = {block.id: block for block in all_blocks}
 
-        block_loaded_idents = {block.id: [] for block in all_blocks}
-        block_stored_idents = {block.id: [] for block in all_blocks}
+        block_loaded_idents = [[] for _ in range(n_blocks)]
+        block_stored_idents = [[] for _ in range(n_blocks)]
 
-        block_const_dict = {block.id: [] for block in all_blocks}
+        block_const_dict = [None] * n_blocks
 
-        block_renamed_stored = {block.id: [] for block in all_blocks}
-        block_renamed_loaded = {block.id: [] for block in all_blocks}
+        block_renamed_stored = [[] for _ in range(n_blocks)]
+        block_renamed_loaded = [[] for _ in range(n_blocks)]
 
-        block_renamed_phi_stored = {block.id: [] for block in all_blocks}
-        block_renamed_phi_loaded = {block.id: [] for block in all_blocks}
+        block_renamed_phi_stored = [[] for _ in range(n_blocks)]
+        block_renamed_phi_loaded = [[] for _ in range(n_blocks)]
 
-        block_phi_variables_needed = {block.id: [] for block in all_blocks}
+        block_phi_variables_needed = [{} for _ in range(n_blocks)]
 
-        DF = self.compute_DF(all_blocks)
+        # step 1a: compute the dominance frontier
+        DF = graph.index_dominance().frontiers
 
         # Initialize the load and store variables for each statement in each block
         # and save the constant assignments as well
-        for block in all_blocks:
-            df_nodes = DF[block.id]
+        stmt_start = graph.stmt_start
+        for b in range(n_blocks):
             tmp_const_dict = {}
 
-            for idx, stmt in enumerate(block.statements):
+            for idx, stmt in enumerate(graph.statements[stmt_start[b]:stmt_start[b + 1]]):
                 stmt_const_dict = {}
                 stored_idents, loaded_idents, func_names = self.get_stmt_idents_ctx(stmt,
                                                  [], const_dict=stmt_const_dict, used_var_names=used_var_names, parent_vars=parent_vars)
                 tmp_const_dict[idx] = stmt_const_dict
-                block_loaded_idents[block.id] += [loaded_idents]
-                block_stored_idents[block.id] += [stored_idents]
-                block_renamed_loaded[block.id] += [{ident: set() for ident in loaded_idents}]
+                block_loaded_idents[b].append(loaded_idents)
+                block_stored_idents[b].append(stored_idents)
+                block_renamed_loaded[b].append({ident: set() for ident in loaded_idents})
 
-            block_const_dict[block.id] = tmp_const_dict
+            block_const_dict[b] = tmp_const_dict
 
-        self.lookup_phi_placements(DF, all_blocks, block_phi_variables_needed, block_stored_idents)
+        live_in = self.compute_liveness(graph, block_loaded_idents, block_stored_idents) if pruned else None
+        self.lookup_phi_placements(DF, block_phi_variables_needed, block_stored_idents, live_in)
 
         # For each block
-        for block in all_blocks:
-            stored_idents = block_stored_idents[block.id]
-            loaded_idents = block_loaded_idents[block.id]
+        for b in range(n_blocks):
+            stored_idents = block_stored_idents[b]
+            loaded_idents = block_loaded_idents[b]
             n_stmts = len(stored_idents)
             assert (n_stmts == len(loaded_idents))
-            affected_idents = []
-            tmp_const_dict = block_const_dict[block.id]
+            tmp_const_dict = block_const_dict[b]
 
             # Preset store variables for phi assignments to have correct renaming numbering
-            for phi_var in block_phi_variables_needed[block.id]:
+            for phi_var in block_phi_variables_needed[b]:
                 if phi_var in ident_name_counter:
                     ident_name_counter[phi_var] += 1
                 else:
@@ -259,7 +265,7 @@ class SSA:
 
                 stmt_renamed_stored = {}
                 stmt_renamed_stored[phi_var] = ident_name_counter[phi_var]
-                block_renamed_phi_stored[block.id] += [stmt_renamed_stored]
+                block_renamed_phi_stored[b].append(stmt_renamed_stored)
 
             # For each statement in the current block
             for i in range(n_stmts):
@@ -269,10 +275,9 @@ class SSA:
                 # Assign the renamed loaded variables as load names
                 # This has to happen before the stored variable renaming otherwise
                 # assignments to a variable depending on its old value are not working like b = b + 1
+                # a list of dictionaries for each of idents used in this statement
+                phi_loaded_idents = block_renamed_loaded[b][i]
                 for ident in stmt_loaded_idents:
-                    stmt_renamed_stored = {}
-                    # a list of dictionaries for each of idents used in this statement
-                    phi_loaded_idents = block_renamed_loaded[block.id][i]
                     if ident in ident_name_counter:
                         phi_loaded_idents[ident].add(ident_name_counter[ident])
 
@@ -281,7 +286,6 @@ class SSA:
                 # so that there is no reassignment
                 # Assign the renamed stored variable names
                 for ident in stmt_stored_idents:
-                    affected_idents.append(ident)
                     if ident in ident_name_counter:
                         ident_name_counter[ident] += 1
                     else:
@@ -293,71 +297,131 @@ class SSA:
 
                     if not isinstance(ident_name_counter[ident], ast.FunctionDef):
                         stmt_renamed_stored[ident] = ident_name_counter[ident]
-                block_renamed_stored[block.id] += [stmt_renamed_stored]
+                block_renamed_stored[b].append(stmt_renamed_stored)
+
+        # Last version of every variable assigned in each block, the phi assignments come after the statements
+        block_last_versions = [self.get_last_versions(block_renamed_stored[b] + block_renamed_phi_stored[b]) for b in range(n_blocks)]
 
         # Set the loaded variable names for the phi assignments in all blocks
         # This is done at last, to have all predecessors already initialized
-        for block in all_blocks:
-            stored_idents = block_stored_idents[block.id]
-            loaded_idents = block_loaded_idents[block.id]
-            n_stmts = len(stored_idents)
-            assert (n_stmts == len(loaded_idents))
-
+        for b in range(n_blocks):
             # Preset variables for phi assignments in upcoming blocks
-            for phi_var in block_phi_variables_needed[block.id]:
+            for phi_var in block_phi_variables_needed[b]:
                 stmt_renamed_loaded = {}
-                stmt_renamed_loaded[phi_var] = list(self.recursive_find_var_usages_in_predecessors(phi_var, block_renamed_stored, block_renamed_phi_stored, block.predecessors))
+                stmt_renamed_loaded[phi_var] = list(self.find_var_versions_in_predecessors(phi_var, block_last_versions, graph.predecessors(b)))
                 # Phi assignment is only needed if there are multiple possible values, not for example there is an if statement where a local variable is used and not set before the if block
                 if len(stmt_renamed_loaded[phi_var]) > 1:
-                    block_renamed_phi_loaded[block.id] += [stmt_renamed_loaded]
+                    block_renamed_phi_loaded[b].append(stmt_renamed_loaded)
                 else:
                     # Otherwise we do not add the assignment and need to remove the previously added stored phi
                     i = 0
-                    for bb in block_renamed_phi_stored[block.id]:
+                    for bb in block_renamed_phi_stored[b]:
                         if phi_var in bb.keys():
                             idx = i
                         i += 1
-                    del block_renamed_phi_stored[block.id][idx]
-        return block_renamed_stored, block_renamed_loaded, block_renamed_phi_stored, block_renamed_phi_loaded, ident_const_dict
+                    del block_renamed_phi_stored[b][idx]
+                    block_last_versions[b] = self.get_last_versions(block_renamed_stored[b] + block_renamed_phi_stored[b])
 
+        ids = graph.ids.tolist()
+        return (dict(zip(ids, block_renamed_stored)), dict(zip(ids, block_renamed_loaded)),
+                dict(zip(ids, block_renamed_phi_stored)), dict(zip(ids, block_renamed_phi_loaded)), ident_const_dict)
 
-    def lookup_phi_placements(self, DF, all_blocks, block_phi_variables_needed, block_stored_idents):
-        for block in all_blocks:
-            stored_idents = block_stored_idents[block.id]
-            n_stmts = len(stored_idents)
 
-            affected_idents = []
-            for i in range(n_stmts):
-                stmt_stored_idents = stored_idents[i]  # variables which are on the left side of an assignment etc.
+    def lookup_phi_placements(self, DF, block_phi_variables_needed, block_stored_idents, live_in=None):
+        """
+        Place phi nodes in the iterated dominance frontiers of the blocks assigning a variable (Cytron et al.)
+        Args:
+            DF: dominance frontiers of the blocks by their indices.
+            block_phi_variables_needed: the variables needing a phi node of each block, filled by this function.
+            block_stored_idents: stored variables of each statement in each block.
+            live_in: variables live at the beginning of each block, if given only live variables get a phi node.
+        """
+        # blocks assigning each variable in the order of the first assignment
+        def_blocks = {}
+        for b, stored_idents in enumerate(block_stored_idents):
+            for stmt_stored_idents in stored_idents:
                 for ident in stmt_stored_idents:
-                    affected_idents.append(ident)
-
-            df_block_ids = DF[block.id]
-            for df_block_id in df_block_ids:
-                for af_ident in affected_idents:
-                    if af_ident not in block_phi_variables_needed[df_block_id]:
-                        block_phi_variables_needed[df_block_id].append(af_ident)
-
-
-    def recursive_find_var_usages_in_predecessors(self, var_searched, block_renamed_stored, block_renamed_phi_stored, predecessors, searched_preds = []):
+                    def_blocks.setdefault(ident, {})[b] = None
+
+        for ident, blocks in def_blocks.items():
+            worklist = list(blocks)
+            has_phi = set()
+            while worklist:
+                b = worklist.pop()
+                for df_b in DF[b]:
+                    if df_b in has_phi:
+                        continue
+                    has_phi.add(df_b)
+                    if live_in is None or ident in live_in[df_b]:
+                        block_phi_variables_needed[df_b][ident] = None
+                    # the phi node assigns the variable as well
+                    if df_b not in blocks:
+                        worklist.append(df_b)
+
+    def compute_liveness(self, graph, block_loaded_idents, block_stored_idents):
+        """
+        Compute the variables live at the beginning of each block with a backward worklist
+        Args:
+            graph: the compact copy (CompactCFG) of a control flow graph, the blocks are given by their indices.
+            block_loaded_idents: loaded variables of each statement in each block.
+            block_stored_idents: stored variables of each statement in each block.
+        """
+        n_blocks = len(graph)
+        # variables used before being assigned and assigned variables of each block
+        uses = []
+        defs = []
+        for b in range(n_blocks):
+            used = set()
+            defined = set()
+            # the loads of a statement happen before its stores (b = b + 1)
+            for loaded_idents, stored_idents in zip(block_loaded_idents[b], block_stored_idents[b]):
+                used.update(ident for ident in loaded_idents if ident not in defined)
+                defined.update(stored_idents)
+            uses.append(used)
+            defs.append(defined)
+
+        live_in = [set(used) for used in uses]
+        succ_start, succ = graph.succ_start, graph.succ
+        pred_start, pred = graph.pred_start, graph.pred
+        # the last blocks are processed first as the liveness flows backwards
+        worklist = list(range(n_blocks))
+        queued = bytearray(b'\x01') * n_blocks
+        while worklist:
+            b = worklist.pop()
+            queued[b] = 0
+            live_out = set()
+            for k in range(succ_start[b], succ_start[b + 1]):
+                live_out |= live_in[succ[k]]
+            new_live_in = uses[b] | (live_out - defs[b])
+            if new_live_in != live_in[b]:
+                live_in[b] = new_live_in
+                for k in range(pred_start[b], pred_start[b + 1]):
+                    p = pred[k]
+                    if not queued[p]:
+                        queued[p] = 1
+                        worklist.append(p)
+        return live_in
+
+
+    def get_last_versions(self, renamed_stored):
+        last_versions = {}
+        for var_dict in renamed_stored:
+            last_versions.update(var_dict)
+        return last_versions
+
+    def find_var_versions_in_predecessors(self, var_searched, block_last_versions, predecessors):
+        """
+        Find the versions of a variable assigned last in the predecessor blocks
+        Args:
+            var_searched: the variable name.
+            block_last_versions: the last version of each variable assigned in each block.
+            predecessors: indices of the predecessor blocks.
+        """
         nrs = set()
-
-        for pred in predecessors:
-            if pred in searched_preds:
-                continue
-            found = False
-            pred = pred.source
-            highest_nr = -1
-            if pred.id in block_renamed_stored and pred.id in block_renamed_phi_stored:
-                for var_dict in block_renamed_stored[pred.id] + block_renamed_phi_stored[pred.id]:
-                    for var in var_dict.keys():
-                        if var == var_searched:
-                            highest_nr = var_dict[var]
-
+        for p in predecessors:
+            highest_nr = block_last_versions[p].get(var_searched, -1)
             if highest_nr >= 0: # found an entry
                 nrs.add(highest_nr)
-            else:
-                nrs.union(self.recursive_find_var_usages_in_predecessors(var_searched, block_renamed_stored, block_renamed_phi_stored, pred.predecessors, searched_preds + predecessors))
         return nrs
 
 
@@ -568,6 +632,21 @@ class SSA:
     def print_block(self, block):
         return block.get_source()
 
+    # compute the dominators, the dominator tree and the dominance frontiers at once
+    def compute_dominance(self, ssa_blocks):
+        """
+        Compute the dominance information of the blocks, the result is reused for the same blocks
+        Args:
+            ssa_blocks: blocks from a control flow graph or a CompactCFG (computed on its arrays).
+        """
+        if isinstance(ssa_blocks, CompactCFG):
+            return ssa_blocks.dominance()
+        key = tuple(id(block) for block in ssa_blocks)
+        if key not in self.dominance:
+            # the blocks are kept with the result so their ids are not reused
+            self.dominance[key] = (ssa_blocks, block_dominance(ssa_blocks))
+        return self.dominance[key][1]
+
     # compute the dominators
     def compute_idom(self, ssa_blocks):
         """
@@ -575,83 +654,23 @@ class SSA:
         Args:
             ssa_blocks: blocks from a control flow graph.
         """
-        # construct the Graph
-        entry_block = ssa_blocks[0]
-        G = nx.DiGraph()
-        for block in ssa_blocks:
-            G.add_node(block.id)
-            exits = block.exits
-            preds =  block.predecessors
-            for link in preds+exits:
-                G.add_edge(link.source.id, link.target.id)
-        # DF = nx.dominance_frontiers(G, entry_block.id)
-        idom = nx.immediate_dominators(G, entry_block.id)
-        return idom
+        return self.compute_dominance(ssa_blocks).idom
 
     # compute dominance frontiers
     def compute_DF(self, ssa_blocks):
         """
         Compute dominating frontiers for each of blocks
+        The entry block is part of the frontiers of the blocks of a loop back to it
         Args:
             ssa_blocks: blocks from a control flow graph.
         """
-        # construct the Graph
-        entry_block = ssa_blocks[0]
-        G = nx.DiGraph()
-        for block in ssa_blocks:
-            G.add_node(block.id)
-            exits = block.exits
-            preds = block.predecessors
-            for link in preds + exits:
-                G.add_edge(link.source.id, link.target.id)
-
-        # Add entry edge 0-1 and set starting node to 0
-        # -> so that the entry node is not in its own immediate dominator set
-        # This is due to a wrong behaviour of the nx library
-        # G.add_edge(0, entry_block.id)
-
-        # TODO: Check for networkx to implement fixes in idom calculation (idom = {start: None})
-        #       and in dominance frontiers to extend the if with (or u == start)
-        # DF = nx.dominance_frontiers(G, entry_block.id)
-
-        # Use this implementation if the library is not changed
-
-        # Add entry edge 0-1 and set starting node to 0
-        # -> so that the entry node is not in its own immediate dominator set
-        # This is due to a wrong behaviour of the nx library
-        G.add_edge(0, entry_block.id)
-        DF = nx.dominance_frontiers(G, 0)
-        return DF
+        return self.compute_dominance(ssa_blocks).frontiers
 
     def compute_DTree(self, ssa_blocks):
         """
-        Compute dominating frontiers for each of blocks
+        Compute the dominator tree, the children of each block in reverse order of the depth first search
         Args:
             ssa_blocks: blocks from a control flow graph.
         """
-        # construct the Graph
-        entry_block = ssa_blocks[0]
-        G = nx.DiGraph()
-        for block in ssa_blocks:
-            G.add_node(block.id)
-            exits = block.exits
-            preds = block.predecessors
-            for link in preds+exits:
-                G.add_edge(link.source.id, link.target.id)
-
-        # Use this implementation if the library is not changed
-
-        # Add entry edge 0-1 and set starting node to 0
-        # -> so that the entry node is not in its own immediate dominator set
-        # This is due to a wrong behaviour of the nx library
-        G.add_edge(0, entry_block.id)
-        idom = nx.immediate_dominators(G, 0)
-
-        dtree = {u: [] for u in idom}
-        for k,v in idom.items():
-            dtree[v].append(k)
-
-        for k,v in dtree.items():
-            v.reverse()
-        return dtree
+        return self.compute_dominance(ssa_blocks).tree
 
@@ -0,0 +1,106 @@
+import contextlib
+
+import scalpel.ast_comments as ast
+
+from scalpel.config import SSA_BUFFER_VAR_NAME, ANF_BUFFER_VAR_NAME
+from scalpel.SSA.symbols import SymbolTable
+
+
+# Signs printed in the SSA and ANF code of the output syntaxes
+ASCII_FONT = {'assign': '<-', 'phi': 'PHI', 'lambda_sign': 'lambda'}
+CODE_FONT = {'assign': '←', 'phi': 'φ', 'lambda_sign': 'λ'}
+
+
+# Font of the output syntax, 0: ASCII, otherwise the code signs
+def get_font(syntax: int):
+    return ASCII_FONT if syntax == 0 else CODE_FONT
+
+
+# State of a single transformation (Python -> SSA -> ANF)
+# Every transformation uses its own context, therefore independent files can be transformed concurrently
+class TransformContext:
+    def __init__(self, debug: bool = False, no_pos: bool = False, pruned_ssa: bool = False, instrumentation=None, function_cache=None, quiet: bool = False, parse_cache=None, output_syntax: int = 1):
+        # Shows more information and logs when True
+        self.debug = debug
+        # Warnings are only collected and not printed when True
+        self.quiet = quiet
+        # Warnings of the transformation (e.g. Python features which are not supported)
+        self.warnings = []
+        # Collects the timings and counters of the phases (scalpel.instrument.Instrumentation) if given
+        self.instrumentation = instrumentation
+        # Leave out the position information in the provenance info of the ANF output
+        self.no_pos = no_pos
+        # Only place phi assignments for variables which are live at the beginning of the block
+        self.pruned_ssa = pruned_ssa
+        # Signs used when printing the SSA and ANF code (see get_font)
+        self.font = get_font(output_syntax)
+        # Parsed trees and normalized codes of the session (scalpel.parse_cache.ParseCache) if given
+        self.parse_cache = parse_cache
+        # Functions of the previous transformation to be reused if unchanged (scalpel.incremental.FunctionCache) if given
+        self.function_cache = function_cache
+        self.reset_ssa()
+        self.reset_anf()
+
+    # Times the phase within the block if instrumentation is enabled
+    def phase(self, name: str):
+        if self.instrumentation is None:
+            return contextlib.nullcontext()
+        return self.instrumentation.phase(name)
+
+    # Parses the code, the tree can be changed by the caller
+    def parse(self, code: str):
+        if self.parse_cache is None:
+            return ast.parse(code)
+        return self.parse_cache.parse(code)
+
+    # Reformats the code by parsing and unparsing it
+    def normalize(self, code: str):
+        if self.parse_cache is None:
+            return ast.unparse(ast.parse(code))
+        return self.parse_cache.normalize(code)
+
+    # Reset the state used while transforming Python into SSA
+    def reset_ssa(self):
+        # SSA variable data of the CFG currently transformed
+        self.ssa_results_stored = {}
+        self.ssa_results_loads = {}
+        self.ssa_results_phi_stored = {}
+        self.ssa_results_phi_loads = {}
+        self.const_dict = {}
+
+        # Used variable names to prevent duplicate names
+        self.used_var_names = {}
+
+        # Versions of the variables as integer symbols, see scalpel.SSA.symbols
+        # Functions reused from an earlier transformation are copied into this table (see scalpel.incremental)
+        self.symbols = SymbolTable()
+
+        # Index for new buffer variables (postfix)
+        self.buffer_counter = 0
+
+        # Mapping of blocks to their corresponding label if already created
+        self.block_refs = {}
+
+        # Stores additional statements to be added at the end of the block
+        self.addon_statements_per_block = {}
+
+    # Reset the state used while transforming SSA into ANF
+    def reset_anf(self):
+        # SSA AST to be transformed
+        self.ssa_ast = None
+
+        # Buffer variables mapped to ANF nodes to replace more complex code due to only values being allowed to be used in function calls
+        self.buffer_assignments = {}
+        self.buffer_variable_counter = 0
+
+
+# Returns a new SSA buffer variable with a unique name
+def get_buffer_var(ctx: TransformContext):
+    ctx.buffer_counter = ctx.buffer_counter + 1
+    return SSA_BUFFER_VAR_NAME + str(ctx.buffer_counter - 1)
+
+
+# Get a new unique ANF buffer variable
+def get_buffer_variable(ctx: TransformContext):
+    ctx.buffer_variable_counter += 1
+    return ANF_BUFFER_VAR_NAME + str(ctx.buffer_variable_counter - 1)
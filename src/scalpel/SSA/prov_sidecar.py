@@ -0,0 +1,178 @@
+import re
+import sys
+import array
+import bisect
+import struct
+
+from scalpel.config import PROV_INFO_MARKER, PROV_INFO_EXT_CHAR, PROV_INFO_SPLIT_CHAR
+from scalpel.functions import split_chunks_into_lines
+from scalpel.SSA.context import TransformContext
+from scalpel.SSA.anf_syntax import ANFNode, get_anf_code_width, iter_anf_lines, iter_prov_chunks, tokenize_anf_code, parse_anf_e_from_code
+
+# Columnar format of the provenance info of ANF code, stored next to the plain ANF code instead of behind every line
+#
+# The provenance info of every code word (token) is its kind (v, c, bv, lc, fv, ...) followed by parts, which are
+# either positions (lineno:col,end_lineno:end_col) or tags (e.g. RET, names=a,b). Every part is one row of the columns:
+#   token       index of the code word
+#   line        line of the ANF code the word is on
+#   kind        index of the kind in the string table
+#   lineno, col, end_lineno, end_col    position of the part, -1 if the part is a tag
+#   tag         index of the tag in the string table, -1 if the part is a position
+# Words without parts have a single row with -1 as position and tag
+#
+# File layout (little endian): magic, number of rows and strings, the columns one after another as 32-bit integers
+# and the string table as length prefixed UTF-8 strings. The columns can be used directly from a memory mapped file
+MAGIC = b'ANFPROV1'
+HEADER = struct.Struct('<8sII')
+COLUMNS = ('token', 'line', 'kind', 'lineno', 'col', 'end_lineno', 'end_col', 'tag')
+position_pattern = re.compile(r'(\d+):(\d+),(\d+):(\d+)')
+
+
+class ProvColumns:
+    def __init__(self, columns: dict = None, strings: [str] = None):
+        self.columns = columns if columns is not None else {name: array.array('i') for name in COLUMNS}
+        self.strings = strings if strings is not None else []
+        self.string_ids = {s: i for i, s in enumerate(self.strings)}
+
+    def string_id(self, s: str) -> int:
+        string_id = self.string_ids.get(s)
+        if string_id is None:
+            string_id = self.string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return string_id
+
+    def __len__(self):
+        return len(self.columns['token'])
+
+    # Adds the rows of the provenance info of a code word
+    def add(self, token: int, line: int, info_word: str):
+        parts = info_word.split(PROV_INFO_EXT_CHAR)
+        kind = self.string_id(parts[0])
+        for part in parts[1:] or [None]:
+            match = position_pattern.fullmatch(part) if part is not None else None
+            position = [int(x) for x in match.groups()] if match is not None else [-1, -1, -1, -1]
+            tag = self.string_id(part) if part is not None and match is None else -1
+            for name, value in zip(COLUMNS, [token, line, kind] + position + [tag]):
+                self.columns[name].append(value)
+
+    # Provenance info of every code word as printed behind the ANF code
+    def info_words(self):
+        c = self.columns
+        words = []
+        for row in range(len(self)):
+            if row == 0 or c['token'][row] != c['token'][row - 1]:
+                words.append(self.strings[c['kind'][row]])
+            if c['lineno'][row] >= 0:
+                words[-1] += PROV_INFO_EXT_CHAR + '%d:%d,%d:%d' % self.position(row)
+            elif c['tag'][row] >= 0:
+                words[-1] += PROV_INFO_EXT_CHAR + self.strings[c['tag'][row]]
+        return words
+
+    # Provenance info of every line of the ANF code
+    def info_lines(self):
+        c = self.columns
+        words = self.info_words()
+        lines = []
+        for row in range(len(self)):
+            if row == 0 or c['token'][row] != c['token'][row - 1]:
+                while len(lines) <= c['line'][row]:
+                    lines.append([])
+                lines[c['line'][row]].append(words[c['token'][row]])
+        return [PROV_INFO_SPLIT_CHAR.join(line) for line in lines]
+
+    def position(self, row: int):
+        return (self.columns['lineno'][row], self.columns['col'][row], self.columns['end_lineno'][row], self.columns['end_col'][row])
+
+    # Positions of the code word in the Python code
+    def positions(self, token: int):
+        tokens = self.columns['token']
+        start = bisect.bisect_left(tokens, token)
+        end = bisect.bisect_right(tokens, token, start)
+        return [self.position(row) for row in range(start, end) if self.columns['lineno'][row] >= 0]
+
+    # Code words with a position containing the given position of the Python code
+    def tokens_at(self, lineno: int, col: int):
+        c = self.columns
+        found = []
+        for row in range(len(self)):
+            if c['lineno'][row] < 0 or (c['lineno'][row], c['col'][row]) > (lineno, col) or (lineno, col) >= (c['end_lineno'][row], c['end_col'][row]):
+                continue
+            if not found or found[-1] != c['token'][row]:
+                found.append(c['token'][row])
+        return found
+
+    def to_bytes(self):
+        parts = [HEADER.pack(MAGIC, len(self), len(self.strings))]
+        for name in COLUMNS:
+            column = self.columns[name]
+            if sys.byteorder == 'big':
+                column = array.array('i', column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        for s in self.strings:
+            data = s.encode('utf-8')
+            parts.append(struct.pack('<I', len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+    # Reads the columns from bytes or a memory mapped file, without copying them on little endian machines
+    @staticmethod
+    def from_bytes(data):
+        view = memoryview(data)
+        magic, rows, string_count = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError('Not an ANF provenance sidecar')
+        offset = HEADER.size
+        columns = {}
+        for name in COLUMNS:
+            column = view[offset:offset + rows * 4]
+            if sys.byteorder == 'big':
+                column = array.array('i', column.tobytes())
+                column.byteswap()
+            else:
+                column = column.cast('i')
+            columns[name] = column
+            offset += rows * 4
+        strings = []
+        for _ in range(string_count):
+            size, = struct.unpack_from('<I', view, offset)
+            strings.append(bytes(view[offset + 4:offset + 4 + size]).decode('utf-8'))
+            offset += 4 + size
+        return ProvColumns(columns, strings)
+
+
+# Plain ANF code (lines without trailing spaces) and the provenance columns of the ANF tree
+def build_anf_sidecar(anf_parent: ANFNode, ctx: TransformContext = None):
+    if ctx is None:
+        ctx = TransformContext()
+    code_lines = [line.rstrip() for line in iter_anf_lines(anf_parent, ctx.font)]
+    return '\n'.join(code_lines), get_prov_columns(split_chunks_into_lines(iter_prov_chunks(anf_parent, ctx)))
+
+
+# Splits ANF code with provenance info into the plain code and the provenance columns
+def split_anf_prov_info(anf_w_prov: str):
+    code_lines, info_lines = zip(*[tuple(line.rsplit(PROV_INFO_MARKER, 1)) for line in anf_w_prov.strip().split('\n')])
+    return '\n'.join(line.rstrip() for line in code_lines), get_prov_columns(info_lines)
+
+
+def get_prov_columns(info_lines):
+    columns = ProvColumns()
+    token = 0
+    for line_idx, info_line in enumerate(info_lines):
+        for info_word in info_line.strip().split(PROV_INFO_SPLIT_CHAR):
+            columns.add(token, line_idx, info_word)
+            token += 1
+    return columns
+
+
+# Joins the plain ANF code and the provenance columns into ANF code with provenance info
+def join_anf_prov_info(code: str, columns: ProvColumns):
+    code_lines = code.split('\n')
+    width = get_anf_code_width(code_lines)
+    return '\n'.join(line + (width - len(line) - line.count('\t') * 3) * ' ' + PROV_INFO_MARKER + info
+                     for line, info in zip(code_lines, columns.info_lines()))
+
+
+# Read plain ANF code and its provenance columns and parse it into internal ANF AST representation
+def parse_anf_from_sidecar(code: str, columns: ProvColumns):
+    return parse_anf_e_from_code(tokenize_anf_code(code.strip().split('\n')), columns.info_words())
@@ -8,11 +8,11 @@ from functools import reduce
 
 import ast_comments
 import astor
-import networkx as nx
 
 from ..cfg.builder import Block, CFGBuilder, invert
 from ..core.mnode import MNode
 from ..core.vars_visitor import get_vars
+from .alg import block_dominance
 
 
 def parse_val(node):
@@ -433,18 +433,7 @@ class SSA:
 
     # compute the dominators
     def compute_idom(self, ssa_blocks):
-        # construct the Graph
-        entry_block = ssa_blocks[0]
-        G = nx.DiGraph()
-        for block in ssa_blocks:
-            G.add_node(block.id)
-            exits = block.exits
-            preds = block.predecessors
-            for link in preds + exits:
-                G.add_edge(link.source.id, link.target.id)
-        # DF = nx.dominance_frontiers(G, entry_block.id)
-        idom = nx.immediate_dominators(G, entry_block.id)
-        return idom
+        return block_dominance(ssa_blocks).idom
 
     def RD(self, cfg_blocks):
         # worklist
@@ -1,18 +1,23 @@
 from __future__ import annotations
 import re
+import sys
+import copy
+import contextvars
 import ast as ast2
 from collections.abc import Iterable
-from functools import cmp_to_key
+from functools import cmp_to_key, lru_cache
+from operator import itemgetter
 
 from scalpel import ast_comments as ast
 from scalpel.core.mnode import MNode
 from scalpel.SSA.const import SSA
-from scalpel.functions import get_global_unique_name, get_global_unique_name_with_update, replaceSpaces
+from scalpel.SSA.context import TransformContext, get_buffer_var, CODE_FONT
+from scalpel.SSA.symbols import SymbolTable
+from scalpel.functions import get_global_unique_name, get_next_version, replaceSpaces
 from scalpel.config import ORIGINAL_COMMENT_MARKER, NEW_COMMENT_MARKER, SSA_BUFFER_VAR_NAME, BLOCK_IDENTIFIER
 
-debug_mode = True
-font = {'assign': '←',
-        'phi': 'φ'}
+# Font used by the SSA nodes while the SSA AST is printed, it is set by SSA_AST for the duration of its print
+print_font = contextvars.ContextVar('print_font', default=CODE_FONT)
 
 
 
@@ -33,105 +38,128 @@ operator_map = {
 }
 
 
-# Global variables to store SSA variable data while transforming a single CFG
-ssa_results_stored = {}
-ssa_results_loads = {}
-ssa_results_phi_stored = {}
-ssa_results_phi_loads = {}
-const_dict = {}
-original_code_lines = []
+# Span of a node without any position information (min of the start, max of the end)
+EMPTY_SPAN = (99999, 99999, 0, 0)
 
-# Global used variable names to prevent duplicate names
-used_var_names = {}
+# Number of positions shared between nodes with the same span, see Position.shared
+POSITION_CACHE_SIZE = 4096
 
-# Prefix for new variables from the transformation
-buffer_counter = 0  # Index for new buffer variables (postfix)
 
-# Mapping dict of nodes to their new buffer variable name to be replaced with when occurring in the translation
-buffer_assignments = {}
+def merge_spans(a: tuple | None, b: tuple | None) -> tuple | None:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+# Returns the span of all positions of the node and its children and appends the labels found within to labels
+# The positions of labels are only set when their block gets parsed, therefore they are resolved on each lookup
+# The span without the labels and the labels are stored on SSA nodes other than labels, blocks and procedures are only
+# looked up by the ANF transformation after the SSA of the module is complete
+def collect_child_span(node: any, labels: list) -> tuple | None:
+    if isinstance(node, SSANode):
+        if isinstance(node, SSA_L):
+            labels.append(node)
+            return None
+        if node.span_cache is None:
+            span = node.pos_info.span() if node.pos_info is not None else None
+            node_labels = []
+            for a in get_node_fields(type(node)):
+                v = getattr(node, a)
+                if v is not None:
+                    span = merge_spans(span, collect_child_span(v, node_labels))
+            # Jumps of many statements go to the same labels
+            node.span_cache = (span, tuple(dict.fromkeys(node_labels)))
+        span, node_labels = node.span_cache
+        labels += node_labels
+        return span
+    if isinstance(node, Position):
+        return node.span()
+    span = None
+    if isinstance(node, list):
+        for n in node:
+            span = merge_spans(span, collect_child_span(n, labels))
+    elif hasattr(node, '__dict__'):
+        # Other objects like ast nodes
+        if hasattr(node, 'lineno'):
+            span = (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+        for a, v in node.__dict__.items():
+            if v is not None and not a.startswith('__'):
+                span = merge_spans(span, collect_child_span(v, labels))
+    return span
 
-# Mapping of blocks to their corresponding label if already created
-block_refs = {}
 
-# Stores additional statments to be added at the end of the block
-addon_statements_per_block = {}
+# Span of all positions found in the node and its children, None if there are none
+def find_child_span(node: any) -> tuple | None:
+    labels = []
+    span = collect_child_span(node, labels)
+    for label in labels:
+        if label.pos_info is not None:
+            span = merge_spans(span, label.pos_info.span())
+    return span
 
-block_phi_assignment_vars = {}
-buffer_assignments_ssa_py = {}
 
-global_variables_used = {}
+# Attributes of a node class holding its children and values (all slots except the position information)
+@lru_cache(maxsize=None)
+def get_node_fields(node_class: type) -> tuple:
+    fields = []
+    for cls in reversed(node_class.__mro__):
+        fields += [f for f in cls.__dict__.get('__slots__', ()) if f not in ('pos_info', 'span_cache')]
+    return tuple(fields)
 
 
+# Names are interned so all nodes of the same variable share one string
+def intern_name(name):
+    return sys.intern(name) if type(name) is str else name
 
-def reset():
-    global ssa_results_stored,ssa_results_loads,ssa_results_phi_stored,ssa_results_phi_loads,const_dict,used_var_names,buffer_counter,buffer_assignments,block_refs,addon_statements_per_block,block_phi_assignment_vars,buffer_assignments_ssa_py
-    ssa_results_stored = {}
-    ssa_results_loads = {}
-    ssa_results_phi_stored = {}
-    ssa_results_phi_loads = {}
-    const_dict = {}
-    used_var_names = {}
-    buffer_counter = 0
-    buffer_assignments = {}
-    block_refs = {}
-    addon_statements_per_block = {}
-    block_phi_assignment_vars = {}
-    buffer_assignments_ssa_py = {}
 
+# Position of a node in the python code, nodes without position information span all positions of their children
+# A position is an immutable tuple (lineno, col_offset, end_lineno, end_col_offset) so nodes can share it
+class Position(tuple):
+    __slots__ = ()
 
-def find_child_positions(node: any, depth = 0) -> [Position]:
-    positions = []
+    def __new__(cls, node):
+        if node is not None and hasattr(node, 'lineno'):
+            span = (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+        else:
+            span = find_child_span(node) if node is not None else None
+        return tuple.__new__(cls, span if span is not None else EMPTY_SPAN)
 
-    if hasattr(node, '__dict__'):
-        if hasattr(node, 'lineno'):
-            positions.append(node)
-        if hasattr(node, 'pos_info'):
-            if node.pos_info is not None:
-                positions.append(node.pos_info)
-        if True: # depth == 0:
-            for a, v in node.__dict__.items():
-                if not a.startswith('__'):
-                    if v is not None:
-                        positions += find_child_positions(v, depth=depth + 1)
-    elif isinstance(node, list):
-        for n in node:
-            positions += find_child_positions(n, depth)
-    return positions
+    lineno = property(itemgetter(0))
+    col_offset = property(itemgetter(1))
+    end_lineno = property(itemgetter(2))
+    end_col_offset = property(itemgetter(3))
 
+    @staticmethod
+    def from_span(span: tuple):
+        return tuple.__new__(Position, span)
 
-class Position:
-    def __init__(self, node):
-        if node is not None and hasattr(node, 'lineno'):
-            self.lineno = node.lineno
-            self.col_offset = node.col_offset
-            self.end_lineno = node.end_lineno
-            self.end_col_offset = node.end_col_offset
-        elif node is not None:
-            positions = find_child_positions(node)
-            if len(positions) > 0:
-                self.lineno = 99999
-                self.col_offset = 99999
-                self.end_lineno = 0
-                self.end_col_offset = 0
-                for p in positions:
-                    self.lineno = min(self.lineno, p.lineno)
-                    self.end_lineno = max(self.end_lineno, p.end_lineno)
-                    self.col_offset = min(self.col_offset, p.col_offset)
-                    self.end_col_offset = max(self.end_col_offset, p.end_col_offset)
-        else:
-            self.lineno = 99999
-            self.col_offset = 99999
-            self.end_lineno = 0
-            self.end_col_offset = 0
+    # Nodes with the same span share one position
+    # The most recently used ones are kept so long running processes do not grow without bounds
+    @staticmethod
+    @lru_cache(maxsize=POSITION_CACHE_SIZE)
+    def shared(span: tuple):
+        return Position.from_span(span)
+
+    def span(self) -> tuple:
+        return tuple(self)
 
     def __str__(self):
-        return str(self.lineno) + ':' + str(self.col_offset) + ',' + str(self.end_lineno) + ':' + str(self.end_col_offset)
+        return str(self[0]) + ':' + str(self[1]) + ',' + str(self[2]) + ':' + str(self[3])
 
+    # Copies and pickles are created from the span, not from a node
+    def __reduce__(self):
+        return Position.from_span, (tuple(self),)
 
 
 class SSANode:
+    __slots__ = ('pos_info', 'span_cache')
+
     def __init__(self, pos_info: Position = None):
         self.pos_info = pos_info
+        # Span of the positions within this node once computed, see collect_child_span
+        self.span_cache = None
 
     def print(self, lvl):
         return 'not implemented'
@@ -139,18 +167,10 @@ class SSANode:
     def parse_to_python(self, lvl):
         return 'not implemented'
 
-    def enable_print_ascii(self):
-        global font
-        font = {'assign': '<-',
-                'phi': 'PHI'}
-
-    def enable_print_code(self):
-        global font
-        font = {'assign': '←',
-                'phi': 'φ'}
-
 
 class SSA_V(SSANode):
+    __slots__ = ('type',)
+
     def __init__(self, pos_info: Position = None):
         self.type = None
         super().__init__(pos_info=pos_info)
@@ -166,9 +186,11 @@ class SSA_V(SSANode):
 
 
 class SSA_L(SSA_V):
+    __slots__ = ('label',)
+
     def __init__(self, label: str, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
-        self.label: str = label
+        self.label: str = intern_name(label)
 
     def print(self, lvl):
         return f"{self.label}"
@@ -181,6 +203,8 @@ class SSA_L(SSA_V):
 
 
 class SSA_V_CONST(SSA_V):
+    __slots__ = ('value',)
+
     def __init__(self, value: str, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.value: str = value
@@ -196,9 +220,13 @@ class SSA_V_CONST(SSA_V):
 
 
 class SSA_V_VAR(SSA_V):
-    def __init__(self, name: str, pos_info: Position = None):
+    __slots__ = ('name', 'symbol')
+
+    def __init__(self, name: str, pos_info: Position = None, symbol: int = None):
         super().__init__(pos_info=pos_info)
-        self.name: str = name
+        self.name: str = intern_name(name)
+        # Symbol of the versioned variable in the symbol table of the SSA AST, None for other names
+        self.symbol: int = symbol
 
     def print(self, lvl):
         return f"{self.name}"
@@ -211,6 +239,8 @@ class SSA_V_VAR(SSA_V):
 
 
 class SSA_E(SSANode):
+    __slots__ = ()
+
     def __init__(self, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
 
@@ -225,6 +255,8 @@ class SSA_E(SSANode):
 
 
 class SSA_E_FUNC_CALL(SSA_E):
+    __slots__ = ('name', 'args', 'params_named')
+
     def __init__(self, name: SSA_L | SSA_V, args: [SSA_V], pos_info: Position = None, params_named: [str] = None):
         super().__init__(pos_info=pos_info)
         self.name: SSA_L | SSA_V = name
@@ -243,22 +275,28 @@ class SSA_E_FUNC_CALL(SSA_E):
 
 
 class SSA_E_ASS_PHI(SSA_E):
+    __slots__ = ('var', 'args')
+
     def __init__(self, var: SSA_V, args: [SSA_V], pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.var: SSA_V = var
         self.args: [SSA_V] = args
 
     def print(self, lvl):
+        font = print_font.get()
         return self.var.print(lvl) + ' ' + font['assign'] + ' ' + font['phi'] + print_args(self.args, lvl)
 
     def print_latex(self, lvl):
         return ""
 
     def parse_to_python(self, lvl):
+        font = print_font.get()
         return self.var.parse_to_python(lvl) + ' ' + font['assign'] + ' ' + font['phi'] + print_args_to_python(self.args, lvl)
 
 
 class SSA_E_COMM(SSA_E):
+    __slots__ = ('text',)
+
     def __init__(self, text: str, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.text: str = text
@@ -274,22 +312,26 @@ class SSA_E_COMM(SSA_E):
 
 
 class SSA_E_ASS(SSA_E):
+    __slots__ = ('var', 'value')
+
     def __init__(self, var: SSA_V, value: SSA_V, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.var: SSA_V = var
         self.value: SSA_V = value
 
     def print(self, lvl):
-        return f"{self.var.print(lvl)+ ' ' + font['assign'] + ' ' + self.value.print(lvl)}"
+        return f"{self.var.print(lvl)+ ' ' + print_font.get()['assign'] + ' ' + self.value.print(lvl)}"
 
     def print_latex(self, lvl):
         return ""
 
     def parse_to_python(self, lvl):
-        return f"{self.var.parse_to_python(lvl)+ ' ' + font['assign'] + ' ' + self.value.parse_to_python(lvl)}"
+        return f"{self.var.parse_to_python(lvl)+ ' ' + print_font.get()['assign'] + ' ' + self.value.parse_to_python(lvl)}"
 
 
 class SSA_E_GOTO(SSA_E):
+    __slots__ = ('label',)
+
     def __init__(self, label: SSA_L, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.label: SSA_L = label
@@ -305,6 +347,8 @@ class SSA_E_GOTO(SSA_E):
 
 
 class SSA_E_RET(SSA_E):
+    __slots__ = ('value',)
+
     def __init__(self, value: SSA_V | None, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.value: SSA_V | None = value
@@ -322,6 +366,8 @@ class SSA_E_RET(SSA_E):
 
 
 class SSA_E_IF_ELSE(SSA_E):
+    __slots__ = ('test', 'term_if', 'term_else')
+
     def __init__(self, test: SSA_V, term_if: SSA_E, term_else: SSA_E, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.test: SSA_V = test
@@ -341,6 +387,8 @@ class SSA_E_IF_ELSE(SSA_E):
 
 
 class SSA_B(SSANode):
+    __slots__ = ('label', 'terms', 'blocks', 'first_in_proc')
+
     def __init__(self, label: SSA_L, terms: [SSA_E], blocks: [SSA_B], first_in_proc: bool, pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.label: SSA_L = label
@@ -366,6 +414,8 @@ class SSA_B(SSANode):
 
 
 class SSA_P(SSANode):
+    __slots__ = ('name', 'args', 'blocks')
+
     def __init__(self, name: SSA_V_VAR, args: [SSA_V], blocks: [SSA_B], pos_info: Position = None):
         super().__init__(pos_info=pos_info)
         self.name: SSA_V_VAR = name
@@ -384,20 +434,35 @@ class SSA_P(SSANode):
 
 
 class SSA_AST(SSANode):
-    def __init__(self, procs: [SSA_P], blocks: [SSA_B], code: str, pos_info: Position = None):
+    __slots__ = ('procs', 'blocks', 'code', 'symbols', 'index', 'font')
+
+    def __init__(self, procs: [SSA_P], blocks: [SSA_B], code: str, pos_info: Position = None, symbols: SymbolTable = None, font: dict = CODE_FONT):
         super().__init__(pos_info=pos_info)
+        # Signs of the output syntax the tree is printed with (see TransformContext.font)
+        self.font = font
         self.procs: [SSA_P] = procs
         self.blocks: [SSA_B] = blocks
         self.code = code
+        self.symbols: SymbolTable = symbols
+        # Lookup tables of the blocks, built on first use (see get_ssa_index)
+        self.index: SSAIndex = None
 
     def print(self, lvl=0):
-        return '\n'.join([p.print() for p in self.procs]) + '\n\n'.join([b.print(lvl) for b in self.blocks]) #  + '\n' + self.ret_term.print(0)
+        token = print_font.set(self.font)
+        try:
+            return '\n'.join([p.print() for p in self.procs]) + '\n\n'.join([b.print(lvl) for b in self.blocks]) #  + '\n' + self.ret_term.print(0)
+        finally:
+            print_font.reset(token)
 
     def print_latex(self, lvl=0):
         return ""
 
     def parse_to_python(self, lvl):
-        return '\n'.join([p.parse_to_python() for p in self.procs]) + '\n\n'.join([b.parse_to_python(lvl) for b in self.blocks]) #  + '\n' + self.ret_term.print(0)
+        token = print_font.set(self.font)
+        try:
+            return '\n'.join([p.parse_to_python() for p in self.procs]) + '\n\n'.join([b.parse_to_python(lvl) for b in self.blocks]) #  + '\n' + self.ret_term.print(0)
+        finally:
+            print_font.reset(token)
 
 
 def print_args(args: [SSANode], lvl):
@@ -439,14 +504,67 @@ def get_block_by_id_blocks(blocks: [SSA_B], b_id: str) -> SSA_B | None:
 
 
 def get_block_by_id(ssa_ast: SSA_AST, b_id: str) -> SSA_B | None:
-    for p in ssa_ast.procs:
-        b = get_block_by_id_blocks(p.blocks, b_id)
-        if b is not None:
-            return b
-    b = get_block_by_id_blocks(ssa_ast.blocks, b_id)
-    if b is not None:
-        return b
-    return None
+    return get_ssa_index(ssa_ast).blocks.get(b_id)
+
+
+# All blocks of the main code and the procedures including the nested blocks
+def iter_ssa_blocks(ssa_ast: SSA_AST):
+    stack = [b for p in reversed(ssa_ast.procs) for b in reversed(p.blocks)] + list(reversed(ssa_ast.blocks))
+    while stack:
+        b = stack.pop()
+        yield b
+        if b.blocks is not None:
+            stack.extend(reversed(b.blocks))
+
+
+# Lookup tables of the blocks of an SSA AST, the SSA AST must not be changed after the index was built
+class SSAIndex:
+    def __init__(self, ssa_ast: SSA_AST):
+        # Blocks by label, the first block found in the procedures and the main code for duplicate labels
+        self.blocks = {}
+        for b in iter_ssa_blocks(ssa_ast):
+            self.blocks.setdefault(b.label.label, b)
+        # Blocks of the main code containing a block with the label in their blocks
+        self.parents = {}
+        if len(ssa_ast.blocks) > 0:
+            for parent in get_block_list_from_parent_block(ssa_ast.blocks[0]):
+                for label in dict.fromkeys(b.label.label for b in parent.blocks):
+                    self.parents.setdefault(label, []).append(parent)
+        # Phi assignments and symbols of the assigned variables of the blocks, filled on first use
+        self.phis = {}
+        self.assigned = {}
+        # Positions of the arguments of each phi assignment by their symbol
+        self.phi_args = {}
+        # Arguments of the jumps between two blocks
+        self.jump_vars = {}
+
+    def get_phis(self, b: SSA_B) -> [SSA_E_ASS_PHI]:
+        phis = self.phis.get(b)
+        if phis is None:
+            phis = self.phis[b] = [e for e in b.terms if isinstance(e, SSA_E_ASS_PHI)]
+        return phis
+
+    # Variables without a symbol (e.g. buffer variables) are left out, they are never arguments of phi assignments
+    def get_assigned(self, b: SSA_B) -> set:
+        assigned = self.assigned.get(b)
+        if assigned is None:
+            assigned = self.assigned[b] = {e.var.symbol for e in b.terms if isinstance(e, SSA_E_ASS)
+                                           and getattr(e.var, 'symbol', None) is not None}
+        return assigned
+
+    def get_phi_args(self, phi: SSA_E_ASS_PHI) -> dict:
+        args = self.phi_args.get(phi)
+        if args is None:
+            args = self.phi_args[phi] = {}
+            for i, arg in enumerate(phi.args):
+                args.setdefault(arg.symbol, []).append(i)
+        return args
+
+
+def get_ssa_index(ssa_ast: SSA_AST) -> SSAIndex:
+    if ssa_ast.index is None:
+        ssa_ast.index = SSAIndex(ssa_ast)
+    return ssa_ast.index
 
 
 def get_phi_vars_in_block(b: SSA_B) -> [str]:
@@ -457,45 +575,47 @@ def get_phi_vars_in_block(b: SSA_B) -> [str]:
     return phi_vars
 
 
+# Whether both SSA variables are versions of the same variable
+def is_same_variable(symbols: SymbolTable, a: SSA_V_VAR, b: SSA_V_VAR):
+    return a.symbol is not None and b.symbol is not None and symbols.base(a.symbol) == symbols.base(b.symbol)
+
+
+# Variables given to the phi assignments of b_to when jumping from b_from
+# The results are stored in the index of the SSA AST as the predecessors are searched for them again
 def get_phi_vars_for_jump(b_from: SSA_B, b_to: SSA_B, ssa_ast: SSA_AST) -> [str]:
-    var_names = []
+    index = get_ssa_index(ssa_ast)
+    vars_for_jump = index.jump_vars.get((b_from, b_to))
+    if vars_for_jump is not None:
+        return vars_for_jump
     vars_for_jump = []
 
-    # Get all assigned variable names in the from block
-    for e in b_from.terms:
-        if isinstance(e, SSA_E_ASS):
-            var_names.append(e.var.print(0))
+    # Get the symbols of all assigned variables in the from block
+    assigned = index.get_assigned(b_from)
 
     # Go over all phi assignments in the target block
-    for e in b_to.terms:
-        found = False
-        if isinstance(e, SSA_E_ASS_PHI):
-            # If one of the variables was assigned in the from block we use it as parameter for the jump
-            for phi_var in e.args:
-                if phi_var.print(0) in var_names:
-                    found = True
-                    vars_for_jump.append(phi_var)
-            # If the variable was not found it was not set in this branch and we have to use the variable from the
-            # predecessor blocks (if not found again, we serach through the pred. of the pred. etc.)
-            if not found:
-                for bl in get_block_list_from_parent_block(ssa_ast.blocks[0]):
-                    is_predecessor = False
-                    for bl2 in bl.blocks:
-                        if bl2.label.label == b_from.label.label:
-                            is_predecessor = True
-                    if is_predecessor:
-                        res = get_phi_vars_for_jump(bl, b_to, ssa_ast)
-                        if len(res) > 0:
-                            for var in res:
-                                if var.name.rsplit('_')[0] == e.var.name.rsplit('_')[0]:
-                                    vars_for_jump.append(var)
-                                    found = True
-
-            # If we did not find any assignment the variable was not set in this path and should be None
-            if not found:
-                vars_for_jump.append(SSA_V_VAR(None))
+    for e in index.get_phis(b_to):
+        # If one of the variables was assigned in the from block we use it as parameter for the jump
+        # The phi assignments of a join of many blocks have many arguments, only the assigned symbols are looked up
+        phi_args = index.get_phi_args(e)
+        positions = sorted(i for symbol in assigned for i in phi_args.get(symbol, ()))
+        vars_for_jump += [e.args[i] for i in positions]
+        found = len(positions) > 0
+        # If the variable was not found it was not set in this branch and we have to use the variable from the
+        # predecessor blocks (if not found again, we serach through the pred. of the pred. etc.)
+        if not found:
+            for bl in index.parents.get(b_from.label.label, ()):
+                res = get_phi_vars_for_jump(bl, b_to, ssa_ast)
+                for var in res:
+                    if is_same_variable(ssa_ast.symbols, var, e.var):
+                        vars_for_jump.append(var)
+                        found = True
+
+        # If we did not find any assignment the variable was not set in this path and should be None
+        if not found:
+            vars_for_jump.append(SSA_V_VAR(None))
 
     # return parameters for the jump
+    index.jump_vars[(b_from, b_to)] = vars_for_jump
     return vars_for_jump
 
 
@@ -506,11 +626,18 @@ def get_first_block_in_proc(blocks: [SSA_B]):
     return blocks[0]
 
 
-def get_block_list_from_parent_block(block: SSA_B, blocks = []):
-    for b in block.blocks:
-        if b not in blocks:
+# All blocks within the block in depth first order
+def get_block_list_from_parent_block(block: SSA_B, blocks: [SSA_B] = None):
+    if blocks is None:
+        blocks = []
+    seen = {id(b) for b in blocks}
+    stack = list(reversed(block.blocks))
+    while stack:
+        b = stack.pop()
+        if id(b) not in seen:
+            seen.add(id(b))
             blocks.append(b)
-            get_block_list_from_parent_block(b, blocks)
+            stack.extend(reversed(b.blocks))
     return blocks
 
 # Custom class to mock a cfg block
@@ -532,9 +659,8 @@ class ProvInfo:
 
 
 # Update the list of global names to include the new ones found in the last checked cfg
-def update_used_vars(vars_stored, constants):
-    global used_var_names
-    used_var_names.update(get_used_vars(vars_stored, constants))
+def update_used_vars(ctx, vars_stored, constants):
+    ctx.used_var_names.update(get_used_vars(vars_stored, constants))
 
 
 # Returns the variables set in the two given dicts together with their index
@@ -550,27 +676,6 @@ def get_used_vars(vars_stored, constants):
     return used_vars
 
 
-# Replace the content in lines corresponding to the position given with line[from:to] and col[from:to] with content
-def replace_code_with_content(lines, line_from, line_to, col_from, col_to, content):
-    l_idx = line_from
-    if line_from == line_to:
-        line = lines[line_from]
-        lines[line_from] = line[:col_from] + content + line[col_to:]
-    else:
-        while l_idx <= line_to:
-            line = lines[l_idx]
-            if l_idx == line_from:
-                lines[l_idx] = line[:col_from]
-            elif l_idx == line_to:
-                lines[l_idx] = ''
-            else:
-                lines[l_idx] = line[col_to:]
-            l_idx += 1
-
-
-# Preprocessing of Python code before parsing it into SSA
-# This function converts the following nodes into simpler nodes:
-# Lambda, ListComp
 def get_tab():
     return '   '
 
@@ -585,390 +690,288 @@ class bcolors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
-def preprocess_py_code(code):
-    replaced = True
-    while replaced:
-        replaced = False
-
-        # Fix code attributes in elif
-        lines = code.split('\n')
-        for i, line in enumerate(lines):
-            if re.match('^( )*elif', line) is not None:
-                indentation = len(re.findall(r"^ *", line)[0])
-                j = i - 1
-                moving_lines_idx = []
-                while j >= 0:
-                    indentation2 = len(re.findall(r"^ *", lines[j])[0])
-                    if indentation2 == indentation and lines[j].strip() != '':
-                        if re.match('^( )*if', lines[j]):
-                            break
-                        elif re.match('^( )*elif', lines[j]) is None:
-                            moving_lines_idx.append(j)
-                    j -= 1
-                if len(moving_lines_idx) > 0:
-                    for j2, idx in enumerate(moving_lines_idx):
-                        content = lines[idx + j2]
-                        lines[idx + j2] = ''
-                        lines.insert(j, content)
-                    replaced = True
-                if replaced:
-                    code = '\n'.join(lines)
-                    break
-        if replaced:
-            continue
-
-        if debug_mode:
-            print("Preprocessing code version:")
-            print(code)
-            print('')
-        code = code.replace('%_', 'temp_ssa_parsing_buffer_')
-
-        # Find ** Double Starred kwargs etc.
-        # code = replaceSpaces(code, ORIGINAL_COMMENT_MARKER)
-        # Define the regular expression pattern
-        pattern = r'(?<=\W) *\*\*([a-zA-Z0-9_]+)'
-        # Define a lambda function to determine replacement
-        replacer = lambda match: f'_Starred2({match.group(1)})'
-        # Perform the replacement using re.sub()
-        code = re.sub(pattern, replacer, code)
-
-        tree = ast.parse(code)
-        for node in ast.walk(tree):
-            # Check for not handled Nodes
-            if isinstance(node, ast.Subscript):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                parts = line.split(ast.unparse(node))
-                if len(parts) > 1 and '=' in parts[1]:
-                    print(bcolors.WARNING + "Warning: Subscript on left side of assignment found. This behaviour is not implemented" + bcolors.ENDC)
-            elif isinstance(node, ast.Try) or isinstance(node, ast.ExceptHandler) or isinstance(node, ast.With):
-                print(bcolors.WARNING + "Warning: " + type(node).__name__ + " found. This behaviour is not implemented" + bcolors.ENDC)
-
-            if isinstance(node, ast.ClassDef):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                indentation = len(re.findall(r"^ *", line)[0])
-
-                for i in range(node.lineno - 1, node.end_lineno):
-                    lines[i] = ORIGINAL_COMMENT_MARKER + ' ' + lines[i]
-
-                lines.insert(node.lineno - 1, indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-ClassStart')
-                lines.insert(node.end_lineno + 1, indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-ClassEnd')
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.Import) or isinstance(node, ast.ImportFrom):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                indentation = len(re.findall(r"^ *", line)[0])
-                lines[node.lineno - 1] = ORIGINAL_COMMENT_MARKER + ' ' + lines[node.lineno - 1]
-                lines.insert(node.lineno - 1, indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-Import')
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Subscript):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                indentation = len(re.findall(r"^ *", line)[0])
-                buffer_var = get_buffer_var()
-                lines[node.lineno - 1] = line.replace(ast.unparse(node.func), buffer_var)
-                lines.insert(node.lineno - 1, indentation * ' ' + buffer_var + ' = ' + ast.unparse(node.func))
-                lines.insert(node.lineno - 1, indentation * ' ' + '# SSA-FuncSub')
-
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.Lambda):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                buffer_var = get_buffer_var()
-                replace_code_with_content(lines, node.lineno - 1, node.end_lineno - 1, node.col_offset, node.end_col_offset, buffer_var)
-
-                new_lines = []
-                indentation = len(re.findall(r"^ *", line)[0])
-                new_lines.append(indentation * ' ' + 'def ' + buffer_var + '(' + ast.unparse(node.args) + '):')
-                indentation += 4
-                # For a lambda the comment is placed after the first responsible code line
-                # because a function will be parsed into a proc and no code is written in front of the proc
-                new_lines.append(indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-Lambda')
-                new_lines += [(' ' * indentation + body_l) for body_l in ('return ' + ast.unparse(node.body)).split('\n')]
-                lines = lines[:node.lineno - 1] + new_lines + lines[node.lineno - 1:]
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.NamedExpr):
-                if not 'ssa' in node.target.id:
-                    lines = code.split('\n')
-                    line = lines[node.lineno - 1]
-                    #buffer_var = get_buffer_var()
-                    #if len(lines[node.lineno - 1]) == (node.end_col_offset - node.col_offset):
-                    #    lines[node.lineno - 1] = ''
-                    #else:
-                    #    lines[node.lineno - 1] = line[:node.col_offset] + buffer_var + line[node.end_col_offset:]
-
-                    lines[node.lineno - 1] = line[:node.col_offset] + ' ' + node.target.id + ' ' + line[node.end_col_offset:]
-                    new_lines = []
-                    indentation = len(re.findall(r"^ *", line)[0])
-                    new_lines.append(indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-NamedExpr')
-                    new_lines.append(indentation * ' ' + node.target.id + ' = ' + ast.unparse(node.value))
-                    lines = lines[:node.lineno - 1] + new_lines + lines[node.lineno - 1:]
-                    code = '\n'.join(lines)
-                    replaced = True
-                break
-            elif isinstance(node, ast.For):
-                # Check for tuple in iterator variables
-                if isinstance(node.target, ast.Tuple):
-                    lines = code.split('\n')
-                    line = lines[node.lineno - 1]
-                    buffer_var = get_buffer_var()
-                    indentation = len(re.findall(r"^ *", line)[0])
-                    lines[node.lineno - 1] = line.replace(ast.unparse(node.target), buffer_var, 1)
-
-                    lines.insert(node.lineno - 1, (indentation) * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-ForTuple')
-                    for i, elt in enumerate(node.target.elts):
-                        lines.insert(node.lineno + 1 + i, (indentation + 4) * ' ' + ast.unparse(elt) + ' = ' + buffer_var + '[' + str(i) + ']')
-                    code = '\n'.join(lines)
-                    replaced = True
-                    break
-
-                # Check for no single statement at the end of the body
-                _CONTAINER_ATTRS = ["body", "handlers", "orelse", "finalbody"]
-                last_node = node.body[-1]
-                for attr in _CONTAINER_ATTRS:
-                    if items := getattr(last_node, attr, None):
-                        if not isinstance(items, Iterable):
-                            continue
-                        node.body.append(ast.parse(ORIGINAL_COMMENT_MARKER + ' SSA-Placeholder').body[0])
-                        replaced = True
-                        code = ast.unparse(tree)
-                        break
-                if replaced:
-                    break
-            elif isinstance(node, ast.DictComp):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                buffer_var = get_buffer_var()
-                lines[node.lineno - 1] = line[:node.col_offset] + buffer_var + line[node.end_col_offset:]
-
-                new_lines = []
-                indentation = len(re.findall(r"^ *", line)[0])
-                starting_indentation = indentation
-                new_lines.append(indentation * ' ' + buffer_var + ' = {}')
-                for g in node.generators:
-                    new_lines.append(indentation * ' ' + 'for ' + ast.unparse(g.target) + ' in ' + ast.unparse(g.iter) + ':')
-                    indentation += 4
-                new_lines.append(indentation * ' ' + buffer_var + '[' +ast.unparse(node.key) + '] = ' + ast.unparse(node.value))
-                lines = lines[:node.lineno - 1] + new_lines + lines[node.lineno - 1:]
-                lines.insert(node.lineno - 1, starting_indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-DictComp')
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.ListComp):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                buffer_var = get_buffer_var()
-                lines[node.lineno - 1] = line[:node.col_offset] + buffer_var + line[node.end_col_offset:]
-
-                new_lines = []
-                indentation = len(re.findall(r"^ *", line)[0])
-                original_indentation = indentation
-                new_lines.append(indentation * ' ' + buffer_var + ' = []')
-                for g in node.generators:
-                    new_lines.append(indentation * ' ' + 'for ' + ast.unparse(g.target) + ' in ' + ast.unparse(g.iter) + ':')
-                    indentation += 4
-                new_lines.append(indentation * ' ' + buffer_var + '.append(' + ast.unparse(node.elt) + ')')
-                lines = lines[:node.lineno - 1] + new_lines + lines[node.lineno - 1:]
-                lines.insert(node.lineno - 1, original_indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-ListComp')
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.SetComp):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                buffer_var = get_buffer_var()
-                lines[node.lineno - 1] = line[:node.col_offset] + buffer_var + line[node.end_col_offset:]
-
-                new_lines = []
-                indentation = len(re.findall(r"^ *", line)[0])
-                new_lines.append(indentation * ' ' + buffer_var + ' = {}')
-                for g in node.generators:
-                    new_lines.append(indentation * ' ' + 'for ' + ast.unparse(g.target) + ' in ' + ast.unparse(g.iter) + ':')
-                    indentation += 4
-                new_lines.append(indentation * ' ' + buffer_var + '.add(' + ast.unparse(node.elt) + ')')
-                lines = lines[:node.lineno - 1] + new_lines + lines[node.lineno - 1:]
-                lines.insert(node.lineno - 1, indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-SetComp')
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            #elif node.__class__.__name__ == 'List':
-            #    lines = code.split('\n')
-            #    line = lines[node.lineno - 1]
-            #    if re.match(r'^( *)\[(.*)\] = (.*)', line):
-            #        start, vars, value = re.sub(r'^( *)\[(.*)\] = (.*)', r'\1;\2;\3', line).split(';')
-            #        lines[node.lineno - 1] = start + '(' + vars + ') = ' + value
-            #        code = '\n'.join(lines)
-            #        replaced = True
-            #        break
-            elif isinstance(node, ast.AugAssign):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                indentation = len(re.findall(r"^ *", line)[0])
-
-                new_code = ast.unparse(node.target) + ' = ' + ast.unparse(node.target) + ' ' + operator_map[type(node.op)] + ' (' + ast.unparse(node.value) + ')'
-                lines[node.lineno - 1] = line[:node.col_offset] + new_code + line[node.end_col_offset:]
-                lines = lines[:node.lineno - 1] + [(indentation * ' ') + ORIGINAL_COMMENT_MARKER + ' SSA-AugAssign'] + lines[node.lineno - 1:]
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.IfExp):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                buffer_var = get_buffer_var()
-                lines[node.lineno - 1] = line[:node.col_offset] + buffer_var + line[node.end_col_offset:]
-
-                indentation = len(re.findall(r"^ *", line)[0])
-                new_code = (indentation * ' ' + ORIGINAL_COMMENT_MARKER + ' SSA-IfExp\n'
-                            + indentation * ' ' + 'if ' + ast.unparse(node.test) + ':\n' \
-                            + indentation * ' ' + get_tab() + buffer_var + ' = ' + ast.unparse(node.body) + '\n' \
-                            + indentation * ' ' + 'else:\n' \
-                            + indentation * ' ' + get_tab() + buffer_var + ' = ' + ast.unparse(node.orelse))
-                lines.insert(node.lineno - 1, new_code)
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.AnnAssign):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                value_str = ''
-                if hasattr(node, 'value'):
-                    value_str = ' = ' + ast.unparse(node.value)
-                lines[node.lineno - 1] = line[:node.col_offset] + ast.unparse(node.target) + value_str + line[node.end_col_offset:]
-
-                indentation = len(re.findall(r"^ *", line)[0])
-                new_code = (indentation * ' ') + ORIGINAL_COMMENT_MARKER + ' SSA-AnnAssign|' + ast.unparse(node.annotation) + '|' + str(node.simple)
-                lines.insert(node.lineno - 1, new_code)
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif (isinstance(node, ast.Assign)
-                  and (isinstance(node.targets[0], ast.Tuple)
-                    or isinstance(node.targets[0], ast.List)
-                    or isinstance(node.targets[0], ast2.List))):
-                tuple_name = get_buffer_var()
-
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-                indentation = len(re.findall(r"^ *", line)[0])
-
-                lines[node.lineno - 1] = (indentation * ' ') + ORIGINAL_COMMENT_MARKER + ' SSA-Tuple'
-                # If value side contains multiple values
-                if hasattr(node.value, 'elts'):
-                    lines.insert(node.lineno,
-                                 (indentation * ' ') + tuple_name + ' = ' + '_new_tuple_' + str(len(node.targets[0].elts)) + '(' + ','.join(
-                                     [ast.unparse(var) for var in node.value.elts]) + ')')
-                else:
-                    # If value side contains just one value like a function call which will return multiple values
-                    lines.insert(node.lineno, (indentation * ' ') + tuple_name + ' = ' + ast.unparse(node.value))
-                for idx, var in enumerate(node.targets[0].elts):
-                    lines.insert(node.lineno + idx + 1, (indentation * ' ') + ast.unparse(var) + ' = ' + '_Tuple_Get(' + tuple_name + ', ' + str(idx) + ')')
 
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.Subscript):
-
-                original = ast.unparse(node)
-                o_parts = original.rsplit('[')
-                o_parts[0] += '['
-                if ',' in o_parts[1]:
-                    changed = o_parts[0] + o_parts[1].replace(',', '][')
-                    lines = code.split('\n')
-                    line = lines[node.lineno - 1]
-                    indentation = len(re.findall(r"^ *", line)[0])
-                    line = line.replace(original, changed)
-                    lines[node.lineno - 1] = line
-                    new_code = (indentation * ' ') + ORIGINAL_COMMENT_MARKER + ' SSA-SubscriptMultiDim-' + replaceSpaces(changed, ORIGINAL_COMMENT_MARKER)
-                    lines.insert(node.lineno - 1, new_code)
-                    code = '\n'.join(lines)
-                    replaced = True
-                    break
-            elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0],ast.Subscript):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-
-                indentation = len(re.findall(r"^ *", line)[0])
-                if isinstance(node.targets[0].value, ast.Subscript):
+def is_comment(node) -> bool:
+    return node.__class__.__name__ == ast.Comment.__name__
+
+
+# Desugars complex nodes (Lambda, ListComp, IfExp, Attribute, tuple assignments, ...) into simpler statements
+# Every desugaring is marked by a '# SSA-*' comment in front of the generated code which is used to restore the
+# original code when parsing back from ANF
+# All desugarings are applied within a single traversal of the AST, statements generated by a desugaring are visited
+# right away so nested nodes are handled in the same pass
+class PreprocessTransformer(ast.NodeTransformer):
+    _CONTAINER_ATTRS = ['body', 'handlers', 'orelse', 'finalbody']
+    _STMT_LIST_ATTRS = ['body', 'orelse', 'finalbody']
+
+    def __init__(self, code, ctx: TransformContext):
+        self.ctx = ctx
+        self.code_lines = code.split('\n')
+        # Statements to be inserted in front of the statement currently visited
+        self.hoisted = []
+        self.warnings = set()
+
+    def transform(self, tree):
+        tree.body = self.visit_stmts(tree.body)
+        return ast.fix_missing_locations(tree)
+
+    def warn(self, msg):
+        if msg not in self.warnings:
+            self.warnings.add(msg)
+            self.ctx.warnings.append(msg)
+            if not self.ctx.quiet:
+                print(bcolors.WARNING + "Warning: " + msg + bcolors.ENDC)
+
+    @staticmethod
+    def marker(name):
+        return ast.Comment(value=ORIGINAL_COMMENT_MARKER + ' SSA-' + name, inline=False)
+
+    def hoist(self, marker, stmts):
+        if marker is not None:
+            self.hoisted.append(self.marker(marker))
+        stmts = self.visit_stmts(stmts)
+        self.hoisted.extend(stmts)
+
+    def visit_stmts(self, stmts):
+        out = []
+        for stmt in stmts:
+            out += self.visit_stmt(stmt)
+        return out
+
+    # Returns the list of statements the given statement is desugared into
+    def visit_stmt(self, stmt):
+        if is_comment(stmt):
+            return [stmt]
+
+        desugared = self.desugar_stmt(stmt)
+        if desugared is not None:
+            return desugared
+
+        markers = []
+        if isinstance(stmt, ast.For):
+            markers = self.desugar_for(stmt)
+        elif isinstance(stmt, ast.Try) or isinstance(stmt, ast.With):
+            self.warn(type(stmt).__name__ + " found. This behaviour is not implemented")
+
+        outer_hoisted = self.hoisted
+        self.hoisted = []
+        if isinstance(stmt, ast.If):
+            self.visit_if(stmt)
+        else:
+            self.visit_stmt_fields(stmt)
+        hoisted = self.hoisted
+        self.hoisted = outer_hoisted
+        return markers + hoisted + [stmt]
+
+    def visit_stmt_fields(self, node):
+        for field, value in ast.iter_fields(node):
+            if field in self._STMT_LIST_ATTRS and isinstance(value, list):
+                setattr(node, field, self.visit_stmts(value))
+            elif field in ['handlers', 'cases']:
+                for handler in value:
+                    if isinstance(handler, ast.ExceptHandler):
+                        self.warn("ExceptHandler found. This behaviour is not implemented")
+                    self.visit_stmt_fields(handler)
+            elif isinstance(value, list):
+                setattr(node, field, [self.visit(v) if isinstance(v, ast.AST) else v for v in value])
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.visit(value))
+
+    # Code extracted from an elif test has to be placed in front of the whole if statement
+    def visit_if(self, node):
+        node.test = self.visit(node.test)
+        node.body = self.visit_stmts(node.body)
+
+        idx = 0
+        while idx < len(node.orelse) and is_comment(node.orelse[idx]):
+            idx += 1
+        if idx + 1 == len(node.orelse) and isinstance(node.orelse[idx], ast.If):
+            self.hoisted += [c for c in node.orelse[:idx] if not c.inline]
+            node.orelse = [c for c in node.orelse[:idx] if c.inline] + [node.orelse[idx]]
+            self.visit_if(node.orelse[-1])
+        else:
+            node.orelse = self.visit_stmts(node.orelse)
+
+    def desugar_stmt(self, stmt):
+        if isinstance(stmt, ast.ClassDef):
+            # Classes are not supported and are kept as comment
+            start = min([stmt.lineno] + [d.lineno for d in stmt.decorator_list])
+            return ([self.marker('ClassStart')]
+                    + [ast.Comment(value=ORIGINAL_COMMENT_MARKER + ' ' + line, inline=False)
+                       for line in self.code_lines[start - 1:stmt.end_lineno]]
+                    + [self.marker('ClassEnd')])
+        elif isinstance(stmt, ast.Import) or isinstance(stmt, ast.ImportFrom):
+            return [self.marker('Import'), ast.Comment(value=ORIGINAL_COMMENT_MARKER + ' ' + self.code_lines[stmt.lineno - 1], inline=False)]
+        elif isinstance(stmt, ast.AugAssign):
+            value = copy.deepcopy(stmt.target)
+            value.ctx = ast.Load()
+            new_stmt = ast.Assign(targets=[stmt.target], value=ast.BinOp(left=value, op=stmt.op, right=stmt.value))
+            return [self.marker('AugAssign')] + self.visit_stmt(ast.copy_location(new_stmt, stmt))
+        elif isinstance(stmt, ast.AnnAssign):
+            if stmt.value is None:
+                new_stmt = ast.Expr(value=stmt.target)
+                stmt.target.ctx = ast.Load()
+            else:
+                new_stmt = ast.Assign(targets=[stmt.target], value=stmt.value)
+            return ([self.marker('AnnAssign|' + ast.unparse(stmt.annotation) + '|' + str(stmt.simple))]
+                    + self.visit_stmt(ast.copy_location(new_stmt, stmt)))
+        elif isinstance(stmt, ast.Assign) and (isinstance(stmt.targets[0], ast.Tuple) or isinstance(stmt.targets[0], ast.List)):
+            tuple_name = get_buffer_var(self.ctx)
+            value = stmt.value
+            # If value side contains multiple values
+            if hasattr(value, 'elts'):
+                value = ast.Call(func=ast.Name(id='_new_tuple_' + str(len(stmt.targets[0].elts)), ctx=ast.Load()),
+                                 args=value.elts, keywords=[])
+            new_stmts = [ast.Assign(targets=[ast.Name(id=tuple_name, ctx=ast.Store())], value=value)]
+            for idx, var in enumerate(stmt.targets[0].elts):
+                new_stmts.append(ast.Assign(targets=[var], value=ast.Call(func=ast.Name(id='_Tuple_Get', ctx=ast.Load()),
+                                                                          args=[ast.Name(id=tuple_name, ctx=ast.Load()), ast.Constant(value=idx)],
+                                                                          keywords=[])))
+            return [self.marker('Tuple')] + self.visit_stmts([ast.copy_location(s, stmt) for s in new_stmts])
+        elif (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Subscript)
+              and (isinstance(stmt.targets[0].value, ast.Name) or isinstance(stmt.targets[0].value, ast.Attribute))
+              and not any(isinstance(n, ast.Slice) for n in ast.walk(stmt.targets[0].slice))):
+            # Slices can not be passed as arguments
+            var = stmt.targets[0].value
+            var_load = copy.deepcopy(var)
+            var_load.ctx = ast.Load()
+            var_store = copy.deepcopy(var)
+            var_store.ctx = ast.Store()
+            new_stmt = ast.Assign(targets=[var_store], value=ast.Call(func=ast.Name(id='dict_set', ctx=ast.Load()),
+                                                                      args=[var_load, stmt.targets[0].slice, stmt.value],
+                                                                      keywords=[]))
+            return [self.marker('SubscriptSet')] + self.visit_stmt(ast.copy_location(new_stmt, stmt))
+        return None
+
+    # Replaces tuples as iterator variables by a buffer variable and adds a placeholder if the loop ends with a body
+    # Returns the markers to be placed in front of the loop
+    def desugar_for(self, stmt):
+        markers = []
+        last_node = stmt.body[-1]
+        for attr in self._CONTAINER_ATTRS:
+            if items := getattr(last_node, attr, None):
+                if not isinstance(items, Iterable):
                     continue
-                elif isinstance(node.targets[0].value, ast.Attribute):
-                    var = ast.unparse(node.targets[0].value)
-                else:
-                    var = node.targets[0].value.id
-                slice = node.targets[0].slice
-                value = node.value
+                stmt.body.append(self.marker('Placeholder'))
+                break
 
-                lines[node.lineno - 1] = (indentation * ' ') + var + ' = ' + 'dict_set(' + var + ',' + ast.unparse(slice) + ',' + ast.unparse(value) + ')'
+        if isinstance(stmt.target, ast.Tuple):
+            buffer_var = get_buffer_var(self.ctx)
+            assignments = [ast.copy_location(ast.Assign(targets=[elt], value=ast.Subscript(value=ast.Name(id=buffer_var, ctx=ast.Load()),
+                                                                                             slice=ast.Constant(value=i), ctx=ast.Load())), stmt)
+                           for i, elt in enumerate(stmt.target.elts)]
+            stmt.target = ast.Name(id=buffer_var, ctx=ast.Store())
+            stmt.body = assignments + stmt.body
+            markers.append(self.marker('ForTuple'))
+        return markers
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Subscript):
+            buffer_var = get_buffer_var(self.ctx)
+            self.hoist('FuncSub', [ast.Assign(targets=[ast.Name(id=buffer_var, ctx=ast.Store())], value=node.func)])
+            node.func = ast.Name(id=buffer_var, ctx=ast.Load())
+        elif isinstance(node.func, ast.Attribute):
+            # Method calls are replaced as a whole including their parameters
+            buffer_var = get_buffer_var(self.ctx)
+            call = ast.Call(func=ast.Name(id='_obj2_' + node.func.attr, ctx=ast.Load()),
+                            args=[node.func.value] + node.args, keywords=node.keywords)
+            self.hoist('Attribute', [ast.Assign(targets=[ast.Name(id=buffer_var, ctx=ast.Store())], value=call)])
+            return ast.Name(id=buffer_var, ctx=ast.Load())
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        buffer_var = get_buffer_var(self.ctx)
+        call = ast.Call(func=ast.Name(id='_obj_' + node.attr, ctx=ast.Load()), args=[node.value], keywords=[])
+        self.hoist('Attribute', [ast.Assign(targets=[ast.Name(id=buffer_var, ctx=ast.Store())], value=call)])
+        return ast.Name(id=buffer_var, ctx=node.ctx)
+
+    def visit_Lambda(self, node):
+        buffer_var = get_buffer_var(self.ctx)
+        # For a lambda the comment is placed after the first responsible code line
+        # because a function will be parsed into a proc and no code is written in front of the proc
+        fun = ast.FunctionDef(name=buffer_var, args=node.args,
+                              body=[self.marker('Lambda'), ast.Return(value=node.body)], decorator_list=[])
+        if 'type_params' in fun._fields:
+            fun.type_params = []
+        self.hoist(None, [fun])
+        return ast.Name(id=buffer_var, ctx=ast.Load())
+
+    def visit_NamedExpr(self, node):
+        if 'ssa' in node.target.id:
+            return self.generic_visit(node)
+        self.hoist('NamedExpr', [ast.Assign(targets=[ast.Name(id=node.target.id, ctx=ast.Store())], value=node.value)])
+        return ast.Name(id=node.target.id, ctx=ast.Load())
+
+    def desugar_comprehension(self, node, marker, init, add):
+        buffer_var = get_buffer_var(self.ctx)
+        body = [add(ast.Name(id=buffer_var, ctx=ast.Load()))]
+        for g in reversed(node.generators):
+            body = [ast.For(target=g.target, iter=g.iter, body=body, orelse=[])]
+        self.hoist(marker, [ast.Assign(targets=[ast.Name(id=buffer_var, ctx=ast.Store())], value=init)] + body)
+        return ast.Name(id=buffer_var, ctx=ast.Load())
+
+    def visit_DictComp(self, node):
+        return self.desugar_comprehension(node, 'DictComp', ast.Dict(keys=[], values=[]),
+                                          lambda buffer: ast.Assign(targets=[ast.Subscript(value=buffer, slice=node.key, ctx=ast.Store())],
+                                                                    value=node.value))
+
+    def visit_ListComp(self, node):
+        return self.desugar_comprehension(node, 'ListComp', ast.List(elts=[], ctx=ast.Load()),
+                                          lambda buffer: ast.Expr(value=ast.Call(func=ast.Attribute(value=buffer, attr='append', ctx=ast.Load()),
+                                                                                 args=[node.elt], keywords=[])))
+
+    def visit_SetComp(self, node):
+        return self.desugar_comprehension(node, 'SetComp', ast.Dict(keys=[], values=[]),
+                                          lambda buffer: ast.Expr(value=ast.Call(func=ast.Attribute(value=buffer, attr='add', ctx=ast.Load()),
+                                                                                 args=[node.elt], keywords=[])))
+
+    def visit_IfExp(self, node):
+        buffer_var = get_buffer_var(self.ctx)
+        self.hoist('IfExp', [ast.If(test=node.test,
+                                    body=[ast.Assign(targets=[ast.Name(id=buffer_var, ctx=ast.Store())], value=node.body)],
+                                    orelse=[ast.Assign(targets=[ast.Name(id=buffer_var, ctx=ast.Store())], value=node.orelse)])])
+        return ast.Name(id=buffer_var, ctx=ast.Load())
+
+    def visit_Subscript(self, node):
+        if isinstance(node.ctx, ast.Store):
+            self.warn("Subscript on left side of assignment found. This behaviour is not implemented")
+        if isinstance(node.slice, ast.Tuple):
+            # Multi dimensional subscripts are split into one subscript per dimension
+            value = node.value
+            for dim in node.slice.elts:
+                value = ast.copy_location(ast.Subscript(value=value, slice=dim, ctx=ast.Load()), node)
+            value.ctx = node.ctx
+            node = value
+            self.hoisted.append(self.marker('SubscriptMultiDim-' + replaceSpaces(ast.unparse(node), ORIGINAL_COMMENT_MARKER)))
+        return self.generic_visit(node)
+
+    def visit_Starred(self, node):
+        return ast.Call(func=ast.Name(id='_Starred', ctx=ast.Load()), args=[self.visit(node.value)], keywords=[])
 
-                new_code = (indentation * ' ') + ORIGINAL_COMMENT_MARKER + ' SSA-SubscriptSet'
-                lines.insert(node.lineno - 1, new_code)
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.Call):
-                pass
-            elif isinstance(node, ast.Starred):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-
-                var = ast.unparse(node)
-                lines[node.lineno - 1] = line.replace(var, '_Starred(' + var[1:] + ')')
-                code = '\n'.join(lines)
-                replaced = True
-                break
-            elif isinstance(node, ast.Attribute):
-                lines = code.split('\n')
-                line = lines[node.lineno - 1]
-
-                buffer_var = get_buffer_var()
-                indentation = len(re.findall(r"^ *", line)[0])
-                attr = node.attr
-                var = ast.unparse(node.value)
-
-                params = ''
-                fun_name = '_obj_'
-                if lines[node.lineno - 1][node.end_col_offset:].startswith('('):
-                    closingIdx = getNextClosingParenthesisIdx(lines[node.lineno - 1][node.end_col_offset+1:])
-                    params = lines[node.lineno - 1][node.end_col_offset+1:node.end_col_offset+1+closingIdx]
-                    lines[node.lineno - 1] = line.replace(var + '.' + attr + '(' + params + ')', buffer_var, 1)
-                    params = ', ' + params if len(params) > 0 else ''
-                    fun_name = '_obj2_'
-                else:
-                    lines[node.lineno - 1] = line.replace(var + '.' + attr, buffer_var, 1)
 
-                #if lines[node.lineno - 1].strip() == buffer_var:
-                #    lines[node.lineno - 1] = ''
-                #    buffer_var = '_'
+# Preprocessing of Python code before parsing it into SSA
+# Double starred arguments are replaced textually, all other nodes are desugared by the PreprocessTransformer
+def preprocess_py_code(code, ctx: TransformContext = None):
+    if ctx is None:
+        ctx = TransformContext()
+    code = code.replace('%_', 'temp_ssa_parsing_buffer_')
 
-                new_code = (indentation * ' ') + ORIGINAL_COMMENT_MARKER + ' SSA-Attribute\n' + (indentation * ' ') + buffer_var + ' = ' + fun_name + attr + '(' + var + params + ')'
-                lines.insert(node.lineno - 1, new_code)
-                code = '\n'.join(lines)
-                replaced = True
-                break
+    # Find ** Double Starred kwargs etc.
+    pattern = r'(?<=\W) *\*\*([a-zA-Z0-9_]+)'
+    replacer = lambda match: f'_Starred2({match.group(1)})'
+    code = re.sub(pattern, replacer, code)
+
+    tree = PreprocessTransformer(code, ctx).transform(ctx.parse(code))
+    code = ast.unparse(tree)
+
+    if ctx.debug:
+        print("Preprocessing code version:")
+        print(code)
+        print('')
 
     code = code.replace('temp_ssa_parsing_buffer_', '%_')
     return code
 
-def getNextClosingParenthesisIdx(text):
-    opened = 0
-    for t in range(len(text)):
-        if text[t] == ')':
-            if opened == 0:
-                return t
-            else:
-                opened -= 1
-        elif text[t] == '(':
-            opened += 1
-    return -1
-
 
 def build_hirarchie_with_dom_tree(main_cfg_blocks: [SSA_B], dtree):
     idx = 0
@@ -990,54 +993,59 @@ def build_hirarchie_with_dom_tree(main_cfg_blocks: [SSA_B], dtree):
     return main_cfg_blocks
 
 
-def PY_to_SSA_AST(code_str: str, debug: bool):
-    global ssa_results_stored, ssa_results_loads, ssa_results_phi_stored, ssa_results_phi_loads, const_dict, used_var_names, debug_mode, original_code_lines
-
-    reset()
-
-    debug_mode = debug
-    original_code_lines = code_str.split('\n')
+# Transform Python code into an SSA AST
+# A new transformation context is used if none is given, passing one allows to inspect the state after the transformation
+def PY_to_SSA_AST(code_str: str, debug: bool, ctx: TransformContext = None):
+    if ctx is None:
+        ctx = TransformContext()
+    ctx.reset_ssa()
+    ctx.debug = debug
 
     # Preprocess Python code (Slicing and simple transformations (ex. List Comp -> For Loop))
-    code_str = preprocess_py_code(code_str)
+    with ctx.phase('preprocess'):
+        code_str = preprocess_py_code(code_str, ctx)
 
     # Create CFG from code and SSA parser Object
-    mnode = MNode("local")
-    mnode.source = code_str
-    mnode.gen_ast()
-    cfg = mnode.gen_cfg()
+    with ctx.phase('cfg'):
+        mnode = MNode("local")
+        mnode.source = code_str
+        mnode.gen_ast(ctx.parse)
+        cfg = mnode.gen_cfg()
     m_ssa = SSA()
 
-    # Update the provenance info for the child cfgs (functions which have references to the parents variables)
-    prov_info = ProvInfo()
+    with ctx.phase('ssa'):
+        # Update the provenance info for the child cfgs (functions which have references to the parents variables)
+        prov_info = ProvInfo()
 
-    # Compute the phi nodes of the main CFG
-    ssa_results_stored, ssa_results_loads, ssa_results_phi_stored, ssa_results_phi_loads, const_dict = m_ssa.compute_SSA2(cfg, used_var_names)
-    # Parse the main CFG
+        # Compute the phi nodes of the main CFG
+        # Renaming and dominance work on the compact copy, the blocks are changed while parsing them
+        graph = cfg.compact()
+        ctx.ssa_results_stored, ctx.ssa_results_loads, ctx.ssa_results_phi_stored, ctx.ssa_results_phi_loads, ctx.const_dict = m_ssa.compute_SSA2(graph, ctx.used_var_names, pruned=ctx.pruned_ssa)
+        # Parse the main CFG
 
-    dtree = m_ssa.compute_DTree(cfg.get_all_blocks())
-    main_cfg_blocks = PS_BS(ProvInfo(), cfg.get_all_blocks())
-    main_cfg_blocks = build_hirarchie_with_dom_tree(main_cfg_blocks, dtree)
-    # Update global tracking variables of used variable names etc for main CFG
-    update_used_vars(ssa_results_stored, const_dict)
-    prov_info.parent_vars.update(get_used_vars(ssa_results_stored, const_dict))
+        dtree = m_ssa.compute_DTree(graph)
+        main_cfg_blocks = PS_BS(ctx, ProvInfo(), cfg.get_all_blocks())
+        main_cfg_blocks = build_hirarchie_with_dom_tree(main_cfg_blocks, dtree)
+        # Update the tracking of used variable names etc for main CFG
+        update_used_vars(ctx, ctx.ssa_results_stored, ctx.const_dict)
+        prov_info.parent_vars.update(get_used_vars(ctx.ssa_results_stored, ctx.const_dict))
 
-    # Parse all the functions cfgs
-    procs = PS_FS(prov_info, cfg.functioncfgs, cfg.function_args, m_ssa)
+        # Parse all the functions cfgs
+        procs = PS_FS(ctx, prov_info, cfg.functioncfgs, cfg.function_args, m_ssa)
 
-    # Parse all the class cfgs
-    # procs += [PS_FS(prov_info, cfg.class_cfgs, cfg.class_args, m_ssa)]
+        # Parse all the class cfgs
+        # procs += [PS_FS(ctx, prov_info, cfg.class_cfgs, cfg.class_args, m_ssa)]
 
-    # Create SSA AST
-    ssa_ast = SSA_AST(procs, main_cfg_blocks, code_str)
+        # Create SSA AST
+        ssa_ast = SSA_AST(procs, main_cfg_blocks, code_str, symbols=ctx.symbols, font=ctx.font)
 
-    if debug_mode:
+    if ctx.debug:
         print('Main CFG SSA paring variable results:')
-        print('ssa_results_stored', ssa_results_stored)
-        print('ssa_results_loads', ssa_results_loads)
-        print('ssa_results_phi_stored', ssa_results_phi_stored)
-        print('ssa_results_phi_loads', ssa_results_phi_loads)
-        print('const_dict', const_dict)
+        print('ssa_results_stored', ctx.ssa_results_stored)
+        print('ssa_results_loads', ctx.ssa_results_loads)
+        print('ssa_results_phi_stored', ctx.ssa_results_phi_stored)
+        print('ssa_results_phi_loads', ctx.ssa_results_phi_loads)
+        print('const_dict', ctx.const_dict)
         print('\n\n\n')
 
     return ssa_ast
@@ -1081,113 +1089,128 @@ def sort_SSA_blocks(blocks, DF):
 
 
 # Collect all phi nodes in the given block
-def PS_PHI(curr_block):
+def PS_PHI(ctx, curr_block):
     assignments = []
-    for stored, loaded in zip(ssa_results_phi_stored[curr_block.id], ssa_results_phi_loads[curr_block.id]):
-        var_name = list(stored.keys())[0]
-        var_nr = str(stored[var_name])
-        var_values = list(map(str, list(loaded[var_name])))
-        assignments.append(SSA_E_ASS_PHI(SSA_V_VAR(var_name + '_' + var_nr), [SSA_V_VAR(var_name + '_' + var) for var in var_values if var != var_nr]))
+    for stored, loaded in zip(ctx.ssa_results_phi_stored[curr_block.id], ctx.ssa_results_phi_loads[curr_block.id]):
+        var_name = next(iter(stored))
+        var_nr = stored[var_name]
+        assignments.append(SSA_E_ASS_PHI(get_ssa_var(ctx, var_name, var_nr), [get_ssa_var(ctx, var_name, var) for var in loaded[var_name] if var != var_nr]))
 
     return assignments
 
 
-# Parse the given function cfgs and sub functions
-def try_get_used_name_of_function(name, const_dict):
+# Version of the name of an already defined function, None if it was not defined
+def try_get_used_version_of_function(name, const_dict):
     for tup in const_dict.keys():
         if isinstance(const_dict[tup], ast.FunctionDef):
             if tup[0] == name:
-                return name + '_' + str(tup[1])
+                return tup[1]
     return None
 
 
-def PS_FS(prov_info, function_cfgs, function_args, m_ssa, parent_fun_name=None):
-    global ssa_results_stored, ssa_results_loads, ssa_results_phi_stored, ssa_results_phi_loads, const_dict
+# SSA variable of the given version, all nodes of the same version share the symbol and its name
+def get_ssa_var(ctx, name: str, version: int, pos_info: Position = None):
+    sym = ctx.symbols.symbol(name, version)
+    return SSA_V_VAR(ctx.symbols.text(sym), pos_info=pos_info, symbol=sym)
+
+
+# Parse the given function cfgs and sub functions
+def PS_FS(ctx, prov_info, function_cfgs, function_args, m_ssa, parent_fun_name=None):
     procs = []
 
-    parent_const_dict = const_dict.copy()
+    parent_const_dict = ctx.const_dict.copy()
     for key in function_cfgs:
         cfg = function_cfgs[key]
         args = []
         if key in function_args:
             args = function_args[key]
 
-        f_name = try_get_used_name_of_function(cfg.name, parent_const_dict)
-        if f_name is None:
-            f_name = get_global_unique_name_with_update(cfg.name, used_var_names)
-        #args_renamed = [get_global_unique_name_with_update(arg.arg, used_var_names) for arg in args]
-        #prov_info.parent_vars[arg] for arg in args_renamed
-        for arg in args:
-            if arg.arg in prov_info.parent_vars:
-                del prov_info.parent_vars[arg.arg]
+        if ctx.function_cache is None:
+            procs += PS_F(ctx, prov_info, cfg, args, m_ssa, parent_const_dict, parent_fun_name)
+        else:
+            # Unchanged functions are taken from the previous transformation (scalpel.incremental)
+            procs += ctx.function_cache.parse_function(ctx, prov_info, cfg, args, parent_const_dict, parent_fun_name,
+                                                       lambda: PS_F(ctx, prov_info, cfg, args, m_ssa, parent_const_dict, parent_fun_name))
+
+    return procs
 
-        ssa_args = [SSA_V_VAR(get_global_unique_name_with_update(arg.arg, used_var_names), pos_info=Position(arg)) for arg in args]
 
-        # Compute the phi nodes of the current function CFG
-        ssa_results_stored, ssa_results_loads, ssa_results_phi_stored, ssa_results_phi_loads, const_dict = m_ssa.compute_SSA2(cfg, used_var_names, prov_info.parent_vars, function_vars=[arg.arg for arg in args])
+# Parse a function CFG into SSA, returns the procedures of its inner functions followed by its own
+def PS_F(ctx, prov_info, cfg, args, m_ssa, parent_const_dict, parent_fun_name=None):
+    f_version = try_get_used_version_of_function(cfg.name, parent_const_dict)
+    if f_version is None:
+        f_version = get_next_version(cfg.name, ctx.used_var_names)
+    #args_renamed = [get_global_unique_name_with_update(arg.arg, ctx.used_var_names) for arg in args]
+    #prov_info.parent_vars[arg] for arg in args_renamed
+    for arg in args:
+        if arg.arg in prov_info.parent_vars:
+            del prov_info.parent_vars[arg.arg]
 
-        dtree = m_ssa.compute_DTree(cfg.get_all_blocks())
-        parsed_blocks = PS_BS(prov_info, cfg.get_all_blocks())
-        parsed_blocks = build_hirarchie_with_dom_tree(parsed_blocks, dtree)
-        if parent_fun_name is not None:
-            parsed_blocks[0].terms = [SSA_E_COMM(NEW_COMMENT_MARKER + ' SSA-WithinFun-' + parent_fun_name)] + parsed_blocks[0].terms
-        fun_proc = SSA_P(SSA_V_VAR(f_name, pos_info=Position(cfg.ast_node)), ssa_args, parsed_blocks, pos_info=Position(cfg.ast_node))
+    ssa_args = [get_ssa_var(ctx, arg.arg, get_next_version(arg.arg, ctx.used_var_names), pos_info=Position(arg)) for arg in args]
 
-        # Update the used variable names
-        update_used_vars(ssa_results_stored, const_dict)
+    # Compute the phi nodes of the current function CFG
+    graph = cfg.compact()
+    ctx.ssa_results_stored, ctx.ssa_results_loads, ctx.ssa_results_phi_stored, ctx.ssa_results_phi_loads, ctx.const_dict = m_ssa.compute_SSA2(graph, ctx.used_var_names, prov_info.parent_vars, function_vars=[arg.arg for arg in args], pruned=ctx.pruned_ssa)
 
-        prov_info = prov_info.copy()
-        prov_info.parent_vars.update(get_used_vars(ssa_results_stored, const_dict))
+    dtree = m_ssa.compute_DTree(graph)
+    parsed_blocks = PS_BS(ctx, prov_info, cfg.get_all_blocks())
+    parsed_blocks = build_hirarchie_with_dom_tree(parsed_blocks, dtree)
+    if parent_fun_name is not None:
+        parsed_blocks[0].terms = [SSA_E_COMM(NEW_COMMENT_MARKER + ' SSA-WithinFun-' + parent_fun_name)] + parsed_blocks[0].terms
+    fun_proc = SSA_P(get_ssa_var(ctx, cfg.name, f_version, pos_info=Position(cfg.ast_node)), ssa_args, parsed_blocks, pos_info=Position(cfg.ast_node))
 
-        # If there are function in this function, parse those now
-        if len(cfg.functioncfgs) > 0:
-            procs += PS_FS(prov_info, cfg.functioncfgs, cfg.function_args, m_ssa, cfg.name)
+    # Update the used variable names
+    update_used_vars(ctx, ctx.ssa_results_stored, ctx.const_dict)
 
-        # Parse the current functino CFG into SSA
-        procs.append(fun_proc)
+    prov_info = prov_info.copy()
+    prov_info.parent_vars.update(get_used_vars(ctx.ssa_results_stored, ctx.const_dict))
 
+    procs = []
+    # If there are function in this function, parse those now
+    if len(cfg.functioncfgs) > 0:
+        procs += PS_FS(ctx, prov_info, cfg.functioncfgs, cfg.function_args, m_ssa, cfg.name)
 
+    # Parse the current functino CFG into SSA
+    procs.append(fun_proc)
     return procs
 
 
 # Parse a list of blocks from Python AST into SSA AST
-def PS_BS(prov_info, blocks) -> [SSA_B]:
+def PS_BS(ctx, prov_info, blocks) -> [SSA_B]:
     blocks_parsed = []
 
     i = 0
     for b in blocks:
-        blocks_parsed += PS_B(prov_info, b, i == 0)
+        blocks_parsed += PS_B(ctx, prov_info, b, i == 0)
         i += 1
 
     return blocks_parsed
 
 
 # Parse a block from Python AST into SSA AST
-def PS_B(prov_info, block, first_in_proc):
-    global block_counter, blocks_checked
-
+def PS_B(ctx, prov_info, block, first_in_proc):
     # Init the block reference
-    block_ref = PS_B_REF(prov_info, block)
+    block_ref = PS_B_REF(ctx, prov_info, block)
 
     # Handle for nodes separately (in case of a for the first node will be the for node)
     if isinstance(block.statements[0], ast.For):
         # TODO block_ref.pos_info = Position(stmts)
-        return PS_FOR(prov_info, block_ref, block, block.statements[0], first_in_proc)
+        return PS_FOR(ctx, prov_info, block_ref, block, block.statements[0], first_in_proc)
     else:
         # Build the statement list beginning with phi assignments, the stmts and a goto
-        stmts = PS_PHI(block)
-        stmt_lists = [PS_S(prov_info, block, stmt, idx) for idx, stmt in enumerate(block.statements) if not isinstance(stmt, ast.FunctionDef)]
+        stmts = PS_PHI(ctx, block)
+        stmt_lists = [PS_S(ctx, prov_info, block, stmt, idx) for idx, stmt in enumerate(block.statements) if not isinstance(stmt, ast.FunctionDef)]
 
         stmts += [st for l in stmt_lists for st in l]
 
         # Add additional statements generated by sub processes like in the case of for nodes
-        if block in addon_statements_per_block:
-            stmts += addon_statements_per_block[block]
+        if block in ctx.addon_statements_per_block:
+            stmts += ctx.addon_statements_per_block[block]
 
         already_used_exits = find_exits(stmts)
         # If there is only one exit add a goto otherwise the exits will be handled in the node itself (like if-block)
         if len(block.exits) > len(already_used_exits):
-            stmts += [SSA_E_GOTO(PS_B_REF(prov_info, block.exits[0].target))]
+            stmts += [SSA_E_GOTO(PS_B_REF(ctx, prov_info, block.exits[0].target))]
 
         # Create a new SSA Block
         block_ref.pos_info = Position(stmts)
@@ -1196,40 +1219,42 @@ def PS_B(prov_info, block, first_in_proc):
         return [b]
 
 
-# Returns a new buffer variable with a unique name
-def get_buffer_var():
-    global buffer_counter
-    buffer_counter = buffer_counter + 1
-    return SSA_BUFFER_VAR_NAME + str(buffer_counter - 1)
-
-
-def PS_FOR(prov_info, block_ref, block, stmt, first_in_proc):
-    global addon_statements_per_block
+def PS_FOR(ctx, prov_info, block_ref, block, stmt, first_in_proc):
     new_block_name = block_ref.label + '_2'
 
     stmts = []
-    stmts = PS_PHI(block)
-    iter_var = get_buffer_var() + '_0'
+    stmts = PS_PHI(ctx, block)
+    iter_var = get_buffer_var(ctx) + '_0'
     if isinstance(stmt.iter, ast.Name) and stmt.iter.id.startswith(SSA_BUFFER_VAR_NAME):
         stmt.iter.id += '_0'
-    stmts.append(SSA_E_ASS(SSA_V_VAR(iter_var), PS_E(prov_info, block, stmt.iter, 0, False)))
+    stmts.append(SSA_E_ASS(SSA_V_VAR(iter_var), PS_E(ctx, prov_info, block, stmt.iter, 0, False)))
 
-    old_iter_var = PS_E(prov_info, block, stmt.target, 0, False)
+    old_iter_var = PS_E(ctx, prov_info, block, stmt.target, 0, False)
     if hasattr(old_iter_var.name, 'name'):
         var_name, idx = old_iter_var.name.name.rsplit('_', 1)
         if idx == '0':
             idx = str(int(idx) + 2)
         old_iter_var.name.name = var_name + '_' + str(int(idx) - 1)
+    elif getattr(old_iter_var, 'symbol', None) is not None:
+        idx = ctx.symbols.version(old_iter_var.symbol)
+        if idx == 0:
+            idx = idx + 2
+        old_iter_var = get_ssa_var(ctx, ctx.symbols.name(old_iter_var.symbol), idx - 1, pos_info=old_iter_var.pos_info)
     else:
         var_name, idx = old_iter_var.name.rsplit('_', 1)
         if idx == '0':
             idx = str(int(idx) + 2)
         old_iter_var.name = var_name + '_' + str(int(idx) - 1)
-    old_iter_var2 = PS_E(prov_info, block, stmt.target, 0, False)
+    old_iter_var2 = PS_E(ctx, prov_info, block, stmt.target, 0, False)
     if hasattr(old_iter_var.name, 'name'):
         old_iter_var2.name.name = old_iter_var2.name.name + '_2'
+    elif getattr(old_iter_var2, 'symbol', None) is not None:
+        # Second version of the target given to the phi assignment of the loop (e.g. x_1_2)
+        symbols = ctx.symbols
+        old_iter_var2 = get_ssa_var(ctx, symbols.name(old_iter_var2.symbol), (symbols.version(old_iter_var2.symbol), 2), pos_info=old_iter_var2.pos_info)
     else:
-        old_iter_var2.name = old_iter_var2.name + '_2'
+        # The second variable is not a version of the target variable
+        old_iter_var2 = SSA_V_VAR(old_iter_var2.name + '_2', pos_info=old_iter_var2.pos_info)
     stmts.append(SSA_E_ASS(old_iter_var, SSA_E_FUNC_CALL(SSA_V_VAR('next'), [SSA_V_VAR(iter_var)])))
     stmts.append(SSA_E_GOTO(SSA_L(new_block_name)))
 
@@ -1239,21 +1264,21 @@ def PS_FOR(prov_info, block_ref, block, stmt, first_in_proc):
     b = SSA_B(block_ref, stmts, [], first_in_proc, pos_info=pos_info)
 
     stmts2 = []
-    next_iter_var = PS_E(prov_info, block, stmt.target, 0, False)
+    next_iter_var = PS_E(ctx, prov_info, block, stmt.target, 0, False)
     stmts2.append(SSA_E_ASS_PHI(next_iter_var, [old_iter_var, old_iter_var2]))
-    buffer = get_buffer_var()
+    buffer = get_buffer_var(ctx)
     stmts2.append(SSA_E_ASS(SSA_V_VAR(buffer), SSA_E_FUNC_CALL(SSA_V_VAR('_' + ast.IsNot.__name__), [next_iter_var, SSA_V_VAR("None")])))
     if len(block.exits) == 1:
         else_ref = SSA_E_RET(None)
     else:
-        else_ref = SSA_E_GOTO(PS_B_REF(prov_info, block.exits[1].target))
+        else_ref = SSA_E_GOTO(PS_B_REF(ctx, prov_info, block.exits[1].target))
 
-    stmts2.append(SSA_E_IF_ELSE(SSA_V_VAR(buffer), SSA_E_GOTO(PS_B_REF(prov_info, block.exits[0].target)), else_ref))
+    stmts2.append(SSA_E_IF_ELSE(SSA_V_VAR(buffer), SSA_E_GOTO(PS_B_REF(ctx, prov_info, block.exits[0].target)), else_ref))
 
     # TODO Search through blocks within the block.exits[0] recursively for exits to "block" and replace them with the mock block
     ret_block = replace_and_find_returning_loop_block([], block, block, CFGBlockMock(new_block_name, block.exits))
     # block.exits[0].target.exits[len(block.exits[0].target.exits) - 1].target = CFGBlockMock(new_block_name, block.exits)
-    addon_statements_per_block[ret_block] = [SSA_E_ASS(old_iter_var2, SSA_E_FUNC_CALL(SSA_V_VAR('next'), [SSA_V_VAR(iter_var)]))]
+    ctx.addon_statements_per_block[ret_block] = [SSA_E_ASS(old_iter_var2, SSA_E_FUNC_CALL(SSA_V_VAR('next'), [SSA_V_VAR(iter_var)]))]
     b2 = SSA_B(SSA_L(new_block_name, pos_info=pos_info), stmts2, [], first_in_proc, pos_info=pos_info)
 
     return [b, b2]
@@ -1271,58 +1296,58 @@ def replace_and_find_returning_loop_block(visited, block, find, replace_block):
     return None
 
 # Parse a Python statement
-def PS_S(prov_info, curr_block, stmt, st_nr):
+def PS_S(ctx, prov_info, curr_block, stmt, st_nr):
     if isinstance(stmt, ast.Assign):
         # Was moved into preprocessing but can also be used here for other languages
         #if isinstance(stmt.targets[0], ast.Tuple) or isinstance(stmt.targets[0], ast2.Tuple) or isinstance(stmt.targets[0], ast.List) or isinstance(stmt.targets[0], ast2.List):
-        #    tuple_name = get_buffer_var()
-        #    post_stmts = [SSA_E_ASS(PS_E(prov_info, curr_block, var, st_nr, False), SSA_E_FUNC_CALL(SSA_V_VAR('_Tuple_Get', pos_info=Position(stmt.value)), [SSA_V_VAR(tuple_name, pos_info=Position(stmt.value)), SSA_V_CONST(str(idx), pos_info=Position(stmt.value))]), pos_info=Position(stmt.value)) for idx, var in enumerate(stmt.targets[0].elts)]
+        #    tuple_name = get_buffer_var(ctx)
+        #    post_stmts = [SSA_E_ASS(PS_E(ctx, prov_info, curr_block, var, st_nr, False), SSA_E_FUNC_CALL(SSA_V_VAR('_Tuple_Get', pos_info=Position(stmt.value)), [SSA_V_VAR(tuple_name, pos_info=Position(stmt.value)), SSA_V_CONST(str(idx), pos_info=Position(stmt.value))]), pos_info=Position(stmt.value)) for idx, var in enumerate(stmt.targets[0].elts)]
         #    parts = original_code_lines[stmt.lineno - 1].split(' = ')
         #    parenthesis = '1' if '(' in parts[0] else '0'
         #    parenthesis += '1' if '(' in parts[1] else '0'
-        #    return [SSA_E_COMM(NEW_COMMENT_MARKER + ' SSA-Tuple' + parenthesis)] + [SSA_E_ASS(SSA_V_VAR(tuple_name, pos_info=Position(stmt.targets[0])), PS_E(prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))] + post_stmts
-        return [SSA_E_ASS(PS_E(prov_info, curr_block, stmt.targets[0], st_nr, False), PS_E(prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position([stmt.targets[0], stmt.value]))]
+        #    return [SSA_E_COMM(NEW_COMMENT_MARKER + ' SSA-Tuple' + parenthesis)] + [SSA_E_ASS(SSA_V_VAR(tuple_name, pos_info=Position(stmt.targets[0])), PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))] + post_stmts
+        return [SSA_E_ASS(PS_E(ctx, prov_info, curr_block, stmt.targets[0], st_nr, False), PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position([stmt.targets[0], stmt.value]))]
     elif isinstance(stmt, ast.If):
-        if_ref = SSA_E_GOTO(PS_B_REF(prov_info, curr_block.exits[0].target))
+        if_ref = SSA_E_GOTO(PS_B_REF(ctx, prov_info, curr_block.exits[0].target))
         if len(curr_block.exits) == 1:
             else_ref = SSA_E_RET(None)
         else:
-            else_ref = SSA_E_GOTO(PS_B_REF(prov_info, curr_block.exits[1].target))
-        return [SSA_E_IF_ELSE(PS_E(prov_info, curr_block, stmt.test, st_nr, True), if_ref, else_ref, pos_info=Position(stmt))]
+            else_ref = SSA_E_GOTO(PS_B_REF(ctx, prov_info, curr_block.exits[1].target))
+        return [SSA_E_IF_ELSE(PS_E(ctx, prov_info, curr_block, stmt.test, st_nr, True), if_ref, else_ref, pos_info=Position(stmt))]
     elif isinstance(stmt, ast.While):
-        if_ref = SSA_E_GOTO(PS_B_REF(prov_info, curr_block.exits[0].target))
+        if_ref = SSA_E_GOTO(PS_B_REF(ctx, prov_info, curr_block.exits[0].target))
         if len(curr_block.exits) == 1:
             else_ref = SSA_E_RET(None)
         else:
-            else_ref = SSA_E_GOTO(PS_B_REF(prov_info, curr_block.exits[1].target))
-        return [SSA_E_IF_ELSE(PS_E(prov_info, curr_block, stmt.test, st_nr, True), if_ref, else_ref, pos_info=Position(stmt))]
+            else_ref = SSA_E_GOTO(PS_B_REF(ctx, prov_info, curr_block.exits[1].target))
+        return [SSA_E_IF_ELSE(PS_E(ctx, prov_info, curr_block, stmt.test, st_nr, True), if_ref, else_ref, pos_info=Position(stmt))]
     elif isinstance(stmt, ast.Expr):
-        return [PS_E(prov_info, curr_block, stmt.value, st_nr, True)]
+        return [PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, True)]
     elif isinstance(stmt, ast.Return):
-        return [SSA_E_RET(PS_E(prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))]
+        return [SSA_E_RET(PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))]
     elif isinstance(stmt, ast.Delete):
-        return [SSA_E_FUNC_CALL(SSA_V_VAR('_Delete_' + str(len(stmt.targets)), pos_info=Position(stmt)), [PS_E(prov_info, curr_block, arg, st_nr, False) for arg in stmt.targets], pos_info=Position(stmt))]
+        return [SSA_E_FUNC_CALL(SSA_V_VAR('_Delete_' + str(len(stmt.targets)), pos_info=Position(stmt)), [PS_E(ctx, prov_info, curr_block, arg, st_nr, False) for arg in stmt.targets], pos_info=Position(stmt))]
     elif isinstance(stmt, ast.For):
         # Handled separately
         return []
     elif isinstance(stmt, ast.AnnAssign):
-        variable = PS_E(prov_info, curr_block, stmt.target, st_nr, False)
+        variable = PS_E(ctx, prov_info, curr_block, stmt.target, st_nr, False)
         variable.type = stmt.annotation.id
         # TODO a.b:int = 10 (class variable)
-        return [SSA_E_ASS(variable, PS_E(prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))]
+        return [SSA_E_ASS(variable, PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))]
     elif isinstance(stmt, ast.Raise):
         if stmt.cause is not None:
-            return [SSA_E_FUNC_CALL(SSA_V_VAR('_Raise_2', pos_info=Position(stmt)), [SSA_E_FUNC_CALL(PS_E(prov_info, curr_block, stmt.exc.func, st_nr, True), [PS_E(prov_info, curr_block, arg, st_nr, False) for arg in stmt.exc.args])] +
-                                    [PS_E(prov_info, curr_block, stmt.cause, st_nr, False)], pos_info=Position(stmt))]
+            return [SSA_E_FUNC_CALL(SSA_V_VAR('_Raise_2', pos_info=Position(stmt)), [SSA_E_FUNC_CALL(PS_E(ctx, prov_info, curr_block, stmt.exc.func, st_nr, True), [PS_E(ctx, prov_info, curr_block, arg, st_nr, False) for arg in stmt.exc.args])] +
+                                    [PS_E(ctx, prov_info, curr_block, stmt.cause, st_nr, False)], pos_info=Position(stmt))]
         if hasattr(stmt.exc, 'func'):
-            return [SSA_E_FUNC_CALL(SSA_V_VAR('_Raise', pos_info=Position(stmt)), [SSA_E_FUNC_CALL(PS_E(prov_info, curr_block, stmt.exc.func, st_nr, True), [PS_E(prov_info, curr_block, arg, st_nr, False) for arg in stmt.exc.args])], pos_info=Position(stmt))]
-        return [SSA_E_FUNC_CALL(SSA_V_VAR('_Raise', pos_info=Position(stmt)), [PS_E(prov_info, curr_block, stmt.exc, st_nr, True)], pos_info=Position(stmt))]
+            return [SSA_E_FUNC_CALL(SSA_V_VAR('_Raise', pos_info=Position(stmt)), [SSA_E_FUNC_CALL(PS_E(ctx, prov_info, curr_block, stmt.exc.func, st_nr, True), [PS_E(ctx, prov_info, curr_block, arg, st_nr, False) for arg in stmt.exc.args])], pos_info=Position(stmt))]
+        return [SSA_E_FUNC_CALL(SSA_V_VAR('_Raise', pos_info=Position(stmt)), [PS_E(ctx, prov_info, curr_block, stmt.exc, st_nr, True)], pos_info=Position(stmt))]
     elif isinstance(stmt, ast.Assert):
-        args = [PS_E(prov_info, curr_block, stmt.test, st_nr, False)]
+        args = [PS_E(ctx, prov_info, curr_block, stmt.test, st_nr, False)]
         name = '_Assert'
         if stmt.msg is not None:
             name = '_Assert_2'
-            args.append(PS_E(prov_info, curr_block, stmt.msg, st_nr, False))
+            args.append(PS_E(ctx, prov_info, curr_block, stmt.msg, st_nr, False))
         return [SSA_E_FUNC_CALL(SSA_V_VAR(name, pos_info=Position(stmt)), args, pos_info=Position(stmt))]
     elif stmt.__class__.__name__ == ast.Comment.__name__:
         if stmt.value == ORIGINAL_COMMENT_MARKER + ' SSA-Placeholder':
@@ -1335,45 +1360,43 @@ def PS_S(prov_info, curr_block, stmt, st_nr):
     elif isinstance(stmt, ast.Continue):
         return [SSA_E_FUNC_CALL(SSA_V_VAR('_Continue', pos_info=Position(stmt)), [], pos_info=Position(stmt))]
 
-    if debug_mode:
+    if ctx.debug:
         print("Nothing matched for statement: ", stmt)
     return []
 
 
 # Parse a Python expression
-def PS_E(prov_info, curr_block, stmt, st_nr, is_load):
+def PS_E(ctx, prov_info, curr_block, stmt, st_nr, is_load):
     if isinstance(stmt, ast.BinOp):
         pos = Position(stmt)
-        return SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [PS_E(prov_info, curr_block, stmt.left, st_nr, is_load), PS_E(prov_info, curr_block, stmt.right, st_nr, is_load)], pos_info=pos)
+        return SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [PS_E(ctx, prov_info, curr_block, stmt.left, st_nr, is_load), PS_E(ctx, prov_info, curr_block, stmt.right, st_nr, is_load)], pos_info=pos)
     elif isinstance(stmt, ast.BoolOp):
         pos = Position(stmt.values[0:2])
-        result = SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.values[:2]], pos_info=pos)
+        result = SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.values[:2]], pos_info=pos)
         values = stmt.values[2:]
         while len(values) > 0:
             pos = Position([result, values[0]])
-            result = SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [result, PS_E(prov_info, curr_block, values[0], st_nr, is_load)], pos_info=pos)
+            result = SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [result, PS_E(ctx, prov_info, curr_block, values[0], st_nr, is_load)], pos_info=pos)
             values = values[1:]
         return result
     elif isinstance(stmt, ast.NamedExpr):
-        return SSA_E_ASS(PS_E(prov_info, curr_block, stmt.target, st_nr, False),
-                          PS_E(prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))
-    elif isinstance(stmt, ast.ListComp):
-        return buffer_assignments[stmt]
+        return SSA_E_ASS(PS_E(ctx, prov_info, curr_block, stmt.target, st_nr, False),
+                          PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, True), pos_info=Position(stmt))
     elif isinstance(stmt, ast.UnaryOp):
         pos = Position(stmt)
-        return SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [PS_E(prov_info, curr_block, stmt.operand, st_nr, is_load)], pos_info=pos)
+        return SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(stmt.op).__name__, pos_info=pos), [PS_E(ctx, prov_info, curr_block, stmt.operand, st_nr, is_load)], pos_info=pos)
     elif isinstance(stmt, ast.Call):
-        keyword_args = [PS_E(prov_info, curr_block, arg.value, st_nr, is_load) for arg in stmt.keywords]
+        keyword_args = [PS_E(ctx, prov_info, curr_block, arg.value, st_nr, is_load) for arg in stmt.keywords]
         keyword_args_names = [arg.arg for arg in stmt.keywords]
         if len(keyword_args_names) == 0:
             keyword_args_names = None
         if isinstance(stmt.func, ast.Attribute):
             pos = Position(stmt)
-            return SSA_E_FUNC_CALL(SSA_V_VAR(stmt.func.attr, pos_info=pos), [PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in ([stmt.func.value] + stmt.args)] + keyword_args, pos_info=pos, params_named = keyword_args_names)
+            return SSA_E_FUNC_CALL(SSA_V_VAR(stmt.func.attr, pos_info=pos), [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in ([stmt.func.value] + stmt.args)] + keyword_args, pos_info=pos, params_named = keyword_args_names)
         else:
-            return SSA_E_FUNC_CALL(PS_E(prov_info, curr_block, stmt.func, st_nr, is_load), [PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.args] + keyword_args, pos_info=Position(stmt), params_named = keyword_args_names)
+            return SSA_E_FUNC_CALL(PS_E(ctx, prov_info, curr_block, stmt.func, st_nr, is_load), [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.args] + keyword_args, pos_info=Position(stmt), params_named = keyword_args_names)
     elif isinstance(stmt, ast.Compare):
-        return PS_MAP2(prov_info, curr_block, PS_E(prov_info, curr_block, stmt.left, st_nr, is_load), stmt.ops, stmt.comparators, st_nr)
+        return PS_MAP2(ctx, prov_info, curr_block, PS_E(ctx, prov_info, curr_block, stmt.left, st_nr, is_load), stmt.ops, stmt.comparators, st_nr)
     elif isinstance(stmt, ast.Constant):
         if isinstance(stmt.value, str):
             return SSA_V_CONST("'" + stmt.value.replace('\n', '\\n').replace('\'', '\\\'') + "'", pos_info=Position(stmt))
@@ -1383,19 +1406,19 @@ def PS_E(prov_info, curr_block, stmt, st_nr, is_load):
         return SSA_V_CONST(stmt.value, pos_info=Position(stmt))
     elif isinstance(stmt, ast.Tuple) or isinstance(stmt, ast2.Tuple):
         pos = Position(stmt)
-        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_tuple_' + str(len(stmt.elts)), pos_info=pos), [PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.elts], pos_info=pos)
+        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_tuple_' + str(len(stmt.elts)), pos_info=pos), [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.elts], pos_info=pos)
     elif stmt.__class__.__name__ == 'Dict':
         pos = Position(stmt)
-        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_dict_' + str(len(stmt.keys)), pos_info=pos), [PS_E(prov_info, curr_block, arg, st_nr, is_load) for args in zip(stmt.keys, stmt.values) for arg in args], pos_info=pos)
+        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_dict_' + str(len(stmt.keys)), pos_info=pos), [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for args in zip(stmt.keys, stmt.values) for arg in args], pos_info=pos)
     elif isinstance(stmt, ast.Set):
         pos = Position(stmt)
-        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_set_' + str(len(stmt.elts)), pos_info=pos), [PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.elts], pos_info=pos)
+        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_set_' + str(len(stmt.elts)), pos_info=pos), [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.elts], pos_info=pos)
     elif isinstance(stmt, ast.List) or isinstance(stmt, ast2.List): # somehow ast_comments generates ast.List nodes instead of ast_comments.List
         pos = Position(stmt)
-        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_list_' + str(len(stmt.elts)), pos_info=pos), [PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.elts], pos_info=pos)
+        return SSA_E_FUNC_CALL(SSA_V_VAR('_new_list_' + str(len(stmt.elts)), pos_info=pos), [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in stmt.elts], pos_info=pos)
     elif isinstance(stmt, ast.Subscript):
         elt = stmt.slice
-        out = PS_E(prov_info, curr_block, stmt.value, st_nr, is_load)
+        out = PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, is_load)
         if isinstance(elt, ast.Slice):
             appendix = ""
             if elt.lower is not None:
@@ -1408,17 +1431,17 @@ def PS_E(prov_info, curr_block, stmt, st_nr, is_load):
                 appendix = "_" + appendix
             pos = Position(elt)
             out = SSA_E_FUNC_CALL(SSA_V_VAR('_List_Slice' + appendix, pos_info=pos), [out] + (
-            [PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in [elt.lower, elt.upper, elt.step] if
+            [PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in [elt.lower, elt.upper, elt.step] if
              arg is not None]), pos_info=pos)
         else:
             pos = Position(elt)
             out = SSA_E_FUNC_CALL(SSA_V_VAR('_LSD_Get', pos_info=pos),
-                                  [out] + [PS_E(prov_info, curr_block, elt, st_nr, is_load)], pos_info=pos)
+                                  [out] + [PS_E(ctx, prov_info, curr_block, elt, st_nr, is_load)], pos_info=pos)
         return out
 
         # Multidimensional slicing moved into preprocessing
         #elts = [stmt.slice]
-        #out = PS_E(prov_info, curr_block, stmt.value, st_nr, is_load)
+        #out = PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, is_load)
         #if isinstance(stmt.slice, ast.Tuple):
         #    elts = stmt.slice.elts
         #for elt in elts:
@@ -1433,39 +1456,40 @@ def PS_E(prov_info, curr_block, stmt, st_nr, is_load):
         #        if len(appendix) > 0:
         #            appendix = "_" + appendix
         #        pos = Position(elt)
-        #        out = SSA_E_FUNC_CALL(SSA_V_VAR('_List_Slice' + appendix, pos_info=pos), [out] + ([PS_E(prov_info, curr_block, arg, st_nr, is_load) for arg in [elt.lower, elt.upper, elt.step] if arg is not None]), pos_info=pos)
+        #        out = SSA_E_FUNC_CALL(SSA_V_VAR('_List_Slice' + appendix, pos_info=pos), [out] + ([PS_E(ctx, prov_info, curr_block, arg, st_nr, is_load) for arg in [elt.lower, elt.upper, elt.step] if arg is not None]), pos_info=pos)
         #    else:
         #        pos = Position(elt)
-        #        out = SSA_E_FUNC_CALL(SSA_V_VAR('_LSD_Get', pos_info=pos), [out] + [PS_E(prov_info, curr_block, elt, st_nr, is_load)], pos_info=pos)
+        #        out = SSA_E_FUNC_CALL(SSA_V_VAR('_LSD_Get', pos_info=pos), [out] + [PS_E(ctx, prov_info, curr_block, elt, st_nr, is_load)], pos_info=pos)
         #return out
     elif isinstance(stmt, ast.Attribute):
         pos = Position(stmt)
-        return SSA_E_FUNC_CALL(SSA_V_VAR(stmt.attr, pos_info=pos), [PS_E(prov_info, curr_block, stmt.value, st_nr, is_load)], pos_info=pos)
+        return SSA_E_FUNC_CALL(SSA_V_VAR(stmt.attr, pos_info=pos), [PS_E(ctx, prov_info, curr_block, stmt.value, st_nr, is_load)], pos_info=pos)
     elif isinstance(stmt, ast.Name):
-        name = get_global_unique_name(stmt.id, prov_info.parent_vars, used_var_names)
+        name = get_global_unique_name(stmt.id, prov_info.parent_vars, ctx.used_var_names)
         if is_load:
-            if name in ssa_results_loads[curr_block.id][st_nr]:
-                var_list = [str(var) for var in list(ssa_results_loads[curr_block.id][st_nr][name])]
-                var_list_join = str('_'.join(var_list))
-                if len(var_list) > 0:
-                    return SSA_V_VAR(name + '_' + str(var_list_join), pos_info=Position(stmt))
+            if name in ctx.ssa_results_loads[curr_block.id][st_nr]:
+                versions = ctx.ssa_results_loads[curr_block.id][st_nr][name]
+                if len(versions) == 1:
+                    return get_ssa_var(ctx, name, next(iter(versions)), pos_info=Position(stmt))
+                elif len(versions) > 1:
+                    return get_ssa_var(ctx, name, tuple(versions), pos_info=Position(stmt))
                 else:
                     return SSA_V_VAR(name, pos_info=Position(stmt))
             return SSA_V_VAR(name, pos_info=Position(stmt))
-        if name in ssa_results_stored[curr_block.id][st_nr]:
-            return SSA_V_VAR(name + '_' + str(ssa_results_stored[curr_block.id][st_nr][name]), pos_info=Position(stmt))
+        if name in ctx.ssa_results_stored[curr_block.id][st_nr]:
+            return get_ssa_var(ctx, name, ctx.ssa_results_stored[curr_block.id][st_nr][name], pos_info=Position(stmt))
         return SSA_V_VAR(name, pos_info=Position(stmt))
     elif isinstance(stmt, ast.JoinedStr):
         parts = []
         for part in stmt.values:
             if isinstance(part, ast.Constant):
-                parts.append(PS_E(prov_info, curr_block, part, st_nr, is_load))
+                parts.append(PS_E(ctx, prov_info, curr_block, part, st_nr, is_load))
             elif isinstance(part, ast.FormattedValue):
                 pos = Position(stmt)
                 if hasattr(part, 'format_spec') and part.format_spec is not None:
-                    parts.append(SSA_E_FUNC_CALL(SSA_L('_str_format3', pos_info=pos), [PS_E(prov_info, curr_block, part.value, st_nr, is_load), SSA_V_CONST(part.conversion), PS_E(prov_info, curr_block, part.format_spec, st_nr, is_load)], pos_info=pos))
+                    parts.append(SSA_E_FUNC_CALL(SSA_L('_str_format3', pos_info=pos), [PS_E(ctx, prov_info, curr_block, part.value, st_nr, is_load), SSA_V_CONST(part.conversion), PS_E(ctx, prov_info, curr_block, part.format_spec, st_nr, is_load)], pos_info=pos))
                 else:
-                    parts.append(SSA_E_FUNC_CALL(SSA_L('_str_format2', pos_info=pos), [PS_E(prov_info, curr_block, part.value, st_nr, is_load), SSA_V_CONST(part.conversion)], pos_info=pos))
+                    parts.append(SSA_E_FUNC_CALL(SSA_L('_str_format2', pos_info=pos), [PS_E(ctx, prov_info, curr_block, part.value, st_nr, is_load), SSA_V_CONST(part.conversion)], pos_info=pos))
         #parts.reverse()
         out = parts[0]
         for part in parts[1:]:
@@ -1473,27 +1497,27 @@ def PS_E(prov_info, curr_block, stmt, st_nr, is_load):
             out = SSA_E_FUNC_CALL(SSA_V_VAR('_Add', pos_info=pos), [out, part], pos_info=pos)
         return out
 
-    if debug_mode:
+    if ctx.debug:
         print("No match found for statement: ", stmt)
     return stmt
 
 
 # Recursively generate a call stack with ops and comparators
-def PS_MAP2(prov_info, curr_block, left, ops, comparators, st_nr):
+def PS_MAP2(ctx, prov_info, curr_block, left, ops, comparators, st_nr):
     pos = Position([left, comparators[0]])
     if len(ops) == 1:
-        return SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(ops[0]).__name__, pos_info=pos), (left, PS_E(prov_info, curr_block, comparators[0], st_nr, True)), pos_info=pos)
-    new_left = SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(ops[0]).__name__, pos_info=pos), (left, PS_E(prov_info, curr_block, comparators[0], st_nr, True)), pos_info=pos)
-    return PS_MAP2(new_left, ops[1:], comparators[1:], st_nr)
+        return SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(ops[0]).__name__, pos_info=pos), (left, PS_E(ctx, prov_info, curr_block, comparators[0], st_nr, True)), pos_info=pos)
+    new_left = SSA_E_FUNC_CALL(SSA_V_VAR('_' + type(ops[0]).__name__, pos_info=pos), (left, PS_E(ctx, prov_info, curr_block, comparators[0], st_nr, True)), pos_info=pos)
+    return PS_MAP2(ctx, prov_info, curr_block, new_left, ops[1:], comparators[1:], st_nr)
 
 
 # Saves a blocks unique references and returns it
-def PS_B_REF(prov_info, curr_block):
-    if curr_block in block_refs:
-        return block_refs[curr_block]
+def PS_B_REF(ctx, prov_info, curr_block):
+    if curr_block in ctx.block_refs:
+        return ctx.block_refs[curr_block]
 
-    block_refs[curr_block] = SSA_L(str(curr_block.id))
-    return block_refs[curr_block]
+    ctx.block_refs[curr_block] = SSA_L(str(curr_block.id))
+    return ctx.block_refs[curr_block]
 
 
 #################################################################################################################################
@@ -1514,16 +1538,16 @@ class SimpleCFGBlock:
         self.ssa_terms = ssa_terms
 
 
-mapping_label_to_block = {}
 def get_simple_cfg_from_ssa(ssa_ast: SSA_AST):
+    mapping_label_to_block = {}
     func_cfgs: [SimpleCFG] = []
     entry_block = None
 
     for proc in ssa_ast.procs:
-        func_cfgs += get_simple_cfg_from_ssa_proc(proc)
+        func_cfgs += get_simple_cfg_from_ssa_proc(proc, mapping_label_to_block)
     first = True
     for b in ssa_ast.blocks:
-        cfg_block = SimpleCFGBlock(b.label.label, get_exits_from_ssa_block(b), b.terms)
+        cfg_block = SimpleCFGBlock(b.label.label, get_exits_from_ssa_block(b, mapping_label_to_block), b.terms)
         mapping_label_to_block[b.label.label] = cfg_block
         if first:
             first = False
@@ -1535,13 +1559,13 @@ def get_simple_cfg_from_ssa(ssa_ast: SSA_AST):
     return SimpleCFG('', func_cfgs, entry_block)
 
 
-def get_simple_cfg_from_ssa_proc(proc: SSA_P):
+def get_simple_cfg_from_ssa_proc(proc: SSA_P, mapping_label_to_block):
     func_cfgs: [SimpleCFG] = []
     entry_block = None
 
     first = True
     for b in proc.blocks:
-        cfg_block = SimpleCFGBlock(b.label.label, get_exits_from_ssa_block(b), b.terms)
+        cfg_block = SimpleCFGBlock(b.label.label, get_exits_from_ssa_block(b, mapping_label_to_block), b.terms)
         mapping_label_to_block[b.label.label] = cfg_block
         if first:
             first = False
@@ -1550,7 +1574,7 @@ def get_simple_cfg_from_ssa_proc(proc: SSA_P):
     return [SimpleCFG(proc.name, func_cfgs, entry_block)]
 
 
-def get_exits_from_ssa_block(block: SSA_B):
+def get_exits_from_ssa_block(block: SSA_B, mapping_label_to_block):
     mapping_label_to_block[block.label.label] = block
     exits = find_exits(block.terms)
     return exits
@@ -1568,7 +1592,14 @@ def find_exits(terms):
 
 def recursive_find_exits(cl):
     exits = []
-    if hasattr(cl, '__dict__'):
+    if isinstance(cl, SSANode):
+        for name in get_node_fields(type(cl)):
+            value = getattr(cl, name)
+            if isinstance(value, SSA_E_GOTO):
+                exits.append(value.label.label)
+            else:
+                exits += recursive_find_exits(value)
+    elif hasattr(cl, '__dict__'):
         names = filter(lambda a: not a.startswith('__'), dir(cl))
         dict_of_class = vars(cl)
         for (name, value) in dict_of_class.items():
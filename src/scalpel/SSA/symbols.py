@@ -0,0 +1,58 @@
+import sys
+
+from scalpel.functions import get_versioned_name
+
+
+# Interned SSA variables, every (name, version) pair is mapped to an integer symbol
+# Renaming works on the symbols, the versioned names (e.g. x_2) are only built once per symbol and shared by all its nodes
+# The version is a number or a tuple of numbers for the names joining several versions (e.g. x_1_2)
+class SymbolTable:
+    def __init__(self):
+        # Names by their id and ids by name
+        self.names = []
+        self.name_ids = {}
+        # (name id, version) of every symbol and the symbols by (name id, version)
+        self.symbols = []
+        self.symbol_ids = {}
+        # Versioned names of the symbols, built on first use
+        self.texts = []
+
+    def name_id(self, name: str) -> int:
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    # Symbol of the given version of the variable
+    def symbol(self, name: str, version: int) -> int:
+        key = (self.name_id(name), version)
+        sym = self.symbol_ids.get(key)
+        if sym is None:
+            sym = self.symbol_ids[key] = len(self.symbols)
+            self.symbols.append(key)
+            self.texts.append(None)
+        return sym
+
+    # Id of the name of the symbol, equal for all versions of a variable
+    def base(self, sym: int) -> int:
+        return self.symbols[sym][0]
+
+    def name(self, sym: int) -> str:
+        return self.names[self.symbols[sym][0]]
+
+    def version(self, sym: int) -> int:
+        return self.symbols[sym][1]
+
+    # Versioned name of the symbol as printed in SSA and ANF code
+    def text(self, sym: int) -> str:
+        text = self.texts[sym]
+        if text is None:
+            name_id, version = self.symbols[sym]
+            if isinstance(version, tuple):
+                version = '_'.join(str(v) for v in version)
+            text = self.texts[sym] = sys.intern(get_versioned_name(self.names[name_id], version))
+        return text
+
+    def __len__(self):
+        return len(self.symbols)
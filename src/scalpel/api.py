@@ -0,0 +1,76 @@
+import scalpel.ast_comments as ast
+
+from scalpel.SSA.anf_syntax import parse_ssa_to_anf, parse_anf_from_text, print_anf_with_prov_info
+from scalpel.SSA.ssa_syntax import PY_to_SSA_AST
+from scalpel.SSA.context import TransformContext
+from scalpel.SSA.prov_sidecar import ProvColumns, build_anf_sidecar, parse_anf_from_sidecar
+from scalpel.py_anf_transformer import transform_code, print_anf_code_to_formatted_python
+
+# In-memory API of the transformation, the functions take and return strings or IR objects
+# Nothing is read from or written to files and nothing is printed (warnings are dropped)
+#
+# Options (all optional):
+#   no_pos          Leave out the position information in the provenance info of the ANF code
+#   output_syntax   0: ASCII (<-, PHI, lambda), otherwise the code signs (←, φ, λ) are used
+#   pruned_ssa      Only place phi assignments for variables used afterwards
+OPTIONS = {'no_pos': False, 'output_syntax': 0, 'pruned_ssa': False}
+
+
+# Returns the options with the defaults for the ones not given
+def get_options(options: dict = None):
+    options = options or {}
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise ValueError(f'Unknown options: {", ".join(sorted(unknown))}')
+    return dict(OPTIONS, **options)
+
+
+def get_context(options: dict):
+    return TransformContext(no_pos=options['no_pos'], pruned_ssa=options['pruned_ssa'], quiet=True, output_syntax=options['output_syntax'])
+
+
+# Python code -> SSA AST, printing it with print(0) gives the SSA code
+def to_ssa(src: str, options: dict = None):
+    options = get_options(options)
+    return PY_to_SSA_AST(ast.unparse(ast.parse(src)), False, get_context(options))
+
+
+# Python code -> ANF code with provenance info, which can be transformed back with from_anf
+def to_anf(src: str, options: dict = None):
+    options = get_options(options)
+    ctx = get_context(options)
+    return print_anf_with_prov_info(get_anf_ast(src, options, ctx), ctx)
+
+
+# Python code -> plain ANF code and its provenance info as columns packed into bytes (see scalpel.SSA.prov_sidecar)
+def to_anf_sidecar(src: str, options: dict = None):
+    options = get_options(options)
+    ctx = get_context(options)
+    code, columns = build_anf_sidecar(get_anf_ast(src, options, ctx), ctx)
+    return code, columns.to_bytes()
+
+
+def get_anf_ast(src: str, options: dict, ctx: TransformContext):
+    ssa_ast = PY_to_SSA_AST(ast.unparse(ast.parse(src)), False, ctx)
+    return parse_ssa_to_anf(ssa_ast, False, options['no_pos'], ctx)
+
+
+# ANF code with provenance info -> Python code
+def from_anf(text: str):
+    return print_anf_code_to_formatted_python(parse_anf_from_text(text))
+
+
+# Plain ANF code and the bytes of its provenance columns -> Python code
+def from_anf_sidecar(code: str, data):
+    return print_anf_code_to_formatted_python(parse_anf_from_sidecar(code, ProvColumns.from_bytes(data)))
+
+
+# Python code -> ANF code -> Python code
+def round_trip(src: str, options: dict = None):
+    return from_anf(to_anf(src, options))
+
+
+# Python code -> reformatted Python code, SSA code, ANF code and ANF code with provenance info (see transform_code)
+def transform(src: str, options: dict = None):
+    options = get_options(options)
+    return transform_code(src, False, options['no_pos'], options['output_syntax'], options['pruned_ssa'], quiet=True)
@@ -1,6 +1,7 @@
 import ast
 import re
 import sys
+import heapq
 import tokenize
 import typing as _t
 from ast import *  # noqa: F401,F403
@@ -29,6 +30,9 @@ def parse(source: _t.Union[str, bytes, ast.AST], *args, **kwargs) -> ast.AST:
 def _enrich(source: _t.Union[str, bytes], tree: ast.AST) -> None:
     if isinstance(source, bytes):
         source = source.decode()
+    # Without a hash sign there are no comment tokens, the tokenization can be skipped
+    if "#" not in source:
+        return
     lines_iter = iter(source.splitlines(keepends=True))
     tokens = tokenize.generate_tokens(lambda: next(lines_iter))
 
@@ -52,25 +56,33 @@ def _enrich(source: _t.Union[str, bytes], tree: ast.AST) -> None:
         return
 
     tree_intervals = _get_tree_intervals_and_update_ast_nodes(tree, source)
+    # The comments (ordered by line) and the intervals (ordered by their lower bound) are swept at once, the heap
+    # holds the intervals started so far with the highest lower bound and then the lowest upper bound on top
+    intervals = sorted(tree_intervals)
+    started = []
+    i = 0
+    # Comments to be inserted into each body list
+    attr_comments = {}
     for c_node in comment_nodes:
         c_lineno = c_node.lineno
-        possible_intervals_for_c_node = [
-            (x, y) for x, y in tree_intervals if x <= c_lineno <= y
-        ]
+        while i < len(intervals) and intervals[i][0] <= c_lineno:
+            heapq.heappush(started, (-intervals[i][0], intervals[i][1]))
+            i += 1
+        # Intervals ending above the comment can not contain any of the following comments either
+        while started and started[0][1] < c_lineno:
+            heapq.heappop(started)
 
-        if possible_intervals_for_c_node:
-            target_interval = tree_intervals[
-                max(possible_intervals_for_c_node, key=lambda item: (item[0], -item[1]))
-            ]
+        if started:
+            target_interval = tree_intervals[(-started[0][0], started[0][1])]
 
             target_node = target_interval["node"]
             # intervals for every attribute from _CONTAINER_ATTRS for the target node
             sub_intervals = target_interval["intervals"]
 
             loc = -1
-            for i, (low, high, _) in enumerate(sub_intervals):
+            for i2, (low, high, _) in enumerate(sub_intervals):
                 if low <= c_lineno <= high or c_lineno < low:
-                    loc = i
+                    loc = i2
                     break
 
             *_, target_attr = sub_intervals[loc]
@@ -79,7 +91,11 @@ def _enrich(source: _t.Union[str, bytes], tree: ast.AST) -> None:
             target_attr = "body"
 
         attr = getattr(target_node, target_attr)
-        attr.append(c_node)
+        attr_comments.setdefault(id(attr), (attr, []))[1].append(c_node)
+
+    for attr, comments in attr_comments.values():
+        # Sorting once is the same as sorting after each comment as the sort is stable
+        attr.extend(comments)
         attr.sort(key=lambda x: (x.end_lineno, isinstance(x, Comment)))
 
         # NOTE:
@@ -109,6 +125,9 @@ def _get_tree_intervals_and_update_ast_nodes(
 ) -> _t.Dict[
     _t.Tuple[int, int], _t.Dict[str, _t.Union[_t.List[_t.Tuple[int, int]], ast.AST]]
 ]:
+    # Insert an empty line to correspond to the lineno values from ast nodes which start at 1
+    # instead of 0, the lines are split once for all intervals
+    lines = [""] + source.split("\n")
     res = {}
     for node in ast.walk(node):
         attr_intervals = []
@@ -117,17 +136,17 @@ def _get_tree_intervals_and_update_ast_nodes(
                 if not isinstance(items, Iterable):
                     continue
                 attr_intervals.append(
-                    (*_extend_interval(_get_interval(items), source), attr)
+                    (*_extend_interval(_get_interval(items), lines), attr)
                 )
         if attr_intervals:
             # If the parent node hast lineno and end_lineno we extend them too, because there
             # could be comments at the end not covered by the intervals gathered in the attributes
             if hasattr(node, "lineno") and hasattr(node, "end_lineno"):
-                low, high = _extend_interval((node.lineno, node.end_lineno), source)
+                low, high = _extend_interval((node.lineno, node.end_lineno), lines)
                 node.lineno = low
                 node.end_lineno = high
                 # also update the end col offset corresponding to the new line
-                node.end_col_offset = len(source.split("\n")[high - 1])
+                node.end_col_offset = len(lines[high])
             else:
                 low = (
                     min(node.lineno, min(attr_intervals)[0])
@@ -148,12 +167,8 @@ def _get_tree_intervals_and_update_ast_nodes(
 # the current block. The method is based on indentation levels to find the correct upper and lower
 # bounds of the interval looked at by checking where the indentation changes, and it marks the end
 # of the interval
-def _extend_interval(interval: _t.Tuple[int, int], code: str) -> _t.Tuple[int, int]:
-    lines = code.split("\n")
-    # Insert an empty line to correspond to the lineno values from ast nodes which start at 1
-    # instead of 0
-    lines.insert(0, "")
-
+# The lines of the code start with an empty line, so that the lineno values can be used as indices
+def _extend_interval(interval: _t.Tuple[int, int], lines: _t.List[str]) -> _t.Tuple[int, int]:
     low = interval[0]
     high = interval[1]
     skip_lower = False
@@ -167,7 +182,7 @@ def _extend_interval(interval: _t.Tuple[int, int], code: str) -> _t.Tuple[int, i
         lower_bound = _get_indentation_lvl(lines[low])
         start_indentation = max(
             lower_bound,
-            _get_indentation_lvl(_get_first_line_not_comment(lines[low + 1 :])),
+            _get_indentation_lvl(_get_first_line_not_comment(lines, low + 1)),
         )
         if start_indentation != lower_bound:
             skip_lower = True
@@ -192,10 +207,11 @@ def _extend_interval(interval: _t.Tuple[int, int], code: str) -> _t.Tuple[int, i
     return low, high
 
 
-# Searches for the first line not being a comment
+# Searches for the first line not being a comment starting at the given index
 # In each block there must be at least one, otherwise the code is not valid
-def _get_first_line_not_comment(lines: _t.List[str]):
-    for line in lines:
+def _get_first_line_not_comment(lines: _t.List[str], start: int = 0):
+    for idx in range(start, len(lines)):
+        line = lines[idx]
         if not line.strip():
             continue
         if not re.match(r"^ *#.*", line):
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import functools
+import collections
+
+import scalpel
+from scalpel import config
+
+# Default maximum size of the cache in bytes
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+# When the cache is too large the least recently used entries are removed until this fraction of the maximum size is reached
+PRUNE_TARGET = 0.9
+ENTRY_SUFFIX = '.json'
+# Default number of results kept by the in-memory cache of long running processes
+DEFAULT_MEMORY_ENTRIES = 256
+# Packages of the transformation pipeline relative to the scalpel package, their sources are part of every key
+SOURCE_PACKAGES = ('', 'SSA', 'cfg', 'core')
+
+
+# Hash of the python files of the pipeline, computed once per process
+# The version of the library does not change between releases, the sources do, so cached results of older code are
+# never returned
+@functools.lru_cache(maxsize=None)
+def get_source_hash():
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(scalpel.__file__))
+    for package in SOURCE_PACKAGES:
+        folder = os.path.join(root, package)
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.py'):
+                h.update(os.path.join(package, name).encode('utf-8') + b'\0')
+                with open(os.path.join(folder, name), 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+# On-disk cache of transformation results (python code, SSA, ANF and ANF with provenance info)
+# Entries are addressed by a hash of the source code, the options, the config markers, the library version and the
+# sources of the library
+# The modification time of an entry is updated on every hit and used to evict the least recently used entries first
+class TransformCache:
+    def __init__(self, path: str, max_size: int = DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        # Size of all entries, computed on the first write
+        self.size = None
+
+    # Key of the results for the given code and options
+    @staticmethod
+    def key(code: str, options: dict):
+        markers = {name: value for name, value in vars(config).items() if name.isupper()}
+        settings = {'version': scalpel.__version__, 'sources': get_source_hash(), 'python': list(sys.version_info[:2]),
+                    'config': markers, 'options': options}
+        h = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        h.update(b'\0')
+        h.update(code.encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+
+    def entry_path(self, key: str):
+        return os.path.join(self.path, key[:2], key + ENTRY_SUFFIX)
+
+    # Returns the stored results or None if the key is not cached
+    def get(self, key: str):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                artifacts = json.load(f)
+            # Mark the entry as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return artifacts
+
+    def put(self, key: str, artifacts: dict):
+        path = self.entry_path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(artifacts, f)
+            # An existing entry of the key is overwritten, its size is not part of the cache anymore
+            try:
+                replaced_size = os.path.getsize(path)
+            except OSError:
+                replaced_size = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        else:
+            self.size += os.path.getsize(path) - replaced_size
+        if self.size > self.max_size:
+            self.prune()
+
+    # All entries as (last use, size, path)
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.path):
+            return entries
+        for folder in os.scandir(self.path):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    # Remove the least recently used entries if the cache is larger than its maximum size
+    def prune(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            target = self.max_size * PRUNE_TARGET
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        self.size = total
+
+
+# In-memory cache of transformation results for long running processes (e.g. the server mode)
+# Keeps the most recently used entries and falls back to an optional on-disk cache which is filled on writes
+class MemoryCache:
+    key = staticmethod(TransformCache.key)
+
+    def __init__(self, max_entries: int = DEFAULT_MEMORY_ENTRIES, backing: TransformCache = None):
+        self.max_entries = max_entries
+        self.backing = backing
+        self.entries = collections.OrderedDict()
+
+    def get(self, key: str):
+        artifacts = self.entries.get(key)
+        if artifacts is not None:
+            self.entries.move_to_end(key)
+            return artifacts
+        if self.backing is not None:
+            artifacts = self.backing.get(key)
+            if artifacts is not None:
+                self.remember(key, artifacts)
+        return artifacts
+
+    def put(self, key: str, artifacts: dict):
+        self.remember(key, artifacts)
+        if self.backing is not None:
+            self.backing.put(key, artifacts)
+
+    def remember(self, key: str, artifacts: dict):
+        self.entries[key] = artifacts
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+# Returns one cache object per path and size in each process so the size of the cache is only computed once
+@functools.lru_cache(maxsize=None)
+def open_cache(path: str, max_size: int = DEFAULT_CACHE_SIZE):
+    return TransformCache(path, max_size)
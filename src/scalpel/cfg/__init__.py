@@ -8,3 +8,4 @@ the form of an expression. Please see the example diagram a control flow graph !
 """
 from .builder import CFGBuilder
 from .model import CFG, Block, Link
+from .compact import CompactCFG
@@ -117,8 +117,7 @@ class CFGBuilder(ast.NodeVisitor):
         self.cfg.entryblock = self.current_block
         # Actual building of the CFG is done here.
         self.visit(tree)
-        visited = []
-        self.clean_cfg(self.cfg.entryblock, visited)
+        self.clean_cfg(self.cfg.entryblock)
         self.cfg.ast_node = tree
 
         if flattened:
@@ -234,6 +233,44 @@ class CFGBuilder(ast.NodeVisitor):
             self.add_exit(self.current_block, loopguard)
         return loopguard
 
+    def build_sub_cfg(self, name, tree, asynchr, entry_id):
+        """
+        Build the CFG of a function or class body with this builder, so the
+        CFGs of all definitions of a module are built in one pass. The state
+        of the CFG being built is restored afterwards, the current id is the
+        last id used by the sub-CFG.
+
+        Args:
+            name: The name of the sub-CFG.
+            tree: The body of the definition as an AST module.
+            asynchr: Boolean indicating whether the sub-CFG is asynchronous.
+            entry_id: Value for the id of the entry block of the sub-CFG.
+
+        Returns:
+            The CFG of the body.
+        """
+        state = (
+            self.cfg,
+            self.current_block,
+            self.after_loop_block_stack,
+            self.curr_loop_guard_stack,
+            self.separate_node_blocks,
+        )
+        self.after_loop_block_stack = []
+        self.curr_loop_guard_stack = []
+        # Statements of the bodies are not separated into blocks
+        self.separate_node_blocks = False
+        try:
+            return self.build(name, tree, asynchr, entry_id)
+        finally:
+            (
+                self.cfg,
+                self.current_block,
+                self.after_loop_block_stack,
+                self.curr_loop_guard_stack,
+                self.separate_node_blocks,
+            ) = state
+
     def new_functionCFG(self, node, asynchr=False, enclosing_block_id=-1):
         """
         Create a new sub-CFG for a function definition and add it to the
@@ -248,8 +285,7 @@ class CFGBuilder(ast.NodeVisitor):
         # A new sub-CFG is created for the body of the function definition and
         # added to the function CFGs of the current CFG.
         func_body = ast.Module(body=node.body)
-        func_builder = CFGBuilder()
-        self.cfg.functioncfgs[(enclosing_block_id, node.name)] = func_builder.build(
+        self.cfg.functioncfgs[(enclosing_block_id, node.name)] = self.build_sub_cfg(
             node.name, func_body, asynchr, self.current_id
         )
         self.cfg.functioncfgs[(enclosing_block_id, node.name)].ast_node = node
@@ -265,7 +301,7 @@ class CFGBuilder(ast.NodeVisitor):
         self.cfg.function_args[(enclosing_block_id, node.name)] = get_arg_names(
             node.args
         )
-        self.current_id = func_builder.current_id + 1
+        self.current_id += 1
 
     def new_ClassCFG(self, node, asynchr=False):
         """
@@ -281,7 +317,6 @@ class CFGBuilder(ast.NodeVisitor):
         # A new sub-CFG is created for the body of the function definition and
         # added to the function CFGs of the current CFG.
         func_body = ast.Module(body=node.body)
-        func_builder = CFGBuilder()
         base_names = []
         for base in node.bases:
             if not isinstance(base, ast.Name):
@@ -289,7 +324,7 @@ class CFGBuilder(ast.NodeVisitor):
             base_names.append(base.id)
         if node.name in self.cfg.class_cfgs and node.name in base_names:
             existing_class_cfg = self.cfg.class_cfgs[node.name]
-            new_class_cfg = func_builder.build(
+            new_class_cfg = self.build_sub_cfg(
                 node.name, func_body, asynchr, self.current_id
             )
             new_class_cfg.entryblock.statements = (
@@ -300,54 +335,66 @@ class CFGBuilder(ast.NodeVisitor):
             new_class_cfg.function_args.update(existing_class_cfg.function_args)
             self.cfg.class_cfgs[node.name] = new_class_cfg
         else:
-            self.cfg.class_cfgs[node.name] = func_builder.build(
+            self.cfg.class_cfgs[node.name] = self.build_sub_cfg(
                 node.name, func_body, asynchr, self.current_id
             )
 
-        self.current_id = func_builder.current_id + 1
+        self.current_id += 1
 
-    def clean_cfg(self, block, visited):
+    def clean_cfg(self, block, visited=None):
         """
         Remove the useless (empty) blocks from a CFG.
 
+        The blocks are traversed depth first with an explicit stack, each
+        entry holds a block and the exits still to be visited from it.
+
         Args:
             block: The block from which to start traversing the CFG to clean
                    it.
-            visited: A list of blocks that already have been visited by
-                     clean_cfg (recursive function).
+            visited: A set of the ids of the blocks that already have been
+                     visited by clean_cfg.
         """
-        # Don't visit blocks twice.
-        if block.id in visited:
-            return
-        visited.append(block.id)
-
-        # Empty blocks are removed from the CFG.
-        if block.is_empty():
-            for pred in block.predecessors:
-                for exit in block.exits:
-                    self.add_exit(
-                        pred.source,
-                        exit.target,
-                        merge_exitcases(pred.exitcase, exit.exitcase),
-                    )
-                    # Check if the exit hasn't yet been removed from
-                    # the predecessors of the target block.
-                    if exit in exit.target.predecessors:
-                        exit.target.predecessors.remove(exit)
-                # Check if the predecessor hasn't yet been removed from
-                # the exits of the source block.
-                if pred in pred.source.exits:
-                    pred.source.exits.remove(pred)
-
-            block.predecessors = []
-            # as the exits may be modified during the recursive call, it is unsafe to iterate on block.exits
-            # Created a copy of block.exits before calling clean cfg , and iterate over it instead.
-            for exit in block.exits[:]:
-                self.clean_cfg(exit.target, visited)
-            block.exits = []
-        else:
-            for exit in block.exits[:]:
-                self.clean_cfg(exit.target, visited)
+        if visited is None:
+            visited = set()
+        stack = [(None, iter([block]))]
+        while stack:
+            parent, exits = stack[-1]
+            exit = next(exits, None)
+            if exit is None:
+                stack.pop()
+                # The exits of an empty block are dropped once all blocks
+                # after it have been cleaned.
+                if parent is not None and parent.is_empty():
+                    parent.exits = []
+                continue
+            block = exit if parent is None else exit.target
+            # Don't visit blocks twice.
+            if block.id in visited:
+                continue
+            visited.add(block.id)
+
+            # Empty blocks are removed from the CFG.
+            if block.is_empty():
+                for pred in block.predecessors:
+                    for exit in block.exits:
+                        self.add_exit(
+                            pred.source,
+                            exit.target,
+                            merge_exitcases(pred.exitcase, exit.exitcase),
+                        )
+                        # Check if the exit hasn't yet been removed from
+                        # the predecessors of the target block.
+                        if exit in exit.target.predecessors:
+                            exit.target.predecessors.remove(exit)
+                    # Check if the predecessor hasn't yet been removed from
+                    # the exits of the source block.
+                    if pred in pred.source.exits:
+                        pred.source.exits.remove(pred)
+
+                block.predecessors = []
+            # The exits may be modified while cleaning the following blocks,
+            # so a copy of them is iterated.
+            stack.append((block, iter(block.exits[:])))
 
     def goto_new_block(self, node):
         if self.separate_node_blocks:
@@ -493,39 +540,50 @@ class CFGBuilder(ast.NodeVisitor):
         # self.current_block = after_try_block
 
     def visit_If(self, node):
-        # Add the If statement at the end of the current block.
-        self.add_statement(self.current_block, node)
-
-        # Create a new block for the body of the if.
-        if_block = self.new_block()
-        self.add_exit(self.current_block, if_block, node.test)
-
-        # Create a block for the code after the if-else.
-        afterif_block = self.new_block()
-
-        # New block for the body of the else if there is an else clause.
-        if len(node.orelse) != 0:
+        # The ifs of an elif chain are entered one after another in a loop,
+        # their bodies are visited afterwards starting with the last one.
+        chain = []
+        while True:
+            # Add the If statement at the end of the current block.
+            self.add_statement(self.current_block, node)
+
+            # Create a new block for the body of the if.
+            if_block = self.new_block()
+            self.add_exit(self.current_block, if_block, node.test)
+
+            # Create a block for the code after the if-else.
+            afterif_block = self.new_block()
+            chain.append((node, if_block, afterif_block))
+
+            # New block for the body of the else if there is an else clause.
+            if len(node.orelse) == 0:
+                self.add_exit(self.current_block, afterif_block, invert(node.test))
+                break
             else_block = self.new_block()
             self.add_exit(self.current_block, else_block, invert(node.test))
             self.current_block = else_block
+            if len(node.orelse) == 1 and type(node.orelse[0]) == ast.If:
+                node = node.orelse[0]
+                continue
             # Visit the children in the body of the else to populate the block.
             for child in node.orelse:
                 self.visit(child)
+            break
+
+        for node, if_block, afterif_block in reversed(chain):
             # If encountered a break, exit will have already been added
-            if not self.current_block.exits:
+            if len(node.orelse) != 0 and not self.current_block.exits:
                 self.add_exit(self.current_block, afterif_block)
-        else:
-            self.add_exit(self.current_block, afterif_block, invert(node.test))
 
-        # Visit children to populate the if block.
-        self.current_block = if_block
-        for child in node.body:
-            self.visit(child)
-        if not self.current_block.exits:
-            self.add_exit(self.current_block, afterif_block)
+            # Visit children to populate the if block.
+            self.current_block = if_block
+            for child in node.body:
+                self.visit(child)
+            if not self.current_block.exits:
+                self.add_exit(self.current_block, afterif_block)
 
-        # Continue building the CFG in the after-if block.
-        self.current_block = afterif_block
+            # Continue building the CFG in the after-if block.
+            self.current_block = afterif_block
 
     def visit_While(self, node):
         loop_guard = self.new_loopguard()
@@ -0,0 +1,270 @@
+"""
+Compact, array backed representation of a control flow graph.
+"""
+
+import array
+import collections
+
+from ..SSA.alg import Dominance, compute_dominance
+
+__all__ = ["CompactCFG", "BlockView", "LinkView"]
+
+
+class CompactCFG(object):
+    """
+    Control flow graph stored in integer arrays.
+
+    The blocks reachable from the entry block are numbered in breadth first
+    order (the order of CFG.get_all_blocks), the entry block has the index 0.
+    The links are stored in compressed sparse rows: the successors of the
+    block i are succ[succ_start[i]:succ_start[i + 1]] in the order of its
+    exits, the predecessors are stored the same way in pred_start and pred.
+    Links from blocks not reachable from the entry block are left out. The
+    statements of all blocks are stored in one list, the ones of block i are
+    statements[stmt_start[i]:stmt_start[i + 1]].
+
+    The graph is a snapshot, changes of the original blocks are not reflected.
+    BlockView and LinkView give read only access with the interface of Block
+    and Link.
+    """
+
+    def __init__(self, name, entry_block):
+        """
+        Build the arrays of the blocks reachable from the entry block.
+        Args:
+            name: The name of the function or module being represented.
+            entry_block: The entry block (cfg.model.Block) of the graph.
+        """
+        self.name = name
+        blocks = [entry_block]
+        index = {entry_block.id: 0}
+        queue = collections.deque(blocks)
+        while queue:
+            block = queue.popleft()
+            for link in block.exits:
+                if link.target.id not in index:
+                    index[link.target.id] = len(blocks)
+                    blocks.append(link.target)
+                    queue.append(link.target)
+
+        # The rows are collected in lists and stored in arrays at the end
+        ids = []
+        stmt_start = [0]
+        statements = []
+        func_calls = []
+        succ_start = [0]
+        succ = []
+        exitcases = []
+        # Position of each link in the successor arrays, the links are shared
+        # between the exits and the predecessors of the blocks
+        link_index = {}
+        for block in blocks:
+            ids.append(block.id)
+            statements += block.statements
+            stmt_start.append(len(statements))
+            func_calls.append(block.func_calls)
+            for link in block.exits:
+                link_index[id(link)] = len(succ)
+                succ.append(index[link.target.id])
+                exitcases.append(link.exitcase)
+            succ_start.append(len(succ))
+
+        # Predecessors with the position of their link in the successor arrays
+        pred_start = [0]
+        pred = []
+        pred_links = []
+        for block in blocks:
+            for link in block.predecessors:
+                k = link_index.get(id(link))
+                if k is not None:
+                    pred.append(index[link.source.id])
+                    pred_links.append(k)
+            pred_start.append(len(pred))
+
+        # Index of each block id
+        self.index = index
+        self.ids = array.array("q", ids)
+        self.stmt_start = array.array("q", stmt_start)
+        self.statements = statements
+        self.func_calls = func_calls
+        self.succ_start = array.array("q", succ_start)
+        self.succ = array.array("q", succ)
+        self.exitcases = exitcases
+        self.pred_start = array.array("q", pred_start)
+        self.pred = array.array("q", pred)
+        self.pred_links = array.array("q", pred_links)
+
+        self.views = [BlockView(self, i, block_id) for i, block_id in enumerate(ids)]
+        # Views of the exits and predecessors of every block, created on first access
+        self._exit_views = None
+        self._predecessor_views = None
+        self._index_dominance = None
+        self._dominance = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __str__(self):
+        return "compact CFG for {}".format(self.name)
+
+    @property
+    def entryblock(self):
+        return self.views[0]
+
+    def successors(self, i):
+        """
+        Get the indices of the successors of a block.
+        Args:
+            i: The index of the block.
+        """
+        return self.succ[self.succ_start[i]:self.succ_start[i + 1]]
+
+    def predecessors(self, i):
+        """
+        Get the indices of the predecessors of a block.
+        Args:
+            i: The index of the block.
+        """
+        return self.pred[self.pred_start[i]:self.pred_start[i + 1]]
+
+    def get_all_blocks(self):
+        """
+        Get the views of the blocks in breadth first order.
+        Returns:
+            A list of BlockView.
+        """
+        return self.views
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def link_views(self):
+        """
+        Get the views of the exits and of the predecessors of every block, they
+        are created once and shared by all accesses.
+        Returns:
+            A tuple of two lists with a list of LinkView for each block index.
+        """
+        if self._exit_views is None:
+            succ_start, succ = self.succ_start, self.succ
+            links = [LinkView(self, i, succ[k], k) for i in range(len(self)) for k in range(succ_start[i], succ_start[i + 1])]
+            self._exit_views = [links[succ_start[i]:succ_start[i + 1]] for i in range(len(self))]
+            pred_start, pred_links = self.pred_start, self.pred_links
+            self._predecessor_views = [[links[pred_links[k]] for k in range(pred_start[i], pred_start[i + 1])] for i in range(len(self))]
+        return self._exit_views, self._predecessor_views
+
+    def index_dominance(self):
+        """
+        Get the dominance information of the blocks by their indices, it is
+        computed once from the successor arrays.
+        Returns:
+            A Dominance object (see SSA.alg), the entry block is the index 0.
+        """
+        if self._index_dominance is None:
+            succ = self.succ.tolist()
+            start = self.succ_start.tolist()
+            successors = {i: succ[start[i]:start[i + 1]] for i in range(len(self))}
+            self._index_dominance = compute_dominance(successors, 0)
+        return self._index_dominance
+
+    def dominance(self):
+        """
+        Get the dominance information of the blocks by their ids.
+        Returns:
+            A Dominance object (see SSA.alg).
+        """
+        if self._dominance is None:
+            d = self.index_dominance()
+            ids = self.ids.tolist()
+            self._dominance = Dominance(ids[0], {ids[u]: ids[v] for u, v in d.idom.items()},
+                                        {ids[u]: [ids[v] for v in vs] for u, vs in d.tree.items()},
+                                        {ids[u]: {ids[v] for v in vs} for u, vs in d.frontiers.items()})
+        return self._dominance
+
+
+class BlockView(object):
+    """
+    Read only view of a block of a CompactCFG with the interface of Block.
+    """
+
+    __slots__ = ["graph", "index", "id"]
+
+    def __init__(self, graph, index, id):
+        self.graph = graph
+        self.index = index
+        # Id of the block, kept in the view as it is used as a key everywhere
+        self.id = id
+
+    @property
+    def statements(self):
+        start = self.graph.stmt_start
+        return self.graph.statements[start[self.index]:start[self.index + 1]]
+
+    @property
+    def func_calls(self):
+        return self.graph.func_calls[self.index]
+
+    @property
+    def exits(self):
+        return self.graph.link_views()[0][self.index]
+
+    @property
+    def predecessors(self):
+        return self.graph.link_views()[1][self.index]
+
+    def __str__(self):
+        if not self.is_empty():
+            return "block:{}@{}".format(self.id, self.at())
+        return "empty block:{}".format(self.id)
+
+    def at(self):
+        """
+        Get the line number of the first statement of the block in the program.
+        """
+        statements = self.statements
+        if statements and statements[0].lineno >= 0:
+            return statements[0].lineno
+        return None
+
+    def is_empty(self):
+        """
+        Check if the block is empty.
+        Returns:
+            A boolean indicating if the block is empty (True) or not (False).
+        """
+        return self.graph.stmt_start[self.index] == self.graph.stmt_start[self.index + 1]
+
+    def get_calls(self):
+        """
+        Get a string containing the calls to other functions inside the block.
+        """
+        return "".join(func_call_entry["name"] + "\n" for func_call_entry in self.func_calls)
+
+
+class LinkView(object):
+    """
+    Read only view of a link of a CompactCFG with the interface of Link.
+    """
+
+    __slots__ = ["graph", "source_index", "target_index", "link_index"]
+
+    def __init__(self, graph, source_index, target_index, link_index):
+        self.graph = graph
+        self.source_index = source_index
+        self.target_index = target_index
+        self.link_index = link_index
+
+    @property
+    def source(self):
+        return self.graph.views[self.source_index]
+
+    @property
+    def target(self):
+        return self.graph.views[self.target_index]
+
+    @property
+    def exitcase(self):
+        return self.graph.exitcases[self.link_index]
+
+    def __str__(self):
+        return "link from {} to {}".format(str(self.source), str(self.target))
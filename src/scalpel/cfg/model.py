@@ -7,10 +7,13 @@ import re
 import sys
 import token
 import tokenize
+import collections
 
 import astor
 #import graphviz as gv
 
+from .compact import CompactCFG
+
 __all__ = ["Block", "Link", "CFG"]
 
 
@@ -38,12 +41,6 @@ class Block(object):
         # Links to the next blocks in a control flow graph.
         self.exits = []
 
-    def __del__(self):
-        self.statements.clear()
-        self.func_calls.clear()
-        self.predecessors.clear()
-        self.exits.clear()
-
     def __str__(self):
         if self.statements:
             return "block:{}@{}".format(self.id, self.at())
@@ -201,13 +198,6 @@ class Link(object):
             return astor.to_source(self.exitcase)
         return ""
 
-    def __del__(self):
-        self.source = None
-        # Target block of the control flow jump.
-        self.target = None
-        # 'Case' leading to a control flow jump through this link.
-        self.exitcase = None
-
 
 class CFG(object):
     """
@@ -241,9 +231,6 @@ class CFG(object):
         self.function_args = {}
         self.class_args = {}
 
-    def __del__(self):
-        pass
-
     def __str__(self):
         return "CFG for {}".format(self.name)
 
@@ -257,42 +244,47 @@ class CFG(object):
         Returns:
             A list of code blocks.
         """
-        import queue
-
         all_blocks = []
 
-        visited = set()
-        working_queue = queue.Queue()
-        working_queue.put(self.entryblock)
+        # blocks are marked when they are queued, so every block is queued once
+        visited = {self.entryblock.id}
+        working_queue = collections.deque([self.entryblock])
 
-        while not working_queue.empty():
-            block = working_queue.get()
-            # this block has been visited
-            if block.id in visited:
-                continue
+        while working_queue:
+            block = working_queue.popleft()
             all_blocks.append(block)
-            visited.add(block.id)
             for suc_link in block.exits:
                 if suc_link.target.id not in visited:
-                    working_queue.put(suc_link.target)
+                    visited.add(suc_link.target.id)
+                    working_queue.append(suc_link.target)
         return all_blocks
         # def dfs(start_block):
         #    # non-recurisve implementation of DFS search
 
+    def compact(self):
+        """
+        Get a compact copy of this graph with the blocks and links stored in
+        integer arrays, the blocks are in the order of get_all_blocks.
+
+        Returns:
+            A CompactCFG, its blocks and links have the interface of Block and Link.
+        """
+        return CompactCFG(self.name, self.entryblock)
+
     def __iter__(self):
         """
         Generator that yields all the blocks in the current graph, then
         recursively yields from any sub graphs
         """
-        visited = set()
-        to_visit = [self.entryblock]
+        visited = {self.entryblock}
+        to_visit = collections.deque([self.entryblock])
 
         while to_visit:
-            block = to_visit.pop(0)
-            visited.add(block)
+            block = to_visit.popleft()
             for exit_ in block.exits:
-                if exit_.target in visited or exit_.target in to_visit:
+                if exit_.target in visited:
                     continue
+                visited.add(exit_.target)
                 to_visit.append(exit_.target)
             yield block
 
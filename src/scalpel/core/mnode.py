@@ -102,12 +102,14 @@ class MNode:
         results = get_func_calls(wanted_ast)
         return results
 
-    def gen_ast(self):
+    def gen_ast(self, parse=None):
         """
         Build AST tree for th source
+        Args:
+            parse: function parsing the source (e.g. a cached one), ast.parse if not given
         """
         try:
-            self.ast = ast.parse(self.source)
+            self.ast = (parse or ast.parse)(self.source)
         except Exception as e:
             self.ast = None
 
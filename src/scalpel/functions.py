@@ -1,5 +1,7 @@
 import re
 
+double_spaces_pattern = re.compile(r' {2,}')
+
 
 def replaceSpaces(text, comm_char):
     lines = text.split('\n')
@@ -21,31 +23,51 @@ def replaceSpaces(text, comm_char):
 
 
 def trim_double_spaces(text, comm_char):
-    lines = text.split('\n')
-    trimmed_lines = []
+    return '\n'.join(trim_double_spaces_lines(text.split('\n'), comm_char))
 
+
+# Same as trim_double_spaces for an iterable of lines, the trimmed lines are generated one by one
+# Strings can span over multiple lines therefore the state whether we are within a string is kept between the lines
+def trim_double_spaces_lines(lines, comm_char):
+    comment_pattern = re.compile(r'^\s*' + comm_char)
     withinString = False
     for line in lines:
-        outLine = ''
-        if re.match(r'^\s*' + comm_char, line):
-            trimmed_lines.append(line)
+        if comment_pattern.match(line):
+            yield line
             continue
-        for i, c in enumerate(line):
-            if c == '\'' and (i == 0 or line[i - 1] != '\\'):
-                withinString = not withinString
-
-            if not withinString and c == ' ' and (i + 1 < len(line) and line[i + 1] == ' '):
-                outLine += ''
-                continue
-            outLine += c
-
-        leading_spaces = re.match(r'^\s*', line).group()
-        trailing_spaces = re.search(r'\s*$', line).group()
-
-        trimmed_line = leading_spaces + outLine + trailing_spaces
-        trimmed_lines.append(trimmed_line)
-
-    return '\n'.join(trimmed_lines)
+        if '\'' not in line:
+            # Without quotes the state does not change and all spaces outside a string are collapsed
+            outLine = line if withinString else double_spaces_pattern.sub(' ', line)
+        else:
+            outLine = ''
+            for i, c in enumerate(line):
+                if c == '\'' and (i == 0 or line[i - 1] != '\\'):
+                    withinString = not withinString
+
+                if not withinString and c == ' ' and (i + 1 < len(line) and line[i + 1] == ' '):
+                    continue
+                outLine += c
+
+        # Same as matching ^\s* and \s*$ as str.strip removes the same whitespace characters
+        leading_spaces = line[:len(line) - len(line.lstrip())]
+        trailing_spaces = line[len(line.rstrip()):]
+
+        yield leading_spaces + outLine + trailing_spaces
+
+
+# Splits the text given in chunks into lines without joining the whole text, same as ''.join(chunks).split('\n')
+def split_chunks_into_lines(chunks):
+    line = []
+    for chunk in chunks:
+        if '\n' in chunk:
+            parts = chunk.split('\n')
+            line.append(parts[0])
+            yield ''.join(line)
+            yield from parts[1:-1]
+            line = [parts[-1]]
+        else:
+            line.append(chunk)
+    yield ''.join(line)
 
 
 def fix_comment_positioning(ast, ast_tree):
@@ -97,17 +119,24 @@ def get_global_unique_name(var_name, parent_vars, used_var_names):
 
 
 def get_global_unique_name_with_update(var_name, used_var_names):
-    if var_name not in used_var_names:
-        used_var_names[var_name] = 0
-        return var_name + '_' + str(used_var_names[var_name])
-    used_var_names[var_name] = used_var_names[var_name] + 1
-    return var_name + '_' + str(used_var_names[var_name])
+    return get_versioned_name(var_name, get_next_version(var_name, used_var_names))
+
+
+# Next version of the variable, the used version is stored in used_var_names
+def get_next_version(var_name, used_var_names):
+    used_var_names[var_name] = used_var_names[var_name] + 1 if var_name in used_var_names else 0
+    return used_var_names[var_name]
+
+
+# Name of a version of a variable as used in the SSA and ANF code (e.g. x_2)
+def get_versioned_name(var_name, version):
+    return var_name + '_' + str(version)
+
 
 def get_global_unique_name_with_idx(var_name, used_var_names):
     if var_name not in used_var_names:
         used_var_names[var_name] = 0
-        return var_name + '_' + str(used_var_names[var_name])
-    return var_name + '_' + str(used_var_names[var_name])
+    return get_versioned_name(var_name, used_var_names[var_name])
 
 
 #def custom_ast_parse(ast, source):
@@ -0,0 +1,352 @@
+import re
+import ast
+
+from scalpel.parse_cache import ParseCache
+from scalpel.SSA.ssa_syntax import try_get_used_version_of_function, get_node_fields, Position, SSANode, SSA_V_VAR, SSA_L, EMPTY_SPAN
+from scalpel.SSA.anf_syntax import ANFNode, ANF_V_VAR, ANF_V_CONST
+from scalpel.py_anf_transformer import transform_code
+from scalpel.config import SSA_BUFFER_VAR_NAME, ANF_BUFFER_VAR_NAME, BLOCK_IDENTIFIER
+
+# SSA buffer variables in the dumped code of a function and at the beginning of a name
+SSA_BUFFER_IN_CODE = re.compile(r'(?<![A-Za-z0-9_])' + re.escape(SSA_BUFFER_VAR_NAME) + r'([0-9]+)')
+SSA_BUFFER_NAME = re.compile(re.escape(SSA_BUFFER_VAR_NAME) + r'([0-9]+)')
+ANF_BUFFER_NAME = re.compile(re.escape(ANF_BUFFER_VAR_NAME) + r'([0-9]+)')
+# Block labels in SSA (12, 12_2) and ANF (L12, L12_2), the other labels are names of functions
+BLOCK_LABEL = re.compile('(' + re.escape(BLOCK_IDENTIFIER) + '?)([0-9]+)((?:_2)?)')
+NODE_TYPES = (SSANode, ANFNode)
+# Nodes with names or labels changed by a rebase
+RENAMED_TYPES = (SSA_V_VAR, SSA_L, ANF_V_VAR, ANF_V_CONST)
+
+
+# Functions of the last transformation of a module, reused while transforming the next version of the module
+# A function is parsed again only if its code or the versions of its variables before it changed, its position, the
+# ids of its blocks and the numbers of its buffer variables may differ (see FunctionCode), otherwise its SSA procedure
+# (including its inner functions) and its ANF letrec assignment are taken from the last transformation and rebased
+class FunctionCache:
+    def __init__(self):
+        # Function key -> CachedFunction
+        self.functions = {}
+        # SSA procedure -> (ANF buffer counter before, letrec assignment, ANF buffer counter after)
+        self.procs = {}
+        self.begin()
+
+    # Starts a transformation, only the entries used by it are kept afterwards
+    def begin(self):
+        self.next_functions = {}
+        self.next_procs = {}
+        # Rebased procedures -> (their ANF entry of the last transformation, Rebase)
+        self.rebased_procs = {}
+        self.reused = []
+        self.transformed = []
+
+    # Ends the transformation, the entries not used by it are dropped unless it failed
+    # The reused entries are taken out of the cache when they are rebased, a failed transformation drops them
+    def end(self, failed: bool = False):
+        if not failed:
+            self.functions = self.next_functions
+            self.procs = self.next_procs
+        self.next_functions = {}
+        self.next_procs = {}
+        self.rebased_procs = {}
+
+    # Returns the procedures of the function and its inner functions, parse is called if it is not cached
+    def parse_function(self, ctx, prov_info, cfg, args, parent_const_dict, parent_fun_name, parse):
+        code = FunctionCode(cfg)
+        key = function_key(ctx, prov_info, code, cfg, parent_const_dict, parent_fun_name)
+        name = cfg.name if parent_fun_name is None else parent_fun_name + '.' + cfg.name
+        cached = self.functions.pop(key, None)
+        if cached is None:
+            used_var_names, parent_vars, buffer_counter = dict(ctx.used_var_names), dict(prov_info.parent_vars), ctx.buffer_counter
+            procs = parse()
+            entry = CachedFunction(code, procs, ctx.symbols, buffer_counter, ctx.buffer_counter - buffer_counter,
+                                   get_changes(used_var_names, ctx.used_var_names), get_changes(parent_vars, prov_info.parent_vars),
+                                   used_var_names, get_results(ctx))
+            self.transformed.append(name)
+        else:
+            entry = cached.rebase(ctx, prov_info, code, self.procs, self.rebased_procs)
+            self.reused.append(name)
+        self.next_functions[key] = entry
+        return list(entry.procs)
+
+    # Returns the ANF letrec assignment of the procedure, parse is called if it is not cached
+    def parse_proc(self, ctx, p, parse):
+        rebased = self.rebased_procs.pop(p, None)
+        counter = ctx.buffer_variable_counter
+        if rebased is None:
+            entry = (counter, parse(ctx, p), ctx.buffer_variable_counter)
+        else:
+            (before, letrec, after), rebase = rebased
+            rebase.anf_delta = counter - before
+            entry = (counter, rebase.apply(letrec), counter + after - before)
+            ctx.buffer_variable_counter = entry[2]
+        self.next_procs[p] = entry
+        return entry[1]
+
+
+# A parsed function with the state of the transformation it started with and the changes it made to the state
+class CachedFunction:
+    def __init__(self, code, procs, symbols, buffer_counter: int, buffers: int, used_var_names: list, parent_vars: list,
+                 versions_before: dict, results: tuple):
+        self.code = code
+        self.procs = procs
+        # Symbol table of the transformation the procedures belong to
+        self.symbols = symbols
+        # Buffer counter before the function and number of buffer variables created while parsing it
+        self.buffer_counter = buffer_counter
+        self.buffers = buffers
+        # Versions set and variables removed by the function, as (name, version or None if removed)
+        self.used_var_names = used_var_names
+        self.parent_vars = parent_vars
+        # Versions before the function of the variables set by it which are not in its code (<ret>)
+        self.versions_before = {name: versions_before.get(name, -1) for name, _ in used_var_names if name not in code.names}
+        # Results of the last parsed CFG, they are only printed in debug mode and keep the block ids of the first parse
+        self.results = results
+
+    # Moves the function to the place of the given code in the current transformation and applies its changes
+    def rebase(self, ctx, prov_info, code, anf_procs, rebased_procs):
+        rebase = Rebase(self.symbols, ctx.symbols, code.line - self.code.line, code.block_ids[0] - self.code.block_ids[0],
+                        self.buffer_counter, ctx.buffer_counter - self.buffer_counter, code.first_buffer - self.code.first_buffer)
+        procs = [rebase.apply(p) for p in self.procs]
+        for p in procs:
+            if p in anf_procs:
+                rebased_procs[p] = (anf_procs.pop(p), rebase)
+
+        versions_before = dict(ctx.used_var_names)
+        used_var_names = [(rebase.name(name), version) for name, version in self.used_var_names]
+        for (name, version), (new_name, _) in zip(self.used_var_names, used_var_names):
+            if name in self.versions_before:
+                # The versions of these variables continue from the ones before the function
+                version += versions_before.get(new_name, -1) - self.versions_before[name]
+            apply_change(ctx.used_var_names, new_name, version)
+        # The parent variables are shared with the provenance info of the following functions
+        parent_vars = [(rebase.name(name), version) for name, version in self.parent_vars]
+        for name, version in parent_vars:
+            apply_change(prov_info.parent_vars, name, version)
+        entry = CachedFunction(code, procs, ctx.symbols, ctx.buffer_counter, self.buffers, used_var_names, parent_vars,
+                               versions_before, self.results)
+        ctx.buffer_counter += self.buffers
+        ctx.ssa_results_stored, ctx.ssa_results_loads, ctx.ssa_results_phi_stored, ctx.ssa_results_phi_loads, ctx.const_dict = self.results
+        return entry
+
+
+def get_results(ctx):
+    return ctx.ssa_results_stored, ctx.ssa_results_loads, ctx.ssa_results_phi_stored, ctx.ssa_results_phi_loads, ctx.const_dict
+
+
+# Code of a function CFG and its inner function CFGs independent of the place of the function in the module
+# The line numbers are relative to the function definition, the block ids relative to its first block and the numbers
+# of the SSA buffer variables of the preprocessing relative to the first one in the function
+class FunctionCode:
+    def __init__(self, cfg):
+        self.line = cfg.ast_node.lineno
+        self.block_ids = []
+        # Names of the variables in the code, the versions of all other variables do not change the parsed function
+        self.names = set()
+        dumps = []
+        positions = []
+        cfgs = [cfg]
+        while cfgs:
+            function_cfg = cfgs.pop(0)
+            nodes = [function_cfg.ast_node]
+            for block in function_cfg.get_all_blocks():
+                self.block_ids.append(block.id)
+                nodes += block.statements
+                dumps.append(len(block.statements))
+            # The body of the function definition is not used as it is emptied while parsing the parent CFG
+            for node in nodes:
+                dumps.append(ast.dump(node))
+                for child in ast.walk(node):
+                    if hasattr(child, 'lineno'):
+                        positions.append(self.relative_span(child))
+                    self.names.update(get_names(child))
+            cfgs += function_cfg.functioncfgs.values()
+        buffers = [int(number) for dump in dumps if isinstance(dump, str) for number in SSA_BUFFER_IN_CODE.findall(dump)]
+        self.first_buffer = min(buffers, default=0)
+        self.dumps = tuple(self.relative_buffers(dump) if isinstance(dump, str) else dump for dump in dumps)
+        self.positions = tuple(positions)
+        self.blocks = tuple(block_id - self.block_ids[0] for block_id in self.block_ids)
+
+    def relative_span(self, node):
+        end_lineno = getattr(node, 'end_lineno', None)
+        return (node.lineno - self.line, node.col_offset, None if end_lineno is None else end_lineno - self.line,
+                getattr(node, 'end_col_offset', None))
+
+    # The text with the numbers of the SSA buffer variables relative to the first one in the function
+    def relative_buffers(self, text: str):
+        return SSA_BUFFER_IN_CODE.sub(lambda m: SSA_BUFFER_VAR_NAME + str(int(m.group(1)) - self.first_buffer), text)
+
+    # Versions of the variables in the code, independent of the numbers of the buffer variables
+    def relative_versions(self, versions: dict):
+        return tuple(sorted((self.relative_buffers(name), version) for name, version in versions.items() if name in self.names))
+
+
+# Names of variables, functions, arguments and imports defined or used by the node
+def get_names(node):
+    if isinstance(node, ast.Name):
+        return [node.id]
+    if isinstance(node, ast.arg):
+        return [node.arg]
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return [node.name]
+    if isinstance(node, ast.alias):
+        return [node.name, node.asname]
+    if isinstance(node, (ast.Global, ast.Nonlocal)):
+        return node.names
+    return []
+
+
+# Everything the SSA procedures of a function depend on
+def function_key(ctx, prov_info, code, cfg, parent_const_dict, parent_fun_name):
+    return (parent_fun_name, cfg.name, code.dumps, code.positions, code.blocks,
+            try_get_used_version_of_function(cfg.name, parent_const_dict), code.relative_versions(ctx.used_var_names),
+            code.relative_versions(prov_info.parent_vars), ctx.pruned_ssa)
+
+
+# Entries set or removed in a dict, as (key, value or None if removed)
+def get_changes(before: dict, after: dict):
+    changes = [(name, version) for name, version in after.items() if before.get(name) != version]
+    return changes + [(name, None) for name in before if name not in after]
+
+
+def apply_change(versions: dict, name, version):
+    if version is not None:
+        versions[name] = version
+    elif name in versions:
+        del versions[name]
+
+
+# Moves the SSA and ANF nodes of a function to another place in the module, the nodes are changed in place as they
+# are only held by the function cache (the artifacts of a transformation are texts)
+# The line numbers, block labels and buffer variables are moved by the differences to the place they were parsed at
+# and the symbols of the variables are taken into the symbol table of the current transformation
+class Rebase:
+    def __init__(self, symbols, new_symbols, line_delta: int, block_delta: int, ssa_buffer_start: int, ssa_delta: int, code_delta: int):
+        self.symbols = symbols
+        self.new_symbols = new_symbols
+        self.line_delta = line_delta
+        self.block_delta = block_delta
+        # Buffer variables from the number ssa_buffer_start on are created while parsing the function, the ones before
+        # are in its code (created by the preprocessing)
+        self.ssa_buffer_start = ssa_buffer_start
+        self.ssa_delta = ssa_delta
+        self.code_delta = code_delta
+        # Set before the ANF nodes are moved, the ANF is created after the SSA of all functions
+        self.anf_delta = 0
+        # Ids of the moved nodes and the moved positions
+        self.done = set()
+        self.positions = {}
+
+    def name(self, name):
+        if type(name) is not str:
+            return name
+        m = SSA_BUFFER_NAME.match(name)
+        if m is not None:
+            number = int(m.group(1))
+            number += self.ssa_delta if number >= self.ssa_buffer_start else self.code_delta
+            return SSA_BUFFER_VAR_NAME + str(number) + name[m.end():]
+        m = ANF_BUFFER_NAME.match(name)
+        if m is not None:
+            return ANF_BUFFER_VAR_NAME + str(int(m.group(1)) + self.anf_delta) + name[m.end():]
+        return name
+
+    def label(self, label):
+        m = BLOCK_LABEL.fullmatch(label) if type(label) is str else None
+        if m is None:
+            return label
+        return m.group(1) + str(int(m.group(2)) + self.block_delta) + m.group(3)
+
+    def position(self, pos):
+        if pos is None or self.line_delta == 0:
+            return pos
+        moved = self.positions.get(pos)
+        if moved is None:
+            span = pos.span()
+            moved = self.positions[pos] = pos if span == EMPTY_SPAN else Position.shared(
+                (span[0] + self.line_delta, span[1], span[2] + self.line_delta, span[3]))
+        return moved
+
+    # Moves the node and its children, shared children are moved once
+    # Iterative as the ANF terms of long blocks are nested deeply
+    def apply(self, root):
+        done, position = self.done, self.position
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if id(node) in done:
+                continue
+            done.add(id(node))
+            cls = type(node)
+            node.pos_info = position(node.pos_info)
+            for field in get_node_fields(cls):
+                value = getattr(node, field)
+                if isinstance(value, NODE_TYPES):
+                    stack.append(value)
+                elif type(value) in (list, tuple):
+                    stack += iter_child_nodes(value)
+            if isinstance(node, SSANode):
+                node.span_cache = None
+            if cls in RENAMED_TYPES:
+                if cls is SSA_V_VAR:
+                    self.rename_var(node)
+                elif cls is SSA_L:
+                    node.label = self.label(node.label)
+                elif cls is ANF_V_VAR:
+                    node.name = self.name(node.name) if not node.is_block_id else self.label(node.name)
+                elif cls is ANF_V_CONST and node.is_block_id:
+                    node.value = self.label(node.value)
+        return root
+
+    def rename_var(self, var: SSA_V_VAR):
+        if var.symbol is None:
+            var.name = self.name(var.name)
+            return
+        version = self.symbols.version(var.symbol)
+        var.symbol = self.new_symbols.symbol(self.name(self.symbols.name(var.symbol)), version)
+        var.name = self.new_symbols.text(var.symbol)
+
+
+# SSA and ANF nodes in a list or tuple of a node field
+def iter_child_nodes(values):
+    for value in values:
+        if isinstance(value, NODE_TYPES):
+            yield value
+        elif type(value) in (list, tuple):
+            yield from iter_child_nodes(value)
+
+
+# Transforms versions of the same module one after another, each time reusing the unchanged functions of the last one
+# The results are the same as the ones of transform_code, the module level code is always transformed again
+class IncrementalTransformer:
+    def __init__(self, no_pos_info: bool = False, syntax: int = 0, pruned: bool = False):
+        self.no_pos_info = no_pos_info
+        self.syntax = syntax
+        self.pruned = pruned
+        self.cache = FunctionCache()
+        self.parse_cache = ParseCache()
+        self.code = None
+        self.artifacts = None
+
+    # Names of the functions taken from the last transformation and of the ones parsed again (inner functions as outer.inner)
+    @property
+    def reused(self):
+        return self.cache.reused
+
+    @property
+    def transformed(self):
+        return self.cache.transformed
+
+    def transform(self, py_code: str):
+        if py_code == self.code:
+            self.cache.reused, self.cache.transformed = self.cache.reused + self.cache.transformed, []
+            return dict(self.artifacts)
+        self.cache.begin()
+        failed = True
+        try:
+            artifacts = transform_code(py_code, False, self.no_pos_info, self.syntax, self.pruned, function_cache=self.cache,
+                                       parse_cache=self.parse_cache)
+            failed = False
+        finally:
+            self.cache.end(failed)
+        self.code = py_code
+        self.artifacts = artifacts
+        return dict(artifacts)
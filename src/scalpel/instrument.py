@@ -0,0 +1,132 @@
+import sys
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the maximum resident set size is left out there
+    resource = None
+
+# Number of functions and allocation sites kept of a profile
+PROFILE_TOP = 25
+
+
+# Peak resident set size of the process in kB (ru_maxrss is given in bytes on macOS)
+def get_max_rss_kb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+# Writes every record as one line of JSON into a file, '-' writes to stderr
+# The file is opened for every record so multiple processes can append to the same file
+class JsonLinesSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, record: dict):
+        line = json.dumps(record, sort_keys=True) + '\n'
+        if self.path == '-':
+            sys.stderr.write(line)
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+# Collects timings, counters and memory usage of transformations and emits one record per input to the sink
+# A sink is any callable taking the record (a dict which can be serialized as JSON), e.g. JsonLinesSink or list.append
+# Timers and counters are cheap enough to stay enabled, profiling and tracing memory slow the transformation down
+# The resident set size is only known as the peak of the whole process, max_rss_growth_kb is how much the input raised
+# that peak (0 if an earlier input needed more memory), the memory of the input itself is peak_memory (bytes allocated
+# at the same time while transforming the input) which needs trace_memory
+class Instrumentation:
+    def __init__(self, sink=None, profile: bool = False, trace_memory: bool = False):
+        self.sink = sink
+        # Capture a cProfile profile of every input
+        self.profile = profile
+        # Trace the allocations with tracemalloc for the peak memory of every phase and the largest allocation sites
+        self.trace_memory = trace_memory
+        self.record = None
+
+    # Measures the transformation of one input within the block, the record is emitted at its end even on errors
+    @contextlib.contextmanager
+    def measure(self, name: str):
+        self.record = {'input': name, 'status': 'ok', 'error': None, 'phases': {}, 'counters': {}}
+        if self.trace_memory:
+            self.record['memory'] = {}
+        profiler = cProfile.Profile() if self.profile else None
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            self.record['peak_memory'] = 0
+            tracemalloc.reset_peak()
+        max_rss_kb = get_max_rss_kb() if resource is not None else None
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self.record
+        except Exception as e:
+            self.record['status'] = 'failed'
+            self.record['error'] = type(e).__name__ + ': ' + str(e)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            self.record['seconds'] = time.perf_counter() - start
+            if max_rss_kb is not None:
+                self.record['max_rss_growth_kb'] = get_max_rss_kb() - max_rss_kb
+            if profiler is not None:
+                self.record['profile'] = get_profile_summary(profiler)
+            if self.trace_memory:
+                self.record['peak_memory'] = max(self.record['peak_memory'], tracemalloc.get_traced_memory()[1])
+                self.record['allocations'] = get_allocation_summary(tracemalloc.take_snapshot())
+                if started_tracing:
+                    tracemalloc.stop()
+            record, self.record = self.record, None
+            if self.sink is not None:
+                self.sink(record)
+
+    # Times the phase within the block, the times of phases with the same name are added up
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if self.record is None:
+            yield
+            return
+        if self.trace_memory:
+            # The peak of the input so far, the peak is reset for the phase
+            self.record['peak_memory'] = max(self.record['peak_memory'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = self.record['phases']
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+            if self.trace_memory:
+                memory = self.record['memory']
+                memory[name] = max(memory.get(name, 0), tracemalloc.get_traced_memory()[1])
+
+    def count(self, name: str, value: int = 1):
+        if self.record is not None:
+            counters = self.record['counters']
+            counters[name] = counters.get(name, 0) + value
+
+
+# The functions with the highest cumulative time of a profile
+def get_profile_summary(profiler: cProfile.Profile):
+    stats = pstats.Stats(profiler).stats
+    entries = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+    return [{'function': f'{filename}:{line}({function})', 'calls': calls, 'tottime': tottime, 'cumtime': cumtime}
+            for (filename, line, function), (_, calls, tottime, cumtime, _) in entries]
+
+
+# The source lines with the largest allocations still alive at the end of the transformation
+def get_allocation_summary(snapshot: tracemalloc.Snapshot):
+    return [{'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'size': stat.size,
+             'count': stat.count} for stat in snapshot.statistics('lineno')[:PROFILE_TOP]]
@@ -0,0 +1,59 @@
+import pickle
+import hashlib
+import collections
+
+import scalpel.ast_comments as ast
+
+# Default number of parsed trees and normalized codes kept by a parse cache
+DEFAULT_PARSE_ENTRIES = 64
+
+
+# Memoized parsing of Python code for a session of transformations (e.g. the requests of a server)
+# Entries are addressed by a hash of the code, the least recently used entries are evicted first
+# The transformation changes the parsed trees in place, therefore the trees are stored pickled and every parse
+# returns a new copy (loading a pickled tree takes about half the time of parsing the code with its comments)
+class ParseCache:
+    def __init__(self, max_entries: int = DEFAULT_PARSE_ENTRIES):
+        self.max_entries = max_entries
+        self.trees = collections.OrderedDict()
+        # Code -> ast.unparse(ast.parse(code))
+        self.normalized = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(code: str):
+        return hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    # Returns a new tree of the code
+    def parse(self, code: str):
+        key = self.key(code)
+        data = self.lookup(self.trees, key)
+        if data is not None:
+            return pickle.loads(data)
+        tree = ast.parse(code)
+        self.remember(self.trees, key, pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+        return tree
+
+    # Returns the reformatted code, i.e. the code unparsed from its tree
+    def normalize(self, code: str):
+        key = self.key(code)
+        normalized = self.lookup(self.normalized, key)
+        if normalized is None:
+            normalized = ast.unparse(ast.parse(code))
+            self.remember(self.normalized, key, normalized)
+        return normalized
+
+    def lookup(self, entries: collections.OrderedDict, key: bytes):
+        value = entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            entries.move_to_end(key)
+        return value
+
+    def remember(self, entries: collections.OrderedDict, key: bytes, value):
+        entries[key] = value
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
@@ -1,8 +1,27 @@
 import io
 import os
 import sys
+import json
+import time
 
-from scalpel.py_anf_transformer import test_link
+import pytest
+
+import scalpel.ast_comments as ast_comments
+from scalpel.py_anf_transformer import test_link, batch_transform, manifest_file, anf_with_prov_file, cached_transform_code, transform_code, add_missing_blank_lines, print_anf_code_to_formatted_python
+from scalpel.cache import TransformCache
+from scalpel import cache as cache_module
+from scalpel.instrument import Instrumentation
+from scalpel.SSA.alg import compute_dominance, block_dominance
+from scalpel.cfg import CFGBuilder
+from scalpel.SSA.anf_syntax import ANF_V_VAR, parse_anf_from_text, parse_ssa_to_anf, print_anf_with_prov_info, iter_anf_with_prov_info, write_anf_with_prov_info
+from scalpel.SSA.ssa_syntax import PY_to_SSA_AST, SSA_V_VAR, SSA_E_ASS, SSA_E_ASS_PHI, Position, find_child_span, merge_spans, iter_ssa_blocks, get_block_by_id, get_block_list_from_parent_block, get_ssa_index, get_phi_vars_for_jump
+from scalpel.SSA.context import TransformContext
+from scalpel.SSA.prov_sidecar import ProvColumns, split_anf_prov_info
+from scalpel.py_pipeline_benchmark import PHASES, run_benchmark
+from scalpel.server import TransformServer, serve_stream
+from scalpel.incremental import IncrementalTransformer
+from scalpel.parse_cache import ParseCache
+from scalpel import api
 
 
 def pytest_generate_tests(metafunc):
@@ -16,15 +35,395 @@ def pytest_generate_tests(metafunc):
 
 
 # Testing df_index shape against the dummy dataframe
-def test_back_transformation(filename: str):
+def test_back_transformation(filename: str, tmp_path):
     directory = './test_samples'
     f = '/'.join([directory, filename])
     if os.path.isfile(f) and not f.endswith('_out.anf'):
         file = open(f, "r")
         captured_output = io.StringIO()  # Create StringIO object
         sys.stdout = captured_output  # and redirect stdout.
-        test_link(f, True)  # Call unchanged function.
-        sys.stdout = sys.__stdout__
+        try:
+            test_link(f, True, str(tmp_path))  # Call unchanged function.
+        finally:
+            sys.stdout = sys.__stdout__
         wanted = file.read()  # ast.unparse(ast.parse(file.read())) + '\n'
 
         assert(captured_output.getvalue() == wanted)
+
+
+# Batch mode writes the outputs of every file and a manifest including failed files
+def test_batch_transformation(tmp_path):
+    inputs = ['./test_samples/14_While.py', './test_samples/15_If.py', str(tmp_path / 'invalid.py')]
+    with open(inputs[2], 'w') as f:
+        f.write('def (:')
+    manifest = batch_transform(inputs, str(tmp_path / 'out'), workers=2)
+
+    assert(manifest['files'] == 3 and manifest['succeeded'] == 2 and manifest['failed'] == 1)
+    with open(tmp_path / 'out' / manifest_file) as f:
+        assert(json.load(f) == manifest)
+    for entry in manifest['results'][:2]:
+        assert(entry['status'] == 'ok')
+        assert(os.path.isfile(os.path.join(entry['output'], anf_with_prov_file)))
+    assert(manifest['results'][2]['status'] == 'failed' and 'SyntaxError' in manifest['results'][2]['error'])
+
+
+# Cached results are reused for the same code and options and the least recently used entries are evicted first
+def test_transformation_cache(tmp_path):
+    cache = TransformCache(str(tmp_path))
+    code = 'a = 1\nprint(a)\n'
+    first, cached = cached_transform_code(code, cache)
+    assert(not cached)
+    second, cached = cached_transform_code(code, cache)
+    assert(cached and second == first)
+    _, cached = cached_transform_code(code, cache, no_pos_info=True)
+    assert(not cached)
+
+    cache.max_size = sum(size for _, size, _ in cache.entries()) - 1
+    old_key = cache.key(code, {'no_pos': False, 'output_syntax': 0, 'pruned_ssa': False})
+    os.utime(cache.entry_path(old_key), (0, 0))
+    cache.prune()
+    assert(cache.get(old_key) is None)
+    assert(cache.get(cache.key(code, {'no_pos': True, 'output_syntax': 0, 'pruned_ssa': False})) is not None)
+
+
+# Overwriting an entry replaces its size in the total size of the cache
+def test_transformation_cache_overwrite(tmp_path):
+    cache = TransformCache(str(tmp_path))
+    cache.put('a' * 64, {'ssa': 'x'})
+    for text in ['y' * 100, 'z' * 10, 'z' * 10]:
+        cache.put('b' * 64, {'ssa': text})
+    assert(cache.size == sum(size for _, size, _ in cache.entries()))
+
+
+# A change of the sources of the library invalidates the cached results
+def test_transformation_cache_sources(monkeypatch):
+    key = TransformCache.key('a = 1\n', {})
+    monkeypatch.setattr(cache_module, 'get_source_hash', lambda: 'changed')
+    assert(TransformCache.key('a = 1\n', {}) != key)
+
+
+# Dominators of a loop back to the start node which is entered from outside of the graph
+def test_dominance():
+    d = compute_dominance({1: [2], 2: [3, 4], 3: [2, 5], 4: [5], 5: [1]}, 1)
+    assert(d.idom == {1: 1, 2: 1, 4: 2, 3: 2, 5: 2})
+    assert(d.tree == {1: [2], 2: [5, 3, 4], 4: [], 3: [], 5: []})
+    assert(d.frontiers == {1: {1}, 2: {1, 2}, 3: {2, 5}, 4: {5}, 5: {1}})
+
+
+# The compact CFG has the blocks, links and dominators of the linked CFG
+def test_compact_cfg():
+    cfg = CFGBuilder().build_from_src('m', 'a = 0\nwhile a < 3:\n    if a:\n        b = a\n    a = a + 1\nprint(a)\n')
+    blocks = cfg.get_all_blocks()
+    graph = cfg.compact()
+    assert([b.id for b in graph.get_all_blocks()] == [b.id for b in blocks] == [b.id for b in cfg][:len(blocks)])
+    for block, view in zip(blocks, graph.get_all_blocks()):
+        assert(view.statements == block.statements and view.is_empty() == block.is_empty())
+        assert([(l.source.id, l.target.id, l.exitcase) for l in view.exits] == [(l.source.id, l.target.id, l.exitcase) for l in block.exits])
+        assert([l.source.id for l in view.predecessors] == [l.source.id for l in block.predecessors])
+        # The views of a link are shared between the exits and the predecessors
+        assert(all(l in l.target.predecessors for l in view.exits))
+    d, expected = graph.dominance(), block_dominance(blocks)
+    assert(d.idom == expected.idom and d.frontiers == expected.frontiers)
+
+
+# Long elif chains are built and cleaned without recursion, function bodies are built by the same builder
+def test_cfg_builder_elif_chain():
+    code = 'def f(x):\n    if x == 0:\n        y = 0\n' + ''.join(f'    elif x == {i}:\n        y = {i}\n' for i in range(1, 1200)) + '    return y\nz = f(1)\n'
+    cfg = CFGBuilder().build_from_src('m', code)
+    f_cfg = cfg.functioncfgs[(cfg.entryblock.id, 'f')]
+    assert(len(f_cfg.get_all_blocks()) == 2401 and len(f_cfg.finalblocks) == 1)
+    assert(min(b.id for b in f_cfg.get_all_blocks()) > cfg.entryblock.id)
+
+
+# Pruned SSA only places phi assignments for variables used afterwards
+def test_pruned_ssa():
+    code = 'if c:\n    a = 1\n    b = 1\nelse:\n    a = 2\n    b = 2\nprint(a)\n'
+    ssa = transform_code(code)['ssa']
+    assert('a_2 <- PHI(a_0, a_1)' in ssa and 'b_2 <- PHI(b_0, b_1)' in ssa)
+    ssa = transform_code(code, pruned=True)['ssa']
+    assert('a_2 <- PHI(a_0, a_1)' in ssa and 'PHI(b_0' not in ssa)
+
+
+# Every marker of a long module is restored once while transforming back
+def test_back_transformation_markers(tmp_path):
+    code = ''.join(f'x{i} = o.f({i})\nx{i} += {i}\n' for i in range(100))
+    f = tmp_path / 'markers.py'
+    f.write_text(code)
+    captured_output = io.StringIO()
+    sys.stdout = captured_output
+    try:
+        test_link(str(f), True, str(tmp_path / 'output'))
+    finally:
+        sys.stdout = sys.__stdout__
+
+    assert(captured_output.getvalue() == code)
+
+
+# The back transformation takes linear time, four times the lines take less than eight times as long
+def test_back_transformation_scaling():
+    timings = []
+    for n in (15, 60):
+        code = ''.join(f'a{i} = [x + {i} for x in range(3)]\n' for i in range(n))
+        anf_tree = parse_anf_from_text(api.to_anf(code))
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            out = print_anf_code_to_formatted_python(anf_tree)
+            best = min(best or float('inf'), time.perf_counter() - start)
+        assert(out == code.rstrip())
+        timings.append(best)
+
+    assert(timings[1] < 8 * timings[0])
+
+
+# The streamed ANF code with provenance info is the same as the printed one
+def test_streaming_anf_output():
+    with open('./test_samples/15_If.py', 'r') as f:
+        code = f.read()
+    ctx = TransformContext()
+    anf = parse_ssa_to_anf(PY_to_SSA_AST(code, False, ctx), False, False, ctx)
+    printed = print_anf_with_prov_info(anf, ctx)
+    out = io.StringIO()
+    write_anf_with_prov_info(anf, out, ctx)
+
+    assert(out.getvalue() == printed)
+    assert(list(iter_anf_with_prov_info(anf, ctx)) == printed.split('\n'))
+
+
+# Every phase of the pipeline is timed for each input and a failing input does not stop the benchmark
+def test_pipeline_benchmark():
+    results = run_benchmark(['./test_samples/15_If.py', './test_samples/7_FunctionDef.py'], [1])
+
+    assert(sorted(results['totals']) == sorted(PHASES))
+    assert(results['results'][0]['error'] is None and sorted(results['results'][0]['phases']) == sorted(PHASES))
+    assert(results['failed'] == 1 and results['results'][1]['error'] is not None)
+    assert([r['name'] for r in results['results'][2:]] == ['synthetic/deep_nesting_x1', 'synthetic/straight_line_x1', 'synthetic/many_functions_x1'])
+
+
+# The instrumentation emits one record with the timings of all phases and the counters for every input
+def test_instrumentation():
+    records = []
+    instrumentation = Instrumentation(records.append)
+    with instrumentation.measure('15_If.py'):
+        with open('./test_samples/15_If.py', 'r') as f:
+            artifacts = transform_code(f.read(), instrumentation=instrumentation)
+
+    assert(len(records) == 1 and records[0]['status'] == 'ok')
+    assert(sorted(records[0]['phases']) == ['anf', 'cfg', 'parse', 'preprocess', 'print', 'ssa'])
+    assert(records[0]['counters']['phis'] == artifacts['ssa'].count('PHI(') and records[0]['counters']['blocks'] > 1)
+    assert(records[0]['counters']['output_bytes'] == sum(len(artifacts[k]) for k in ('ssa', 'anf', 'anf_prov')))
+
+
+# The memory of every input is measured by itself, a large input does not raise the peak of the following ones
+def test_instrumentation_memory():
+    records = []
+    instrumentation = Instrumentation(records.append, trace_memory=True)
+    for size in (1000, 10):
+        with instrumentation.measure(str(size)):
+            transform_code(''.join(f'x{i} = {i}\n' for i in range(size)), instrumentation=instrumentation)
+
+    assert(records[0]['peak_memory'] >= max(records[0]['memory'].values()) > 0)
+    assert(records[1]['peak_memory'] < records[0]['peak_memory'] // 10)
+    assert(all(record.get('max_rss_growth_kb', 0) >= 0 for record in records))
+
+
+# The server answers every JSON line request in order, reuses cached results and stops on shutdown
+def test_server_requests():
+    with open('./test_samples/15_If.py') as f:
+        code = f.read()
+    requests = [{'id': 1, 'op': 'round_trip', 'code': code, 'options': {'no_pos': True}},
+                {'id': 2, 'op': 'transform', 'code': code, 'options': {'no_pos': True}},
+                {'id': 3, 'op': 'transform', 'code': code, 'options': {'unknown': 1}},
+                {'id': 4, 'op': 'shutdown'}, {'id': 5, 'op': 'ping'}]
+    output = io.StringIO()
+    serve_stream(TransformServer(), io.StringIO(''.join(json.dumps(r) + '\n' for r in requests) + 'x\n'), output)
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+
+    assert([r['id'] for r in responses] == [1, 2, 3, 4])
+    assert(responses[0]['ok'] and responses[0]['result']['python'] + '\n' == code)
+    assert(responses[1]['result']['cached'] and responses[1]['result']['anf'] == responses[0]['result']['anf'])
+    assert(not responses[2]['ok'] and 'unknown' in responses[2]['error'])
+    assert(responses[3]['ok'])
+
+
+# The output syntax of a request does not leak into the following requests
+def test_server_output_syntax():
+    code = 'def f(x):\n    if x:\n        y = 1\n    else:\n        y = 2\n    return y\n'
+    requests = [{'id': i, 'op': 'transform', 'code': code, 'options': {'output_syntax': syntax}}
+                for i, syntax in enumerate([1, 0, 1])]
+    output = io.StringIO()
+    # Without memory entries every request is transformed again
+    serve_stream(TransformServer(max_memory_entries=0), io.StringIO(''.join(json.dumps(r) + '\n' for r in requests)), output)
+    results = [json.loads(line)['result'] for line in output.getvalue().splitlines()]
+
+    assert(not any(r['cached'] for r in results))
+    assert('φ' in results[0]['ssa'] and 'λ' in results[0]['anf'])
+    assert('PHI' in results[1]['ssa'] and 'lambda' in results[1]['anf'])
+    assert(results[2] == results[0])
+
+
+# Nodes have no instance dictionaries, share the strings of equal names and the positions of equal spans
+def test_compact_nodes():
+    ssa_var = SSA_V_VAR(''.join(['x', '_0']))
+    anf_var = ANF_V_VAR(''.join(['x', '_', '0']), ssa_node=SSA_E_ASS(ssa_var, SSA_V_VAR('y_0')))
+    assert(not hasattr(ssa_var, '__dict__') and not hasattr(anf_var, '__dict__'))
+    assert(anf_var.name is ssa_var.name)
+    assert(Position.shared((1, 0, 1, 5)) is Position.shared((1, 0, 1, 5)))
+
+
+# Spans of blocks are computed once, the positions of the labels within are added on every lookup
+def test_block_spans():
+    ssa = PY_to_SSA_AST('x = 1\nwhile x < 3:\n    x += 1\nprint(x)\n', False, TransformContext())
+    for block in iter_ssa_blocks(ssa):
+        span = find_child_span(block)
+        assert(block.span_cache is not None and find_child_span(block) == span)
+        for label in block.span_cache[1]:
+            assert(label.pos_info is None or merge_spans(span, label.pos_info.span()) == span)
+
+
+# Shared positions cannot be changed by one of the nodes holding them
+def test_position_immutable():
+    position = Position.shared((1, 0, 1, 5))
+    with pytest.raises(AttributeError):
+        position.lineno = 2
+    assert(position.span() == (1, 0, 1, 5) and str(position) == '1:0,1:5')
+
+
+# Renamed variables are symbols of the symbol table, all versions of a variable share the same base name
+def test_symbol_table():
+    code = 'if c:\n    my_a = 1\n    my_b = 2\nelse:\n    my_a = 3\n    my_b = 4\nprint(my_a, my_b)\n'
+    ssa_ast = PY_to_SSA_AST(code, False, TransformContext())
+    symbols = ssa_ast.symbols
+    phis = [term for b in iter_ssa_blocks(ssa_ast) for term in b.terms if isinstance(term, SSA_E_ASS_PHI)]
+    assert(sorted(phi.var.name for phi in phis) == ['my_a_2', 'my_b_2'])
+    for phi in phis:
+        for var in [phi.var] + phi.args:
+            assert(var.name is symbols.text(var.symbol))
+            assert(symbols.base(var.symbol) == symbols.base(phi.var.symbol))
+    assert(symbols.symbol('my_a', 2) in [phi.var.symbol for phi in phis])
+
+
+# The arguments of a jump to phi assignments are the versions assigned in the block, found by their symbols
+def test_phi_vars_for_jump():
+    code = 'if c:\n    a = 1\nelif d:\n    a = 2\nelse:\n    a = 3\nprint(a)\n'
+    ssa_ast = PY_to_SSA_AST(code, False, TransformContext())
+    index = get_ssa_index(ssa_ast)
+    join, phi = [(b, term) for b in iter_ssa_blocks(ssa_ast) for term in b.terms if isinstance(term, SSA_E_ASS_PHI)][0]
+    jumps = [b for b in iter_ssa_blocks(ssa_ast) if index.get_assigned(b) & {arg.symbol for arg in phi.args}]
+    assert([get_phi_vars_for_jump(b, join, ssa_ast) for b in jumps] == [[arg] for arg in phi.args])
+
+
+# Blocks are looked up by label in the index of the SSA AST and block lists do not leak between calls
+def test_ssa_index():
+    code = 'x = 0\nif x > 1:\n    x = 2\nelse:\n    x = 3\nwhile x < 5:\n    x = x + 1\nprint(x)\n'
+    first = PY_to_SSA_AST(code, False, TransformContext())
+    second = PY_to_SSA_AST(code, False, TransformContext())
+    blocks = list(iter_ssa_blocks(first))
+    assert(all(get_block_by_id(first, b.label.label) is b for b in blocks))
+    assert(get_block_list_from_parent_block(first.blocks[0]) == blocks[1:])
+    assert(get_block_list_from_parent_block(second.blocks[0]) == list(iter_ssa_blocks(second))[1:])
+    parents = get_ssa_index(first).parents
+    assert(all(parent in parents[b.label.label] for parent in blocks[1:] for b in parent.blocks))
+
+
+# Only the changed functions are transformed again and the results are the same as transforming the whole module
+def test_incremental_transformation():
+    code = 'def f(a):\n    b = a + 1\n    return b\n\ndef g(a):\n    if a:\n        a = 2\n    return a\nprint(f(1), g(2))\n'
+    transformer = IncrementalTransformer()
+    assert(transformer.transform(code) == transform_code(code) and transformer.transformed == ['f', 'g'])
+    changed = code.replace('a = 2', 'a = 3')
+    assert(transformer.transform(changed) == transform_code(changed))
+    assert(transformer.reused == ['f'] and transformer.transformed == ['g'])
+
+
+# Functions after an edit are moved to their new lines, blocks and buffer variables instead of being parsed again
+def test_incremental_edit_above():
+    code = 'def f(a):\n    b = a + 1\n    return b\n\ndef g(a):\n    for x in [a, f(a)]:\n        a += x\n    return a\nprint(f(1), g(2))\n'
+    transformer = IncrementalTransformer(syntax=1, pruned=True)
+    transformer.transform(code)
+    above = 'y = [1]\nfor z in y:\n    y += z\n' + code
+    assert(transformer.transform(above) == transform_code(above, syntax=1, pruned=True))
+    assert(transformer.reused == ['f', 'g'] and transformer.transformed == [])
+    changed = above.replace('b = a + 1', 'c = 1\n    b = a + c')
+    assert(transformer.transform(changed) == transform_code(changed, syntax=1, pruned=True))
+    assert(transformer.reused == ['g'] and transformer.transformed == ['f'])
+
+
+# The in-memory API returns the same results as transform_code without printing anything
+def test_in_memory_api(capsys):
+    code = 'x = [1]\nx[0] = 2\nif x:\n    y = 1\nelse:\n    y = 2\nprint(y)\n'
+    artifacts = transform_code(code, no_pos_info=True)
+    capsys.readouterr()
+    assert(api.to_ssa(code).print(0) == artifacts['ssa'])
+    assert(api.to_anf(code, {'no_pos': True}) == artifacts['anf_prov'])
+    assert(api.from_anf(artifacts['anf_prov']) == api.round_trip(code))
+    assert(api.transform(code, {'no_pos': True}) == artifacts)
+    assert(capsys.readouterr().out == '')
+
+
+# The output syntax only applies to its own call
+def test_api_output_syntax():
+    code = 'def f(x):\n    if x:\n        y = 1\n    else:\n        y = 2\n    return y\n'
+    ssa = [api.to_ssa(code, {'output_syntax': syntax}).print(0) for syntax in [1, 0, 1]]
+    anf = [api.to_anf(code, {'output_syntax': syntax}) for syntax in [1, 0, 1]]
+
+    assert('φ' in ssa[0] and 'PHI' in ssa[1] and ssa[2] == ssa[0])
+    assert('λ' in anf[0] and 'lambda' in anf[1] and anf[2] == anf[0])
+    assert(api.from_anf(anf[0]) == api.from_anf(anf[1]))
+
+
+# Long blocks are lowered into ANF without recursion over the terms
+def test_long_block_to_anf():
+    code = ''.join(f'x{i} = f(g({i}))\n' for i in range(1200))
+    anf = api.to_anf(code, {'no_pos': True})
+    assert(anf.count('let x') == 1200 and anf.index('x0_0') < anf.index('x1199_0'))
+    assert('let %_0 = g 0 in' in anf and 'let %_1199 = g 1199 in' in anf)
+
+
+# The provenance sidecar holds the same provenance info as the ANF code and answers position queries
+def test_prov_sidecar():
+    with open('./test_samples/15_If.py') as f:
+        code = f.read()
+    anf_w_prov = api.to_anf(code)
+    anf_code, data = api.to_anf_sidecar(code)
+    columns = ProvColumns.from_bytes(data)
+    assert((anf_code, columns.info_words()) == (split_anf_prov_info(anf_w_prov)[0], split_anf_prov_info(anf_w_prov)[1].info_words()))
+    assert(api.from_anf_sidecar(anf_code, data) == api.from_anf(anf_w_prov))
+    words = anf_code.split()
+    assert(columns.positions(words.index('a_0')) == [(1, 0, 1, 1)])
+    assert([words[token] for token in columns.tokens_at(3, 8)] == ['L2', '=', 'let', '=', '8', 'in', 'if', 'then', 'L2', 'else'])
+
+
+# Comments are attached to the innermost body containing their line, in the order of the lines
+def test_comment_placement():
+    tree = ast_comments.parse('# a\ndef f(x):  # b\n    # c\n    if x:\n        y = 1  # d\n        # e\n    return y\n# f\n')
+    kinds = lambda body: [type(node).__name__ for node in body]
+    assert(kinds(tree.body) == ['Comment', 'FunctionDef', 'Comment'])
+    assert(kinds(tree.body[1].body) == ['Comment', 'Comment', 'If', 'Return'])
+    assert(kinds(tree.body[1].body[2].body) == ['Assign', 'Comment', 'Comment'])
+    comments = [(node.value, node.inline) for body in (tree.body, tree.body[1].body, tree.body[1].body[2].body) for node in body if isinstance(node, ast_comments.Comment)]
+    assert(comments == [('# a', False), ('# f', False), ('# b', True), ('# c', False), ('# d', True), ('# e', False)])
+
+
+# Parsed trees are returned as new copies, repeated code is parsed and normalized once and old entries are evicted
+def test_parse_cache():
+    cache = ParseCache(max_entries=2)
+    code = 'def f(x):  # a\n    return x\n'
+    tree = cache.parse(code)
+    tree.body.clear()
+    again = cache.parse(code)
+    assert(again is not tree and ast_comments.unparse(again) == ast_comments.unparse(ast_comments.parse(code)))
+    assert(cache.normalize(code) == cache.normalize(code) == ast_comments.unparse(ast_comments.parse(code)))
+    assert((cache.hits, cache.misses) == (2, 2))
+    assert(transform_code(code, parse_cache=cache) == transform_code(code))
+    cache.parse('a = 1\n')
+    cache.parse('b = 2\n')
+    assert(len(cache.trees) == 2)
+
+
+# Blank lines are added after top-level and inner functions in one pass and adding them again changes nothing
+def test_add_missing_blank_lines():
+    code = 'import os\ndef f():\n    def g():\n        pass\n    return g\ndef h():\n    pass\n\nx = 1\ndef k():\n    pass'
+    assert(add_missing_blank_lines(code) == 'import os\ndef f():\n    def g():\n        pass\n\n    return g\n\n\n'
+           'def h():\n    pass\n\n\nx = 1\ndef k():\n    pass')
+    assert(add_missing_blank_lines(add_missing_blank_lines(code)) == add_missing_blank_lines(code))
@@ -1,22 +1,30 @@
 import os
 import sys
 import re
+import glob
+import json
+import time
 import argparse
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+if __name__ == '__main__':
+    # Make the package importable when this file is run as a script without installing it
+    content_root = re.split(r'(\\|/)*scalpel', os.path.abspath(__file__))[0]
+    if content_root not in sys.path:
+        sys.path.append(content_root)
 
-import ast as ast2
 import scalpel.ast_comments as ast
 from scalpel.config import NEW_COMMENT_MARKER
 
 from scalpel.functions import trim_double_spaces
-
-print('Absolute path: ', os.path.abspath(__file__))
-content_root = re.split(r'(\\|/)*scalpel', os.path.abspath(__file__))[0]
-print(content_root)
-if content_root not in sys.path:
-    sys.path.append(content_root)
-
-from scalpel.SSA.anf_syntax import parse_ssa_to_anf, parse_anf_from_text, print_anf_with_prov_info, print_anf_code_to_python
-from scalpel.SSA.ssa_syntax import PY_to_SSA_AST, parse_ssa_to_python
+from scalpel.SSA.anf_syntax import parse_ssa_to_anf, parse_anf_from_text, print_anf_with_prov_info, print_anf_code_to_python, count_anf_nodes
+from scalpel.SSA.ssa_syntax import PY_to_SSA_AST, parse_ssa_to_python, iter_ssa_blocks, SSA_E_ASS_PHI
+from scalpel.SSA.context import TransformContext
+from scalpel.SSA.prov_sidecar import split_anf_prov_info
+from scalpel.cache import DEFAULT_CACHE_SIZE, TransformCache, open_cache
+from scalpel.instrument import Instrumentation, JsonLinesSink
 
 output_folder = 'output'
 
@@ -24,6 +32,9 @@ ssa_file = 'ssa_parsed.txt'
 anf_file = 'anf_parsed.txt'
 anf_with_prov_file = 'anf_parsed_with_prov_info.txt'
 compare_file = 'code_comparison.txt'
+anf_code_file = 'anf_parsed_code.txt'
+anf_prov_sidecar_file = 'anf_parsed_prov.bin'
+manifest_file = 'manifest.json'
 
 default_code_to_transform = ""  # Change this value to transform another code
 
@@ -35,7 +46,16 @@ only_parse_back = False
 output_syntax = 0
 no_output_files = False
 no_pos = False
+pruned_ssa = False
 print_prov_info = False
+# Also save the plain ANF code and its provenance info as columns in a binary file, see scalpel.SSA.prov_sidecar
+prov_sidecar = False
+cache_dir = None
+cache_size = DEFAULT_CACHE_SIZE
+# JSON lines file for the timings and counters of every transformation ('-' for stderr), see scalpel.instrument
+metrics_file = None
+metrics_profile = False
+metrics_trace_memory = False
 
 
 
@@ -63,27 +83,13 @@ def transform():
     if only_parse_back:
         pass
     else:
-        # Reformat the code
-        x = ast.parse(py_code)
-        py_code = ast.unparse(ast.parse(py_code))
-        y = ast2.parse(py_code)
-        # Create a SSA AST from python code
-        ssa_ast = PY_to_SSA_AST(py_code, debug_mode)
-        if output_syntax == 0:
-            ssa_ast.enable_print_ascii()
-
-        if debug_mode:
-            print("Transformed SSA tree printed:")
-            print(trim_double_spaces(ssa_ast.print(0), NEW_COMMENT_MARKER))
-            print('\n\n\n')
-
-        # Create an ANF AST from SSA AST
-        anf_ast = parse_ssa_to_anf(ssa_ast, debug_mode, no_pos)
-        if output_syntax == 0:
-            anf_ast.enable_print_ascii()
-
-        anf_w_prov = print_anf_with_prov_info(anf_ast)
-
+        cache = open_cache(cache_dir, cache_size) if cache_dir is not None else None
+        instrumentation = None
+        if metrics_file is not None:
+            instrumentation = Instrumentation(JsonLinesSink(metrics_file), metrics_profile, metrics_trace_memory)
+        with instrumentation.measure(python_code_path or '<default>') if instrumentation else contextlib.nullcontext():
+            artifacts, _ = cached_transform_code(py_code, cache, debug_mode, no_pos, output_syntax, pruned_ssa, instrumentation)
+        anf_w_prov = artifacts['anf_prov']
 
         if debug_mode:
             print("Transformed AST tree printed:")
@@ -92,7 +98,7 @@ def transform():
             if print_prov_info:
                 print(anf_w_prov)
             else:
-                print(trim_double_spaces(anf_ast.print(0), NEW_COMMENT_MARKER))
+                print(trim_double_spaces(artifacts['anf'], NEW_COMMENT_MARKER))
 
         if debug_mode:
             print('\n\n\n')
@@ -102,14 +108,11 @@ def transform():
 
         # Print parsed SSA and ANF code to output files
         if not no_output_files:
-            with open(output_folder + '/' + ssa_file, 'w', encoding="utf-8") as f:
-                f.write(ssa_ast.print(0))
-            with open(output_folder + '/' + anf_file, 'w', encoding="utf-8") as f:
-                f.write(anf_ast.print(0))
-            with open(output_folder + '/' + anf_with_prov_file, 'w', encoding="utf-8") as f:
-                f.write(anf_w_prov)
+            write_output_files(output_folder, artifacts['ssa'], artifacts['anf'], anf_w_prov)
             with open(output_folder + '/' + compare_file, 'w', encoding="utf-8") as f:
-                f.write(ssa_ast.code + '\n##########\n' + anf_w_prov)
+                f.write(artifacts['code'] + '\n##########\n' + anf_w_prov)
+            if prov_sidecar:
+                write_prov_sidecar_files(output_folder, anf_w_prov)
 
     if parse_back or only_parse_back:
 
@@ -128,21 +131,7 @@ def transform():
 
 
         # Parsing the anf code back to Python
-        anf_to_python = print_anf_code_to_python(parsed)
-        # if debug_mode:
-            # print('Parsed Python code from ANF to Python test printed:')
-            # print(ast.unparse(ast.parse(anf_to_python)))
-            # print('\n\n\n')
-            # print('Parsed Python code from ANF to SSA test printed:')
-            # print(parse_anf_to_ssa(parsed).print())
-            # print(parse_ssa_to_python(parse_anf_to_ssa(parsed)))
-            # print('\n\n\n')
-            # print('\n\n\n')
-
-        # print(anf_to_python)
-        x = ast.parse(anf_to_python)
-        # print(ast.unparse(x))
-        print(add_missing_blank_lines(ast.unparse(x)).rstrip())
+        print(print_anf_code_to_formatted_python(parsed))
 
     # Transform the ast tree back to Python
     # TODO: Implementation of back transformation
@@ -151,59 +140,207 @@ def transform():
     # TODO: SSA - ?? NamedExpr, SetComp, DictComp, GeneratorExp
     # TODO: LATEX format prints
 
-def test_link(path: str, back: bool):
-    global python_code_path, debug_mode, parse_back, no_pos
+# Transform python code into SSA and ANF and return the reformatted code and the printed SSA, ANF and ANF with provenance info
+# With instrumentation the phases are timed and the sizes of the intermediate results are counted
+def transform_code(py_code: str, debug: bool = False, no_pos_info: bool = False, syntax: int = 0, pruned: bool = False, instrumentation: Instrumentation = None, function_cache=None, quiet: bool = False, parse_cache=None):
+    ctx = TransformContext(debug, no_pos_info, pruned, instrumentation, function_cache, quiet, parse_cache, syntax)
+    # Reformat the code
+    with ctx.phase('parse'):
+        py_code = ctx.normalize(py_code)
+    # Create a SSA AST from python code
+    ssa_ast = PY_to_SSA_AST(py_code, debug, ctx)
+
+    if debug:
+        print("Transformed SSA tree printed:")
+        print(trim_double_spaces(ssa_ast.print(0), NEW_COMMENT_MARKER))
+        print('\n\n\n')
+
+    # Create an ANF AST from SSA AST
+    with ctx.phase('anf'):
+        anf_ast = parse_ssa_to_anf(ssa_ast, debug, no_pos_info, ctx)
+
+    with ctx.phase('print'):
+        anf_w_prov = print_anf_with_prov_info(anf_ast, ctx)
+        artifacts = {'code': ssa_ast.code, 'ssa': ssa_ast.print(0), 'anf': anf_ast.print(0, font=ctx.font), 'anf_prov': anf_w_prov}
+    if instrumentation is not None:
+        count_transformation(instrumentation, ctx, ssa_ast, anf_ast, artifacts)
+    return artifacts
+
+
+# Count the sizes of the intermediate results of a transformation
+def count_transformation(instrumentation: Instrumentation, ctx: TransformContext, ssa_ast, anf_ast, artifacts: dict):
+    blocks = 0
+    phis = 0
+    for block in iter_ssa_blocks(ssa_ast):
+        blocks += 1
+        phis += sum(1 for term in block.terms if isinstance(term, SSA_E_ASS_PHI))
+    instrumentation.count('blocks', blocks)
+    instrumentation.count('phis', phis)
+    instrumentation.count('ssa_buffer_vars', ctx.buffer_counter)
+    instrumentation.count('anf_buffer_vars', ctx.buffer_variable_counter)
+    instrumentation.count('anf_nodes', count_anf_nodes(anf_ast))
+    instrumentation.count('output_bytes', sum(len(artifacts[name].encode('utf-8')) for name in ('ssa', 'anf', 'anf_prov')))
+
+
+# Same as transform_code but the results are looked up in the given cache first, on a hit the code is not even parsed
+# Returns the results and whether they were taken from the cache, the debug mode always runs the whole transformation
+def cached_transform_code(py_code: str, cache: TransformCache = None, debug: bool = False, no_pos_info: bool = False, syntax: int = 0, pruned: bool = False, instrumentation: Instrumentation = None, parse_cache=None):
+    if cache is None or debug:
+        return transform_code(py_code, debug, no_pos_info, syntax, pruned, instrumentation, parse_cache=parse_cache), False
+    key = cache.key(py_code, {'no_pos': no_pos_info, 'output_syntax': syntax, 'pruned_ssa': pruned})
+    artifacts = cache.get(key)
+    if artifacts is not None:
+        if instrumentation is not None:
+            instrumentation.count('cached')
+        return artifacts, True
+    artifacts = transform_code(py_code, debug, no_pos_info, syntax, pruned, instrumentation, parse_cache=parse_cache)
+    cache.put(key, artifacts)
+    return artifacts, False
+
+
+# Parse the ANF tree back into reformatted Python code
+def print_anf_code_to_formatted_python(parsed):
+    anf_to_python = print_anf_code_to_python(parsed)
+    return add_missing_blank_lines(ast.unparse(ast.parse(anf_to_python))).rstrip()
+
+
+# The output files are written into the given folder (default: output)
+def test_link(path: str, back: bool, output_path: str = 'output'):
+    global python_code_path, debug_mode, parse_back, no_pos, output_folder
     python_code_path = path
     debug_mode = False
     parse_back = back
     no_pos = True
+    output_folder = output_path
     transform()
 
 
+# Write the SSA, ANF and ANF with provenance info output files into the given folder
+def write_output_files(folder: str, ssa_code: str, anf_code: str, anf_w_prov: str):
+    with open(os.path.join(folder, ssa_file), 'w', encoding="utf-8") as f:
+        f.write(ssa_code)
+    with open(os.path.join(folder, anf_file), 'w', encoding="utf-8") as f:
+        f.write(anf_code)
+    with open(os.path.join(folder, anf_with_prov_file), 'w', encoding="utf-8") as f:
+        f.write(anf_w_prov)
+
+
+# Write the plain ANF code and the columns of its provenance info into the given folder
+def write_prov_sidecar_files(folder: str, anf_w_prov: str):
+    code, columns = split_anf_prov_info(anf_w_prov)
+    with open(os.path.join(folder, anf_code_file), 'w', encoding="utf-8") as f:
+        f.write(code)
+    with open(os.path.join(folder, anf_prov_sidecar_file), 'wb') as f:
+        f.write(columns.to_bytes())
+
+
+# Collect the python files to be transformed from the given directories, glob patterns and file paths
+def collect_input_files(inputs: [str]):
+    files = []
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for root, dirs, filenames in os.walk(input_path):
+                dirs.sort()
+                files.extend(os.path.join(root, filename) for filename in sorted(filenames) if filename.endswith('.py'))
+        elif glob.has_magic(input_path):
+            files.extend(path for path in sorted(glob.glob(input_path, recursive=True)) if os.path.isfile(path))
+        else:
+            files.append(input_path)
+    # Remove duplicates while keeping the order
+    return list(dict.fromkeys(files))
+
+
+# Transform a single file for the batch mode and write its output files into output_dir
+# Errors are caught and reported in the returned manifest entry so a single file can not stop the batch
+def transform_file(job: (str, str, bool, int, str, int, bool, str, bool, bool)):
+    path, output_dir, no_pos_info, syntax, cache_path, max_cache_size, pruned, metrics_path, profile, trace_memory = job
+    entry = {'input': path, 'output': output_dir, 'status': 'ok', 'error': None, 'cached': False}
+    instrumentation = Instrumentation(JsonLinesSink(metrics_path), profile, trace_memory) if metrics_path is not None else None
+    start = time.perf_counter()
+    try:
+        with open(path, 'r', encoding="utf8") as file:
+            py_code = file.read()
+        cache = open_cache(cache_path, max_cache_size) if cache_path is not None else None
+        with instrumentation.measure(path) if instrumentation else contextlib.nullcontext():
+            artifacts, entry['cached'] = cached_transform_code(py_code, cache, False, no_pos_info, syntax, pruned, instrumentation)
+        os.makedirs(output_dir, exist_ok=True)
+        write_output_files(output_dir, artifacts['ssa'], artifacts['anf'], artifacts['anf_prov'])
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+    entry['seconds'] = round(time.perf_counter() - start, 6)
+    return entry
+
+
+# Transform all given files in parallel and write the outputs of each file into its own folder below output_dir
+# The folders mirror the paths of the input files relative to their common directory
+# A manifest with the status and timing of every file is written to output_dir and returned
+# With a cache_path the results are cached between runs, see scalpel.cache
+# With a metrics_path the timings and counters of every file are appended to it as JSON lines, see scalpel.instrument
+def batch_transform(inputs: [str], output_dir: str, workers: int = None, no_pos_info: bool = False, syntax: int = 0,
+                    cache_path: str = None, max_cache_size: int = DEFAULT_CACHE_SIZE, pruned: bool = False,
+                    metrics_path: str = None, profile: bool = False, trace_memory: bool = False):
+    files = collect_input_files(inputs)
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files]) if files else ''
+    jobs = [(f, os.path.join(output_dir, os.path.splitext(os.path.relpath(os.path.abspath(f), base))[0]), no_pos_info, syntax, cache_path, max_cache_size, pruned, metrics_path, profile, trace_memory) for f in files]
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers == 1 or len(jobs) <= 1:
+        entries = [transform_file(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Hand out the files in chunks to keep the inter process overhead small for large corpora
+            chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+            entries = list(executor.map(transform_file, jobs, chunksize=chunksize))
+    total = time.perf_counter() - start
+    # The workers only know about their own writes, the size limit is enforced for the whole cache at the end
+    if cache_path is not None:
+        TransformCache(cache_path, max_cache_size).prune()
+
+    manifest = {
+        'files': len(entries),
+        'succeeded': sum(1 for e in entries if e['status'] == 'ok'),
+        'failed': sum(1 for e in entries if e['status'] != 'ok'),
+        'cached': sum(1 for e in entries if e['cached']),
+        'workers': workers,
+        'seconds': round(total, 6),
+        'results': entries,
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, manifest_file), 'w', encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# Blank lines after function definitions: two after top-level functions (unless they end the code), one after inner ones
+# The insertion points are taken from a single parse and the lines are joined once
 def add_missing_blank_lines(input_code):
-    # Parse the input code into an Abstract Syntax Tree (AST)
     tree = ast.parse(input_code)
+    lines = input_code.split('\n')
 
-    # Helper function to add two blank lines after the end of a function block
-    def add_blank_lines(node, two_blank_lines: bool):
-        lines = input_code.split('\n')
-        end_lineno = node.end_lineno  # Line number of the last line of the function block
-        added = False
-
-        # Check if there are no blank lines after the function block
-        if end_lineno < len(lines) and lines[end_lineno].strip() != '':
-            lines.insert(end_lineno, '')  # Add a blank line after the end of the function block
-            if two_blank_lines:
-                lines.insert(end_lineno, '')  # Add a blank line after the end of the function block
-            added = True
-        elif two_blank_lines and end_lineno < len(lines) - 1 and lines[end_lineno + 1].strip() != '':
-            lines.insert(end_lineno, '')  # Add a blank line after the end of the function block
-            added = True
-
-        return '\n'.join(lines), added
-
-    new_code = input_code
-
-    # recursively call the function until no more lines are added
-    added = False
-    for node in list(ast.iter_child_nodes(tree)):
-        added = False
+    # Index of the line following a function -> number of blank lines needed there
+    needed = {}
+    for node in ast.iter_child_nodes(tree):
+        if isinstance(node, ast.FunctionDef):
+            needed[node.end_lineno] = 2
+    for node in ast.walk(tree):
         if isinstance(node, ast.FunctionDef):
-            # top-level function definition
-            new_code, added = add_blank_lines(node, True)
-        if added:
-            break
-    if not added:
-        for node in ast.walk(tree):
-            added = False
-            if isinstance(node, ast.FunctionDef):
-                # top-level function definition
-                new_code, added = add_blank_lines(node, False)
-            if added:
-                break
-    if added:
-        return add_missing_blank_lines(new_code)
-    return new_code
+            needed.setdefault(node.end_lineno, 1)
+
+    new_lines = []
+    last = 0
+    for end_lineno in sorted(needed):
+        new_lines += lines[last:end_lineno]
+        last = end_lineno
+        blank = 0
+        while blank < needed[end_lineno] and end_lineno + blank < len(lines) and lines[end_lineno + blank].strip() == '':
+            blank += 1
+        # Nothing is added at the end of the code
+        if end_lineno + blank < len(lines):
+            new_lines += [''] * (needed[end_lineno] - blank)
+    new_lines += lines[last:]
+    return '\n'.join(new_lines)
 
 
 def str2bool(v):
@@ -219,7 +356,7 @@ def str2bool(v):
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='This is the discription')
-    parser.add_argument('-i', '--input_path', required=True, default=None, type=str, help="The filepath for the python code to be transformed")
+    parser.add_argument('-i', '--input_path', default=None, type=str, nargs='+', help="The filepath for the python code to be transformed, multiple files, directories or glob patterns start the batch mode")
     parser.add_argument('-o', '--output_path', default='output', type=str, help="Under this path all saved files will be placed, if not given the files will be saved in a locally created output folder")
     # parser.add_argument("--ssa_out_name", '--ssa', default='ssa_parsed.txt', type=str, help="The filename for the generated SSA code")
     # parser.add_argument("--anf_out_name", '--anf', default='anf_parsed.txt', type=str, help="The filename for the generated ANF code")
@@ -231,23 +368,55 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--output_syntax', default=0, type=int, help="The format in which the output is printed (0...ascii, 1...code)")
     parser.add_argument('-n', '--no_output_files', action='store_true', help="When given the library will save no files and only print onto the console")
     parser.add_argument('--print_prov_info', action='store_true', help="When given the library will print the anf together with its provenance info to the console")
+    parser.add_argument('--prov_sidecar', action='store_true', help="When given the plain ANF code and its provenance info in a binary columnar format are saved as well")
     parser.add_argument('--no_pos', action='store_true', help="When given the library will not track positional info of variables etc.")
+    parser.add_argument('--pruned_ssa', action='store_true', help="When given phi assignments are only placed for variables which are used afterwards")
+    parser.add_argument('--batch', action='store_true', help="Transforms all given files in parallel and saves the outputs of every file together with a manifest under the output path")
+    parser.add_argument('--cache_dir', default=None, type=str, help="Results are cached in this folder and reused for unchanged files and options")
+    parser.add_argument('--cache_size', default=DEFAULT_CACHE_SIZE // (1024 * 1024), type=int, help="Maximum size of the cache in MB, the least recently used results are removed first")
+    parser.add_argument('-j', '--workers', default=None, type=int, help="Number of worker processes used in the batch mode (default: number of CPUs)")
+    parser.add_argument('--metrics', default=None, type=str, help="Appends the phase timings, counters and peak memory of every transformed file as a JSON line to this file ('-' for stderr)")
+    parser.add_argument('--profile', action='store_true', help="Adds the functions with the highest cumulative time (cProfile) of every file to the metrics")
+    parser.add_argument('--serve', nargs='?', const='-', default=None, type=str, help="Starts a server answering JSON line requests on stdin/stdout or on the Unix socket at the given path, see scalpel.server")
+    parser.add_argument('--trace_memory', action='store_true', help="Adds the peak memory of every phase and the largest allocations (tracemalloc) of every file to the metrics")
 
     args = parser.parse_args()
 
+    if args.serve is not None:
+        from scalpel.server import serve
+        serve(args.serve, args.cache_dir, args.cache_size * 1024 * 1024)
+        sys.exit(0)
+    if args.input_path is None:
+        parser.error('the following arguments are required: -i/--input_path')
+
     output_folder = args.output_path
     # ssa_file = args.ssa_out_name
     # anf_file = args.anf_out_name
     # anf_with_prov_file = args.anf_with_prov_out_name
     no_output_files = args.no_output_files
-    python_code_path = args.input_path
+    python_code_path = args.input_path[0]
     debug_mode = str2bool(args.debug_mode)
     #print_CFG_graph = str2bool(args.save_cfg)
     parse_back = str2bool(args.parse_back)
     only_parse_back = str2bool(args.only_parse_back)
     output_syntax = args.output_syntax
     no_pos = args.no_pos
+    pruned_ssa = args.pruned_ssa
     print_prov_info = args.print_prov_info
+    prov_sidecar = args.prov_sidecar
+    cache_dir = args.cache_dir
+    cache_size = args.cache_size * 1024 * 1024
+    metrics_file = args.metrics
+    metrics_profile = args.profile
+    metrics_trace_memory = args.trace_memory
+
+    if args.batch or len(args.input_path) > 1 or os.path.isdir(python_code_path) or glob.has_magic(python_code_path):
+        manifest = batch_transform(args.input_path, output_folder, args.workers, no_pos, output_syntax, cache_dir, cache_size, pruned_ssa, metrics_file, metrics_profile, metrics_trace_memory)
+        print(f"{manifest['succeeded']} of {manifest['files']} files transformed in {manifest['seconds']:.2f}s, manifest saved to {os.path.join(output_folder, manifest_file)}")
+        for entry in manifest['results']:
+            if entry['status'] != 'ok':
+                print(f"Failed: {entry['input']}: {entry['error']}")
+        sys.exit(1 if manifest['failed'] else 0)
 
     #if print_CFG_graph:
     #    from staticfg import CFGBuilder
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import functools
+import subprocess
+import contextlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scalpel
+from scalpel import ast_comments as ast
+from scalpel.core.mnode import MNode
+from scalpel.SSA import ssa_syntax, anf_syntax
+from scalpel.SSA.const import SSA
+from scalpel.SSA.context import TransformContext
+
+# Benchmark of every phase of the transformation (Python -> SSA -> ANF -> Python) per file
+# The results are written as JSON, the phase totals of two runs (e.g. of two commits) can be compared with --baseline
+# Usage: python py_pipeline_benchmark.py [-i files/directories ...] [-s scales ...] [-o results.json] [-b baseline.json]
+default_inputs = ['./github_test_samples', './test_samples']
+default_scales = [1, 2, 4]
+
+# The ANF trees of the larger synthetic inputs are deeply nested
+RECURSION_LIMIT = 10000
+
+# Phases in the order they are run, the SSA phases are also run for every function of the code
+PHASES = ['preprocess_py_code', 'gen_ast', 'gen_cfg', 'compute_SSA2', 'compute_DTree', 'PS_BS', 'parse_ssa_to_anf',
+          'print_anf_with_prov_info', 'parse_anf_from_text', 'print_anf_code_to_python']
+
+
+# Accumulates the time spent in each phase, nested calls of the same phase are only counted once
+class PhaseTimer:
+    def __init__(self):
+        self.times = {}
+        self.active = set()
+
+    def reset(self):
+        self.times = {phase: 0.0 for phase in PHASES}
+
+    def wrap(self, phase, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if phase in self.active:
+                return func(*args, **kwargs)
+            self.active.add(phase)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[phase] += time.perf_counter() - start
+                self.active.discard(phase)
+        return timed
+
+
+# Replaces the functions of the phases within the transformation by timed ones while active
+@contextlib.contextmanager
+def timed_phases(timer: PhaseTimer):
+    targets = [(ssa_syntax, 'preprocess_py_code', 'preprocess_py_code'), (MNode, 'gen_ast', 'gen_ast'),
+               (MNode, 'gen_cfg', 'gen_cfg'), (SSA, 'compute_SSA2', 'compute_SSA2'),
+               (SSA, 'compute_DTree', 'compute_DTree'), (ssa_syntax, 'PS_BS', 'PS_BS')]
+    originals = [(owner, name, getattr(owner, name)) for owner, name, _ in targets]
+    try:
+        for owner, name, phase in targets:
+            setattr(owner, name, timer.wrap(phase, getattr(owner, name)))
+        yield timer
+    finally:
+        for owner, name, func in originals:
+            setattr(owner, name, func)
+
+
+# Runs all phases on the code once, the phases after a failing one are not run
+def run_pipeline(code: str, timer: PhaseTimer):
+    timer.reset()
+    code = ast.unparse(ast.parse(code))
+    ctx = TransformContext(output_syntax=0)
+    ssa_ast = ssa_syntax.PY_to_SSA_AST(code, False, ctx)
+    anf = timer.wrap('parse_ssa_to_anf', anf_syntax.parse_ssa_to_anf)(ssa_ast, False, False, ctx)
+    anf_w_prov = timer.wrap('print_anf_with_prov_info', anf_syntax.print_anf_with_prov_info)(anf, ctx)
+    parsed = timer.wrap('parse_anf_from_text', anf_syntax.parse_anf_from_text)(anf_w_prov)
+    timer.wrap('print_anf_code_to_python', anf_syntax.print_anf_code_to_python)(parsed)
+
+
+# Benchmarks one input, the fastest of the repeated runs is kept for each phase
+def benchmark_code(name: str, code: str, timer: PhaseTimer, repeat: int = 1):
+    result = {'name': name, 'lines': code.count('\n') + 1, 'phases': None, 'total': None, 'error': None}
+    for _ in range(repeat):
+        try:
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                run_pipeline(code, timer)
+        except Exception as e:
+            result['error'] = type(e).__name__ + ': ' + str(e).split('\n')[0]
+            break
+        if result['phases'] is None:
+            result['phases'] = dict(timer.times)
+        else:
+            result['phases'] = {phase: min(t, timer.times[phase]) for phase, t in result['phases'].items()}
+    if result['phases'] is not None:
+        result['total'] = sum(result['phases'].values())
+    return result
+
+
+# Synthetic inputs, the size of each one grows linearly with the scale
+def synthetic_deep_nesting(scale: int):
+    depth = 2 * scale + 2
+    lines = ['x = 0']
+    for i in range(depth):
+        lines.append('    ' * i + f'for i{i} in range({i % 3 + 2}):')
+    lines.append('    ' * depth + f'if x < {depth}:')
+    lines.append('    ' * (depth + 1) + 'x = x + 1')
+    lines.append('print(x)')
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_straight_line(scale: int):
+    lines = ['x0 = 0']
+    for i in range(1, 100 * scale):
+        lines.append(f'x{i} = x{i - 1} + {i}' if i % 10 else f'print(x{i - 1})')
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_many_functions(scale: int):
+    lines = []
+    for i in range(20 * scale):
+        lines += [f'def f{i}(a):', f'    b = a + {i}', '    if b > 10:', '        b = b - 1', '    return b', '']
+    lines += [f'print(f{i}({i}))' for i in range(20 * scale)]
+    return '\n'.join(lines) + '\n'
+
+
+synthetic_inputs = {'deep_nesting': synthetic_deep_nesting, 'straight_line': synthetic_straight_line,
+                    'many_functions': synthetic_many_functions}
+
+
+# Python files of the given files and directories
+def collect_files(inputs: [str]):
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            files += [os.path.join(path, f) for f in sorted(os.listdir(path)) if
+                      f.endswith('.py') and not f.startswith('__init__')]
+        else:
+            files.append(path)
+    return files
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(inputs: [str], scales: [int], repeat: int = 1):
+    timer = PhaseTimer()
+    codes = []
+    for path in collect_files(inputs):
+        with open(path, 'r', encoding='utf8') as f:
+            codes.append((path, f.read()))
+    for scale in scales:
+        codes += [(f'synthetic/{name}_x{scale}', generate(scale)) for name, generate in synthetic_inputs.items()]
+
+    with timed_phases(timer):
+        results = [benchmark_code(name, code, timer, repeat) for name, code in codes]
+
+    totals = {phase: sum(r['phases'][phase] for r in results if r['phases'] is not None) for phase in PHASES}
+    return {'version': scalpel.__version__, 'commit': git_commit(), 'python': platform.python_version(),
+            'repeat': repeat, 'scales': scales, 'totals': totals, 'failed': sum(r['error'] is not None for r in results),
+            'results': results}
+
+
+def print_results(results: dict, baseline: dict = None):
+    names = [r['name'] for r in results['results']]
+    width = max([len(name) for name in names] + [4])
+    print(f"{'file':<{width}} {'lines':>6} {'total [ms]':>11}  slowest phase")
+    for r in results['results']:
+        if r['error'] is not None:
+            print(f"{r['name']:<{width}} {r['lines']:>6} {'failed':>11}  {r['error']}")
+            continue
+        slowest = max(r['phases'], key=r['phases'].get)
+        print(f"{r['name']:<{width}} {r['lines']:>6} {r['total'] * 1000:>11.2f}  {slowest}")
+
+    print()
+    print(f"{'phase':<26} {'total [s]':>10}" + (f" {'baseline [s]':>13} {'change':>8}" if baseline else ''))
+    for phase in PHASES:
+        line = f"{phase:<26} {results['totals'][phase]:>10.3f}"
+        if baseline:
+            before = baseline['totals'].get(phase)
+            if before:
+                line += f" {before:>13.3f} {(results['totals'][phase] / before - 1) * 100:>+7.1f}%"
+        print(line)
+    print(f"{len(names)} inputs, {results['failed']} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the phases of the transformation per input')
+    parser.add_argument('-i', '--inputs', nargs='+', default=default_inputs,
+                        help='Python files or directories to benchmark')
+    parser.add_argument('-s', '--scales', nargs='*', type=int, default=default_scales,
+                        help='Scales of the synthetic inputs, none to leave them out')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Runs per input, the fastest is reported')
+    parser.add_argument('-o', '--output', help='JSON file to write the results to')
+    parser.add_argument('-b', '--baseline', help='JSON results of an earlier run to compare the phase totals with')
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), RECURSION_LIMIT))
+    results = run_benchmark(args.inputs, args.scales, args.repeat)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
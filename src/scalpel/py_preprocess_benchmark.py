@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scalpel import ast_comments as ast
+from scalpel.SSA import ssa_syntax
+from scalpel.SSA.context import TransformContext
+
+# Benchmark of the preprocessing step on the github samples concatenated multiple times
+# The time per copy of the corpus should stay constant as the desugaring is done in a single pass over the AST
+# Usage: python py_preprocess_benchmark.py [copies ...]
+directory = './github_test_samples'
+scales = [int(s) for s in sys.argv[1:]] or [1, 10, 25, 50, 100]
+
+corpus = []
+for filename in sorted(os.listdir(directory)):
+    if not filename.startswith('__init__') and filename.endswith('.py'):
+        with open(os.path.join(directory, filename), "r", encoding='utf8') as file:
+            code = ast.unparse(ast.parse(file.read()))
+        # Only samples which can be preprocessed on their own are part of the corpus
+        try:
+            ssa_syntax.preprocess_py_code(code, TransformContext())
+        except SyntaxError:
+            continue
+        corpus.append(code)
+corpus = '\n'.join(corpus)
+
+print(f"{'copies':>8} {'lines':>10} {'parse [s]':>10} {'desugar [s]':>12} {'total [s]':>10} {'ms/copy':>10}")
+for scale in scales:
+    code = '\n'.join([corpus] * scale)
+    start = time.perf_counter()
+    tree = ast.parse(code)
+    parsed = time.perf_counter()
+    ast.unparse(ssa_syntax.PreprocessTransformer(code, TransformContext()).transform(tree))
+    end = time.perf_counter()
+    print(f"{scale:>8} {code.count(chr(10)) + 1:>10} {parsed - start:>10.3f} {end - parsed:>12.3f} {end - start:>10.3f} {(end - start) / scale * 1000:>10.2f}")
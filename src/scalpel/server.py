@@ -0,0 +1,141 @@
+import io
+import os
+import sys
+import json
+import threading
+import traceback
+import contextlib
+import socketserver
+
+from scalpel import api
+from scalpel.cache import DEFAULT_MEMORY_ENTRIES, MemoryCache, open_cache
+from scalpel.parse_cache import ParseCache
+from scalpel.py_anf_transformer import cached_transform_code
+
+# Long running transformation server, the imports and caches stay warm between requests
+# Requests and responses are single lines of JSON, read from stdin or from the connections of a Unix socket
+#
+# Request:  {"id": 1, "op": "transform", "code": "...", "options": {"no_pos": false, "output_syntax": 0, "pruned_ssa": false}}
+# Response: {"id": 1, "ok": true, "result": {"code": "...", "ssa": "...", "anf": "...", "anf_prov": "...", "cached": false}}
+# Error:    {"id": 1, "ok": false, "error": "SyntaxError: ..."}
+#
+# Operations:
+#   transform   Python code -> SSA and ANF (same results as transform_code)
+#   parse_back  ANF code with provenance info -> Python code
+#   round_trip  Python code -> SSA and ANF -> Python code
+#   ping        Checks if the server is alive
+#   shutdown    Stops the server after answering
+OPERATIONS = ['transform', 'parse_back', 'round_trip', 'ping', 'shutdown']
+
+
+class TransformServer:
+    def __init__(self, cache_path: str = None, max_cache_size: int = None, max_memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        backing = None
+        if cache_path is not None:
+            backing = open_cache(cache_path, max_cache_size) if max_cache_size else open_cache(cache_path)
+        self.cache = MemoryCache(max_memory_entries, backing)
+        # Code sent again with other options is not parsed again
+        self.parse_cache = ParseCache()
+        # The transformation is not thread safe (e.g. the redirected stdout), requests are handled one at a time
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    # Handles a single request line and returns the response line
+    def handle_line(self, line: str):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({'id': None, 'ok': False, 'error': 'Invalid JSON: ' + str(e)})
+        return json.dumps(self.handle(request))
+
+    def handle(self, request):
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError('Request must be a JSON object')
+            op = request.get('op')
+            if op not in OPERATIONS:
+                raise ValueError(f'Unknown operation {op!r}, expected one of {", ".join(OPERATIONS)}')
+            with self.lock:
+                # Debug output of the transformation must not end up in the responses
+                with contextlib.redirect_stdout(sys.stderr):
+                    result = getattr(self, 'op_' + op)(request)
+        except Exception as e:
+            return {'id': request_id, 'ok': False, 'error': ''.join(traceback.format_exception_only(type(e), e)).strip()}
+        return {'id': request_id, 'ok': True, 'result': result}
+
+    def op_transform(self, request: dict):
+        options = get_options(request)
+        artifacts, cached = cached_transform_code(get_text(request, 'code'), self.cache, False, options['no_pos'],
+                                                  options['output_syntax'], options['pruned_ssa'], parse_cache=self.parse_cache)
+        return dict(artifacts, cached=cached)
+
+    def op_parse_back(self, request: dict):
+        return {'code': api.from_anf(get_text(request, 'code'))}
+
+    def op_round_trip(self, request: dict):
+        result = self.op_transform(request)
+        result['python'] = api.from_anf(result['anf_prov'])
+        return result
+
+    def op_ping(self, request: dict):
+        return {'pid': os.getpid()}
+
+    def op_shutdown(self, request: dict):
+        self.stopped.set()
+        return {}
+
+
+def get_text(request: dict, name: str):
+    text = request.get(name)
+    if not isinstance(text, str):
+        raise ValueError(f'Request field {name!r} must be a string')
+    return text
+
+
+# Options of the request, the same as the ones of scalpel.api
+def get_options(request: dict):
+    return api.get_options(request.get('options'))
+
+
+# Answers the requests of the input stream line by line until it ends or a shutdown is requested
+def serve_stream(server: TransformServer, infile, outfile):
+    for line in infile:
+        if not line.strip():
+            continue
+        outfile.write(server.handle_line(line) + '\n')
+        outfile.flush()
+        if server.stopped.is_set():
+            break
+
+
+# Answers the requests of every connection to the Unix socket at the given path, one thread per connection
+def serve_unix_socket(server: TransformServer, path: str):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            infile = io.TextIOWrapper(self.rfile, encoding='utf-8')
+            outfile = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+            serve_stream(server, infile, outfile)
+            if server.stopped.is_set():
+                # shutdown() waits for serve_forever() to return, which runs in another thread
+                threading.Thread(target=socket_server.shutdown).start()
+
+    if os.path.exists(path):
+        os.remove(path)
+    socket_server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    socket_server.daemon_threads = True
+    try:
+        socket_server.serve_forever()
+    finally:
+        socket_server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Serves on stdin/stdout if the socket path is '-', otherwise on the Unix socket
+def serve(socket_path: str = '-', cache_path: str = None, max_cache_size: int = None):
+    server = TransformServer(cache_path, max_cache_size)
+    if socket_path == '-':
+        serve_stream(server, sys.stdin, sys.stdout)
+    else:
+        serve_unix_socket(server, socket_path)